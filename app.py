@@ -1,12 +1,23 @@
 from webapp import create_app
-import os
+from config import SERVIDOR_MODO, SERVIDOR_HOST, SERVIDOR_PUERTO
+import argparse
 
-app = create_app()
+#Los procesos del pool de hashing (spawn) vuelven a importar este archivo como __mp_main__: en ellos no se calienta nada
+app = create_app(calentar = __name__ != "__mp_main__")
 
 if __name__ == '__main__':
-    port = int(os.environ.get("PORT", 5000))
-    app.run(debug=True, port = port)
-    #Comentar arriba para hacer un .exe con waitress
-    #Descomentar abajo para hacer un .exe con waitress
-    #from waitress import serve
-    #serve(app, host="127.0.0.1", port=port)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Arranca la aplicación web de fichas.")
+    parser.add_argument("--modo", choices=["desarrollo", "produccion"], default=SERVIDOR_MODO,
+                        help="desarrollo: servidor de Flask con debug. produccion: waitress con la app ya caliente (ver webapp.servidor)")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--puerto", type=int, default=SERVIDOR_PUERTO)
+    args = parser.parse_args()
+    if args.modo == "produccion":
+        #Hilos, conexiones y backlog: SERVIDOR_HILOS, SERVIDOR_CONEXIONES_MAX y SERVIDOR_BACKLOG en config.py
+        from webapp.servidor import esperar_lista, servir
+        #create_app() ya está calentando: el puerto se abre cuando termina
+        if not esperar_lista(app):
+            raise SystemExit("La aplicación no pudo arrancar (ver logs/error.log).")
+        servir(app, host = args.host, puerto = args.puerto)
+    else:
+        app.run(debug=True, host = args.host, port = args.puerto)
@@ -0,0 +1,2 @@
+#Benchmarks de rendimiento sobre datos sintéticos. Se ejecutan como módulos, p.ej.:
+#   python -m benchmarks.codec --tamanos 10000 100000
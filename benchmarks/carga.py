@@ -0,0 +1,302 @@
+import argparse, http.client, json, platform, random, socket, subprocess, sys, tempfile, threading, time
+from collections import Counter
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from config import SERVIDOR_HILOS, SERVIDOR_CONEXIONES_MAX
+
+#=== Prueba de carga ===
+#Arranca create_app() con el servidor de producción (webapp.servidor: waitress si está instalado,
+#si no el de werkzeug con hilos) en 127.0.0.1, en un proceso aparte con los datos sintéticos en una
+#carpeta temporal, y lo golpea con muchos clientes concurrentes que repiten una mezcla de
+#login / listado / alta / edición / borrado. Muestra peticiones por segundo, percentiles de
+#latencia y errores. No necesita red: solo localhost.
+#Uso:
+#   python -m benchmarks.carga --clientes 32 --duracion 30 --fichas 100000
+#   python -m benchmarks.carga --mezcla listar=80,crear=10,editar=10 --salida carga.json
+#Cada cliente es un hilo con su propia cookie de sesión. Los clientes comparten el GIL de este
+#proceso (el servidor va en otro); con cientos de clientes conviene comprobar que no es el
+#cliente el que se satura (uso de CPU de este proceso cerca del 100%).
+MEZCLA = {"login": 5, "listar": 60, "crear": 15, "editar": 15, "eliminar": 5}
+TIEMPO_ARRANQUE_SEG = 600 #Con 1M de fichas preparar los datos lleva un rato
+
+#=== Servidor (proceso hijo) ===
+def servir(puerto, hilos, conexiones_max, n_fichas, n_usuarios):
+    from benchmarks.medidas import preparar_datos
+    preparar_datos(n_fichas, n_usuarios)
+    from webapp import create_app
+    from webapp.servidor import calentar, servir as servir_app
+    app = create_app(calentar = False)
+    calentar(app) #Como en producción: el puerto se abre con todo ya cargado
+    print(f"🚀 Servidor en 127.0.0.1:{puerto} ({hilos} hilos)", flush=True)
+    servir_app(app, host="127.0.0.1", puerto=puerto, hilos=hilos, conexiones_max=conexiones_max)
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _esperar_puerto(puerto, proceso, limite):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó al arrancar (código {proceso.returncode}).")
+        try:
+            with socket.create_connection(("127.0.0.1", puerto), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"El servidor no aceptó conexiones en {limite} s.")
+
+#=== Cliente ===
+class Cliente:
+    """Un navegador mínimo: conexión keep-alive, cookies y redirecciones."""
+
+    def __init__(self, puerto, timeout):
+        self.conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=timeout)
+        self.cookies = {}
+        self.peticiones = 0
+        self.ruta_final = None #Ruta de la última respuesta tras seguir las redirecciones
+
+    def _enviar(self, metodo, ruta, datos = None):
+        cuerpo = urlencode(datos).encode("utf-8") if datos is not None else None
+        cabeceras = {}
+        if cuerpo is not None:
+            cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+        if self.cookies:
+            cabeceras["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        try:
+            self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+            respuesta = self.conexion.getresponse()
+            respuesta.read()
+        except (http.client.HTTPException, OSError):
+            self.conexion.close() #La siguiente petición abre otra conexión
+            raise
+        self.peticiones += 1
+        for cabecera in respuesta.headers.get_all("Set-Cookie") or []:
+            for nombre, morsel in SimpleCookie(cabecera).items():
+                if morsel.value and morsel["max-age"] != "0":
+                    self.cookies[nombre] = morsel.value
+                else:
+                    self.cookies.pop(nombre, None)
+        return respuesta
+
+    def pedir(self, metodo, ruta, datos = None):
+        #Sigue las redirecciones como lo haría el navegador (así se consumen los flash de la sesión)
+        respuesta = self._enviar(metodo, ruta, datos)
+        while respuesta.status in (301, 302, 303) and respuesta.getheader("Location"):
+            ruta = urlsplit(respuesta.getheader("Location")).path or "/"
+            respuesta = self._enviar("GET", ruta)
+        self.ruta_final = urlsplit(ruta).path
+        return respuesta
+
+    def cerrar(self):
+        self.conexion.close()
+
+def _operaciones(cliente, usuario, password, propias, rnd):
+    """Funciones de la mezcla. Cada una devuelve la respuesta final (tras redirecciones).
+
+    'propias' son ids de fichas sintéticas reservadas a este cliente: se editan desde el
+    principio y se borran desde el final, así dos clientes nunca tocan la misma ficha.
+    """
+    def login():
+        cliente.cookies.clear()
+        return cliente.pedir("POST", "/", {"username": usuario, "password": password})
+    def listar():
+        return cliente.pedir("GET", f"/fichas?page={rnd.randint(1, 20)}")
+    def crear():
+        return cliente.pedir("POST", "/fichas/nueva", {"nombre": f"Carga {rnd.randrange(10**6)}", "edad": rnd.randint(18, 90), "ciudad": "Madrid"})
+    def editar():
+        if not propias:
+            return listar()
+        id = propias[rnd.randrange(max(1, len(propias) // 2))]
+        return cliente.pedir("POST", f"/fichas/editar/{id}", {"nombre": f"Editada {rnd.randrange(10**6)}", "edad": rnd.randint(18, 90), "ciudad": "Sevilla"})
+    def eliminar():
+        if not propias:
+            return listar()
+        return cliente.pedir("POST", f"/fichas/eliminar/{propias.pop()}")
+    return {"login": login, "listar": listar, "crear": crear, "editar": editar, "eliminar": eliminar}
+
+def _clasificar(respuesta, ruta_final, operacion):
+    #None si fue bien; si no, el tipo de error que se cuenta
+    if respuesta.status == 429:
+        return "429 limitado"
+    if respuesta.status == 503:
+        return "503 ocupado"
+    if respuesta.status >= 400:
+        return f"HTTP {respuesta.status}"
+    if ruta_final == "/":
+        #Un login correcto acaba en el dashboard; cualquier otra operación en / es que se perdió la sesión
+        return "login rechazado" if operacion == "login" else "sesión perdida"
+    return None
+
+def _hilo_cliente(indice, puerto, args, mezcla, propias, barrera, fin, resultado):
+    from benchmarks.datos import PASSWORD_USUARIOS
+    rnd = random.Random(args.semilla + indice)
+    cliente = Cliente(puerto, args.timeout)
+    usuario = f"usuario{indice % args.usuarios:07d}"
+    operaciones = _operaciones(cliente, usuario, PASSWORD_USUARIOS, propias, rnd)
+    nombres, pesos = zip(*mezcla.items())
+    latencias = {nombre: [] for nombre in nombres}
+    errores = Counter()
+    try:
+        operaciones["login"]() #Fuera de la medida: cada cliente empieza con sesión
+    except (http.client.HTTPException, OSError) as e:
+        errores[("login", type(e).__name__)] += 1
+    barrera.wait()
+    peticiones_inicio = cliente.peticiones
+    while time.monotonic() < fin[0]:
+        nombre = rnd.choices(nombres, pesos)[0]
+        inicio = time.perf_counter()
+        try:
+            respuesta = operaciones[nombre]()
+            error = _clasificar(respuesta, cliente.ruta_final, nombre)
+        except (http.client.HTTPException, OSError) as e:
+            error = type(e).__name__
+        latencias[nombre].append(time.perf_counter() - inicio)
+        if error:
+            errores[(nombre, error)] += 1
+            if error == "sesión perdida":
+                try:
+                    operaciones["login"]()
+                except (http.client.HTTPException, OSError):
+                    pass
+        if args.pausa_ms:
+            time.sleep(args.pausa_ms / 1000)
+    cliente.cerrar()
+    resultado[indice] = (latencias, errores, cliente.peticiones - peticiones_inicio)
+
+#=== Informe ===
+def _percentiles(tiempos):
+    if not tiempos:
+        return None
+    tiempos = sorted(tiempos)
+    def p(q):
+        return tiempos[min(len(tiempos) - 1, int(len(tiempos) * q))] * 1000
+    return {"n": len(tiempos), "p50_ms": p(0.50), "p90_ms": p(0.90), "p99_ms": p(0.99), "max_ms": tiempos[-1] * 1000}
+
+def _parsear_mezcla(texto):
+    mezcla = {}
+    for parte in texto.split(","):
+        nombre, _, peso = parte.partition("=")
+        nombre = nombre.strip()
+        if nombre not in MEZCLA:
+            raise argparse.ArgumentTypeError(f"Operación desconocida '{nombre}' (válidas: {', '.join(MEZCLA)})")
+        try:
+            mezcla[nombre] = float(peso)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Peso no válido para '{nombre}': '{peso}'")
+    if not any(peso > 0 for peso in mezcla.values()):
+        raise argparse.ArgumentTypeError("La mezcla necesita al menos una operación con peso > 0")
+    return {nombre: peso for nombre, peso in mezcla.items() if peso > 0}
+
+def ejecutar(args):
+    from benchmarks.datos import generar_fichas
+    from benchmarks.suite import _entorno
+    mezcla = args.mezcla
+    puerto = args.puerto or _puerto_libre()
+    #Mismos datos que generará el servidor (misma semilla): así cada cliente sabe qué ids puede tocar
+    ids = [f["id"] for f in generar_fichas(args.fichas)]
+    with tempfile.TemporaryDirectory(prefix="carga_") as carpeta:
+        print(f"⏳ Preparando {args.fichas} fichas y {args.usuarios} usuarios y arrancando el servidor...")
+        servidor = subprocess.Popen([sys.executable, "-m", "benchmarks.carga", "--servir", "--puerto", str(puerto), "--hilos", str(args.hilos), "--clientes", str(args.clientes),
+                                     "--fichas", str(args.fichas), "--usuarios", str(args.usuarios)], env=_entorno(carpeta))
+        try:
+            _esperar_puerto(puerto, servidor, TIEMPO_ARRANQUE_SEG)
+            fin = [float("inf")]
+            def _empezar():
+                fin[0] = time.monotonic() + args.duracion
+            #Se empieza a medir cuando todos los clientes han hecho login (o lo han intentado)
+            barrera = threading.Barrier(args.clientes + 1, action=_empezar)
+            resultado = {}
+            hilos = [threading.Thread(target=_hilo_cliente, args=(i, puerto, args, mezcla, ids[i::args.clientes], barrera, fin, resultado), daemon=True)
+                     for i in range(args.clientes)]
+            for hilo in hilos:
+                hilo.start()
+            barrera.wait()
+            print(f"🔥 {args.clientes} clientes durante {args.duracion} s (mezcla {mezcla})...")
+            inicio = fin[0] - args.duracion
+            for hilo in hilos:
+                hilo.join()
+            duracion = time.monotonic() - inicio
+        finally:
+            servidor.terminate()
+            try:
+                servidor.wait(10)
+            except subprocess.TimeoutExpired:
+                servidor.kill()
+    return _resumir(args, mezcla, resultado, duracion)
+
+def _resumir(args, mezcla, resultado, duracion):
+    latencias = {nombre: [] for nombre in mezcla}
+    errores = Counter()
+    peticiones = 0
+    for lat, err, n in resultado.values():
+        for nombre, tiempos in lat.items():
+            latencias[nombre].extend(tiempos)
+        errores.update(err)
+        peticiones += n
+    todas = [t for tiempos in latencias.values() for t in tiempos]
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {"clientes": args.clientes, "duracion_s": args.duracion, "hilos_servidor": args.hilos, "fichas": args.fichas,
+                       "usuarios": args.usuarios, "pausa_ms": args.pausa_ms, "mezcla": mezcla},
+        "duracion_s": duracion,
+        "operaciones": len(todas),
+        "operaciones_por_seg": len(todas) / duracion if duracion else 0,
+        "peticiones_http": peticiones,
+        "peticiones_por_seg": peticiones / duracion if duracion else 0,
+        "latencia": _percentiles(todas),
+        "latencia_por_operacion": {nombre: _percentiles(tiempos) for nombre, tiempos in latencias.items()},
+        "errores": sum(errores.values()),
+        "errores_por_tipo": {f"{nombre}: {tipo}": n for (nombre, tipo), n in sorted(errores.items())},
+    }
+
+def _mostrar(r):
+    print(f"\n=== {r['parametros']['clientes']} clientes, {r['duracion_s']:.1f} s ===")
+    print(f"Peticiones HTTP: {r['peticiones_http']} ({r['peticiones_por_seg']:.1f}/s) · Operaciones: {r['operaciones']} ({r['operaciones_por_seg']:.1f}/s)")
+    print(f"{'Operación':<12} {'n':>8} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} {'máx (ms)':>10}")
+    filas = list(r["latencia_por_operacion"].items()) + [("total", r["latencia"])]
+    for nombre, p in filas:
+        if p:
+            print(f"{nombre:<12} {p['n']:>8} {p['p50_ms']:>10.2f} {p['p90_ms']:>10.2f} {p['p99_ms']:>10.2f} {p['max_ms']:>10.2f}")
+    if r["errores"]:
+        print(f"\n❌ {r['errores']} errores:")
+        for tipo, n in r["errores_por_tipo"].items():
+            print(f"  {tipo}: {n}")
+    else:
+        print("\n✅ Sin errores.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la aplicación con un servidor WSGI con hilos en localhost.")
+    parser.add_argument("--clientes", type=int, default=16, help="Clientes concurrentes (un hilo y una sesión cada uno)")
+    parser.add_argument("--duracion", type=float, default=20, help="Segundos de carga medida")
+    parser.add_argument("--mezcla", type=_parsear_mezcla, default=MEZCLA,
+                        help="Pesos de cada operación, p.ej. login=5,listar=60,crear=15,editar=15,eliminar=5")
+    parser.add_argument("--fichas", type=int, default=10_000, help="Fichas sintéticas de partida")
+    parser.add_argument("--usuarios", type=int, default=100, help="Usuarios sintéticos (los clientes se reparten entre ellos)")
+    parser.add_argument("--hilos", type=int, default=SERVIDOR_HILOS, help="Hilos del servidor (con waitress)")
+    parser.add_argument("--pausa-ms", type=float, default=0, help="Pausa de cada cliente entre operaciones (0 = a máxima velocidad)")
+    parser.add_argument("--timeout", type=float, default=30, help="Timeout de cada petición en segundos")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--puerto", type=int, help="Puerto local (por defecto uno libre)")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--servir", action="store_true", help=argparse.SUPPRESS) #Uso interno: proceso del servidor
+    args = parser.parse_args()
+
+    if args.servir:
+        servir(args.puerto, args.hilos, max(SERVIDOR_CONEXIONES_MAX, args.clientes), args.fichas, args.usuarios)
+        return
+    if args.clientes < 1 or args.usuarios < 1:
+        parser.error("--clientes y --usuarios deben ser al menos 1")
+    resultados = ejecutar(args)
+    _mostrar(resultados)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en {args.salida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import argparse, json, time
+from benchmarks.datos import generar_fichas
+from gestion_fichas import codec
+
+#=== Comparativa de codecs ===
+#Tamaño en disco y tiempo de (de)serialización de las fichas con cada formato disponible.
+#Uso: python -m benchmarks.codec --tamanos 10000 100000 1000000
+
+def _json_indentado(obj):
+    #Lo que hacía guardar_fichas() antes de la capa de codecs
+    return json.dumps(obj, ensure_ascii=False, indent=4).encode("utf-8")
+
+def _json_compacto_stdlib(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _formatos():
+    formatos = {
+        "json indent=4 (antiguo)": (_json_indentado, lambda b: json.loads(b.decode("utf-8"))),
+        "json compacto (stdlib)": (_json_compacto_stdlib, lambda b: json.loads(b.decode("utf-8"))),
+    }
+    if codec.orjson is not None:
+        formatos["json compacto (orjson)"] = (codec.orjson.dumps, codec.orjson.loads)
+    if codec.msgpack is not None:
+        formatos["msgpack"] = (lambda o: codec.msgpack.packb(o, use_bin_type=True), lambda b: codec.msgpack.unpackb(b, raw=False))
+    return formatos
+
+def _cronometrar(funcion, arg, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(arg)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor
+
+def medir(n, repeticiones = 3):
+    fichas = generar_fichas(n)
+    filas = []
+    for nombre, (volcar, leer) in _formatos().items():
+        datos, t_volcar = _cronometrar(volcar, fichas, repeticiones)
+        leidas, t_leer = _cronometrar(leer, datos, repeticiones)
+        assert leidas == fichas, f"{nombre} no devuelve los mismos datos"
+        filas.append((nombre, len(datos), t_volcar, t_leer))
+    return filas
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara tamaño y velocidad de los codecs de datos.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000], help="Número de fichas sintéticas (p.ej. 10000 100000 1000000)")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se queda con el mejor tiempo de N repeticiones")
+    args = parser.parse_args()
+    for n in args.tamanos:
+        print(f"\n=== {n} fichas ===")
+        print(f"{'Formato':<26} {'Tamaño (MB)':>12} {'Volcar (ms)':>12} {'Leer (ms)':>12}")
+        for nombre, tam, t_volcar, t_leer in medir(n, args.repeticiones):
+            print(f"{nombre:<26} {tam / 1_048_576:>12.2f} {t_volcar * 1000:>12.1f} {t_leer * 1000:>12.1f}")
+
+if __name__ == "__main__":
+    main()
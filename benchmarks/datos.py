@@ -0,0 +1,47 @@
+import random, uuid
+from datetime import datetime, timedelta
+
+#=== Datos sintéticos deterministas ===
+#Con la misma semilla y el mismo tamaño se generan siempre las mismas fichas,
+#así los resultados de distintas ejecuciones son comparables.
+NOMBRES = ["Ana", "Álvaro", "Beatriz", "Carlos", "Dolores", "Elena", "Fernando", "Gonzalo", "Helena", "Iñigo",
+           "Julia", "Lucía", "Manuel", "Nuria", "Óscar", "Pilar", "Raúl", "Sofía", "Tomás", "Zoe"]
+APELLIDOS = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández",
+             "Díaz", "Moreno", "Muñoz", "Álvarez", "Romero", "Alonso", "Gutiérrez", "Navarro", "Torres", "Domínguez"]
+CIUDADES = ["Madrid", "Barcelona", "Valencia", "Sevilla", "Zaragoza", "Málaga", "Murcia", "Palma", "Bilbao", "Alicante",
+            "Córdoba", "Valladolid", "Vigo", "Gijón", "A Coruña", "Granada", "Ávila", "Cádiz", "León", "Logroño"]
+FECHA_BASE = datetime(2024, 1, 1)
+
+def generar_fichas(n, semilla = 42):
+    rnd = random.Random(semilla)
+    fichas = []
+    for i in range(n):
+        creada = FECHA_BASE + timedelta(seconds=rnd.randrange(0, 365 * 24 * 3600))
+        modificada = creada + timedelta(days=rnd.randrange(1, 30)) if rnd.random() < 0.3 else None
+        fichas.append({
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "nombre": f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+            "edad": rnd.randint(1, 99),
+            "ciudad": rnd.choice(CIUDADES),
+            "fecha_creacion": creada.isoformat(),
+            "fecha_modificacion": modificada.isoformat() if modificada else None,
+        })
+    return fichas
+
+#Todos los usuarios sintéticos comparten contraseña, salt y hash (calcular un PBKDF2 por usuario
+#con un millón de usuarios llevaría horas); solo hace falta que se puedan cargar, buscar e iniciar sesión.
+PASSWORD_USUARIOS = "benchmark123"
+
+def generar_usuarios(n, credenciales, semilla = 42):
+    #'credenciales' son los campos de contraseña de PASSWORD_USUARIOS (ver usuarios._credenciales)
+    rnd = random.Random(semilla)
+    usuarios = []
+    for i in range(n):
+        usuarios.append({
+            "id": str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+            "username": f"usuario{i:07d}",
+            **credenciales,
+            "role": "admin" if i == 0 else "editor",
+            "created_at": (FECHA_BASE + timedelta(seconds=rnd.randrange(0, 365 * 24 * 3600))).isoformat(),
+        })
+    return usuarios
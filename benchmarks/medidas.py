@@ -0,0 +1,164 @@
+import contextlib, io, os, statistics, time
+
+#=== Medidas de una escala ===
+#Se ejecuta en un proceso aparte lanzado por benchmarks.suite, con GESTION_FICHAS_DATA_DIR apuntando
+#a una carpeta temporal: por eso los módulos de la aplicación se importan dentro de medir_escala().
+
+def _resumen(tiempos):
+    tiempos = sorted(tiempos)
+    return {
+        "min_ms": tiempos[0] * 1000,
+        "mediana_ms": statistics.median(tiempos) * 1000,
+        "p95_ms": tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))] * 1000,
+        "repeticiones": len(tiempos),
+    }
+
+def _cronometrar(funcion, repeticiones, preparar = None):
+    #preparar() se ejecuta antes de cada repetición y no cuenta en el tiempo
+    tiempos = []
+    for _ in range(repeticiones):
+        if preparar is not None:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return _resumen(tiempos)
+
+@contextlib.contextmanager
+def _sin_salida():
+    #guardar_fichas() y compañía imprimen por pantalla; no se quiere medir la consola
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+def medir_almacen(n, repeticiones):
+    from gestion_fichas.fichas import cargar_fichas, guardar_fichas, buscar_fichas_en_almacen
+    from gestion_fichas.usuarios import cargar_usuarios, _hash_password, _generar_salt, _DIRECTORIO
+    from gestion_fichas.almacen import obtener_almacen
+    almacen = obtener_almacen()
+    fichas = cargar_fichas()
+    resultados = {}
+    with _sin_salida():
+        resultados["cargar_fichas_frio"] = _cronometrar(cargar_fichas, repeticiones, almacen.invalidar)
+        resultados["cargar_fichas"] = _cronometrar(cargar_fichas, repeticiones)
+        resultados["guardar_fichas"] = _cronometrar(lambda: guardar_fichas(fichas), repeticiones)
+        resultados["buscar_fichas_en_almacen_frio"] = _cronometrar(lambda: buscar_fichas_en_almacen("ana"), repeticiones,
+                                                                   lambda: almacen.busqueda.reconstruir(None))
+        resultados["buscar_fichas_en_almacen"] = _cronometrar(lambda: buscar_fichas_en_almacen("ana"), repeticiones)
+        resultados["cargar_usuarios_frio"] = _cronometrar(cargar_usuarios, repeticiones, _DIRECTORIO.invalidar)
+        resultados["cargar_usuarios"] = _cronometrar(cargar_usuarios, repeticiones)
+    salt = _generar_salt()
+    resultados["_hash_password"] = _cronometrar(lambda: _hash_password("benchmark123", salt), min(repeticiones, 5))
+    return resultados
+
+#=== Rutas ===
+def _escenarios(app, cliente, fichas, usuarios):
+    """(nombre, endpoint, función que hace la petición) para cada caso medido.
+
+    La función devuelve la respuesta; se comprueba que no sea un error.
+    """
+    ficha = fichas[len(fichas) // 2]
+    usuario = usuarios[1] if len(usuarios) > 1 else usuarios[0]
+    nuevas = []
+    def nueva():
+        respuesta = cliente.post("/fichas/nueva", data={"nombre": "Benchmark Nueva", "edad": "30", "ciudad": "Madrid"})
+        return respuesta
+    def eliminar():
+        from gestion_fichas.almacen import obtener_almacen
+        if not nuevas:
+            nuevas.extend(f["id"] for f in obtener_almacen().buscar("Benchmark Nueva"))
+        return cliente.post(f"/fichas/eliminar/{nuevas.pop()}") if nuevas else cliente.get("/fichas")
+    csv_importacion = "nombre,edad,ciudad\n" + "".join(f"Importada {i},{20 + i % 50},Madrid\n" for i in range(100)) + "123,0,\n"
+    def importar():
+        return cliente.post("/fichas/importar", data={"archivo": (io.BytesIO(csv_importacion.encode("utf-8")), "bench.csv")},
+                            content_type="multipart/form-data")
+    etags = []
+    def fichas_304():
+        #Visita repetida: el navegador manda el ETag de la anterior y no hay cambios
+        if not etags:
+            etags.append(cliente.get("/fichas").headers["ETag"])
+        return cliente.get("/fichas", headers={"If-None-Match": etags[0]})
+    informes = []
+    def informe():
+        if not informes:
+            from config import LOG_DIR
+            carpeta = os.path.join(LOG_DIR, "importaciones")
+            informes.extend(sorted(os.listdir(carpeta)))
+        return cliente.get(f"/fichas/importar/informe/{informes[-1]}")
+    return [
+        ("login_get", "login", lambda: cliente.get("/")),
+        ("dashboard", "dashboard", lambda: cliente.get("/dashboard")),
+        ("estadisticas_json", "estadisticas_fichas", lambda: cliente.get("/dashboard/estadisticas.json")),
+        ("area_personal", "area_personal", lambda: cliente.get("/area_personal")),
+        ("usuarios", "gestion_usuarios", lambda: cliente.get("/usuarios")),
+        ("usuarios_nuevo_get", "nuevo_usuario", lambda: cliente.get("/usuarios/nuevo")),
+        ("usuarios_editar_get", "editar_usuario", lambda: cliente.get(f"/usuarios/editar/{usuario['id']}")),
+        ("usuarios_eliminar_get", "eliminar_usuario", lambda: cliente.get(f"/usuarios/eliminar/{usuario['id']}")),
+        ("cambiar_password_get", "cambiar_password", lambda: cliente.get("/usuario/cambiar_password")),
+        ("metrics", "metrics", lambda: cliente.get("/metrics")),
+        ("salud", "salud", lambda: cliente.get("/salud")),
+        ("fichas", "gestion_fichas", lambda: cliente.get("/fichas")),
+        ("fichas_orden_nombre_desc", "gestion_fichas", lambda: cliente.get("/fichas?sort=nombre&dir=desc")),
+        ("fichas_pagina_100", "gestion_fichas", lambda: cliente.get("/fichas?sort=edad&page=100")),
+        ("fichas_304", "gestion_fichas", fichas_304),
+        ("buscar", "buscar_fichas", lambda: cliente.get("/fichas/buscar?q=ana")),
+        ("export_csv", "exportar_fichas_csv", lambda: cliente.get("/fichas/export.csv")),
+        ("export_ndjson", "exportar_fichas_ndjson", lambda: cliente.get("/fichas/export.ndjson?ciudad=madrid")),
+        ("importar_get", "importar_fichas_web", lambda: cliente.get("/fichas/importar")),
+        ("importar_post_100", "importar_fichas_web", importar),
+        ("informe_importacion", "informe_importacion", informe),
+        ("nueva_get", "nueva_ficha", lambda: cliente.get("/fichas/nueva")),
+        ("nueva_post", "nueva_ficha", nueva),
+        ("editar_get", "editar_ficha", lambda: cliente.get(f"/fichas/editar/{ficha['id']}")),
+        ("editar_post", "editar_ficha", lambda: cliente.post(f"/fichas/editar/{ficha['id']}", data={"nombre": ficha["nombre"], "edad": "40", "ciudad": ficha["ciudad"]})),
+        ("eliminar_post", "eliminar_ficha", eliminar),
+    ]
+
+def medir_rutas(repeticiones):
+    from webapp import create_app
+    from webapp.routes import main_routes
+    from gestion_fichas.almacen import obtener_almacen
+    from gestion_fichas.usuarios import cargar_usuarios
+    from benchmarks.datos import PASSWORD_USUARIOS
+    from webapp.servidor import calentar
+    app = create_app(calentar = False)
+    calentar(app)
+    cliente = app.test_client()
+    usuarios = cargar_usuarios()
+    admin = usuarios[0]["username"]
+    def login():
+        respuesta = cliente.post("/", data={"username": admin, "password": PASSWORD_USUARIOS})
+        assert respuesta.status_code == 302, f"No se pudo iniciar sesión ({respuesta.status_code})"
+        return respuesta
+    resultados = {"login_post": _cronometrar(login, min(repeticiones, 3))}
+    fichas = obtener_almacen().fichas()
+    medidos = {"login", "logout"}
+    for nombre, endpoint, peticion in _escenarios(app, cliente, fichas, usuarios):
+        def una():
+            respuesta = peticion()
+            respuesta.get_data() #Incluye generar el cuerpo (las exportaciones van en streaming)
+            assert respuesta.status_code < 400, f"{nombre}: HTTP {respuesta.status_code}"
+        una() #Calentamiento (índices perezosos, plantillas compiladas)
+        resultados[f"ruta_{nombre}"] = _cronometrar(una, repeticiones)
+        medidos.add(endpoint)
+    #logout cierra la sesión: cada repetición vuelve a entrar (sin contar ese tiempo)
+    resultados["ruta_logout"] = _cronometrar(lambda: cliente.get("/logout"), min(repeticiones, 3), login)
+    sin_medir = sorted(e.split(".", 1)[1] for e in app.view_functions if e.startswith(main_routes.name + ".") and e.split(".", 1)[1] not in medidos)
+    return resultados, sin_medir
+
+def preparar_datos(n_fichas, n_usuarios):
+    #Escribe los datos sintéticos en DATA_DIR (la carpeta temporal del proceso)
+    from benchmarks.datos import generar_fichas, generar_usuarios, PASSWORD_USUARIOS
+    from gestion_fichas.almacen import obtener_almacen
+    from gestion_fichas.usuarios import guardar_usuarios, _credenciales
+    with _sin_salida():
+        obtener_almacen().guardar(generar_fichas(n_fichas))
+        guardar_usuarios(generar_usuarios(n_usuarios, _credenciales(PASSWORD_USUARIOS)))
+
+def medir_escala(n, repeticiones):
+    inicio = time.perf_counter()
+    preparar_datos(n, n)
+    preparacion = time.perf_counter() - inicio
+    resultados = medir_almacen(n, repeticiones)
+    rutas, sin_medir = medir_rutas(repeticiones)
+    resultados.update(rutas)
+    return {"preparacion_s": preparacion, "medidas": resultados, "rutas_sin_medir": sin_medir}
@@ -0,0 +1,125 @@
+import argparse, json, os, platform, subprocess, sys, tempfile
+from datetime import datetime
+
+#=== Suite de benchmarks ===
+#Mide almacenamiento, búsqueda, hashing y cada ruta de main_routes sobre datos sintéticos
+#(benchmarks.datos) a varias escalas y guarda los tiempos en un JSON. Con --comparar se
+#contrasta con un JSON anterior y se sale con código 1 si algo empeora más de la tolerancia.
+#Uso:
+#   python -m benchmarks.suite --tamanos 1000 10000 --salida bench.json
+#   python -m benchmarks.suite --tamanos 1000 10000 --comparar base.json
+#   python -m benchmarks.suite --resultados nuevo.json --comparar base.json   (sin volver a medir)
+#Cada escala se mide en un proceso aparte con DATA_DIR/LOG_DIR en una carpeta temporal:
+#no se tocan los datos reales y una escala no calienta las cachés de la siguiente.
+TAMANOS = [1_000, 10_000, 100_000, 1_000_000]
+TOLERANCIA = 0.2
+UMBRAL_MS = 0.5 #Diferencias menores se consideran ruido aunque superen la tolerancia relativa
+
+def _entorno(carpeta):
+    entorno = dict(os.environ)
+    entorno["GESTION_FICHAS_DATA_DIR"] = os.path.join(carpeta, "data")
+    entorno["GESTION_FICHAS_LOG_DIR"] = os.path.join(carpeta, "logs")
+    #Todas las peticiones entran con el mismo usuario: el limitador de login no debe frenarlas
+    for clave in ("LOGIN_RAFAGA_USUARIO", "LOGIN_POR_MINUTO_USUARIO", "LOGIN_RAFAGA_IP", "LOGIN_POR_MINUTO_IP"):
+        entorno[clave] = "1000000"
+    entorno["PERFILADO"] = "0"
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    entorno["PYTHONPATH"] = os.pathsep.join(filter(None, [raiz, entorno.get("PYTHONPATH")]))
+    return entorno
+
+def medir_en_subproceso(n, repeticiones):
+    with tempfile.TemporaryDirectory(prefix=f"bench_{n}_") as carpeta:
+        salida = os.path.join(carpeta, "escala.json")
+        subprocess.run([sys.executable, "-m", "benchmarks.suite", "--escala", str(n), "--repeticiones", str(repeticiones), "--salida", salida],
+                       env=_entorno(carpeta), check=True)
+        with open(salida, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def ejecutar(tamanos, repeticiones):
+    resultados = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticiones": repeticiones,
+        "escalas": {},
+    }
+    for n in tamanos:
+        print(f"⏱️  Midiendo con {n} fichas y {n} usuarios...")
+        resultados["escalas"][str(n)] = escala = medir_en_subproceso(n, repeticiones)
+        _mostrar(n, escala)
+    return resultados
+
+def _mostrar(n, escala):
+    print(f"\n=== {n} fichas / usuarios (preparación {escala['preparacion_s']:.1f} s) ===")
+    print(f"{'Medida':<36} {'Mín (ms)':>10} {'Mediana (ms)':>13} {'p95 (ms)':>10}")
+    for nombre, m in escala["medidas"].items():
+        print(f"{nombre:<36} {m['min_ms']:>10.2f} {m['mediana_ms']:>13.2f} {m['p95_ms']:>10.2f}")
+    if escala["rutas_sin_medir"]:
+        print(f"⚠️  Rutas sin medir: {', '.join(escala['rutas_sin_medir'])}")
+
+#=== Comparación con una línea base ===
+def comparar(base, nuevo, tolerancia = TOLERANCIA, umbral_ms = UMBRAL_MS):
+    """Devuelve (regresiones, mejoras) como listas de (escala, medida, base_ms, nuevo_ms).
+
+    Se compara la mediana y solo las medidas presentes en ambos resultados.
+    """
+    regresiones, mejoras = [], []
+    for escala, datos in nuevo["escalas"].items():
+        anteriores = base["escalas"].get(escala, {}).get("medidas", {})
+        for nombre, m in datos["medidas"].items():
+            if nombre not in anteriores:
+                continue
+            antes, ahora = anteriores[nombre]["mediana_ms"], m["mediana_ms"]
+            if abs(ahora - antes) < umbral_ms:
+                continue
+            if ahora > antes * (1 + tolerancia):
+                regresiones.append((escala, nombre, antes, ahora))
+            elif ahora < antes * (1 - tolerancia):
+                mejoras.append((escala, nombre, antes, ahora))
+    return regresiones, mejoras
+
+def _mostrar_comparacion(regresiones, mejoras, tolerancia):
+    for titulo, filas in (("❌ Regresiones", regresiones), ("✅ Mejoras", mejoras)):
+        if not filas:
+            continue
+        print(f"\n{titulo} (tolerancia {tolerancia:.0%}):")
+        for escala, nombre, antes, ahora in filas:
+            print(f"  [{escala}] {nombre:<36} {antes:>10.2f} ms -> {ahora:>10.2f} ms ({ahora / antes - 1:+.0%})")
+    if not regresiones:
+        print("\n✅ Sin regresiones respecto a la línea base.")
+
+def _leer_json(ruta):
+    with open(ruta, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de almacenamiento, búsqueda y rutas sobre datos sintéticos.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="Escalas a medir (fichas y usuarios)")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Repeticiones por medida (se guarda mín, mediana y p95)")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar los resultados")
+    parser.add_argument("--comparar", metavar="BASE", help="JSON de una ejecución anterior con el que comparar")
+    parser.add_argument("--resultados", metavar="NUEVO", help="Comparar este JSON en lugar de medir de nuevo")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Empeoramiento relativo admitido (0.2 = 20%%)")
+    parser.add_argument("--escala", type=int, help=argparse.SUPPRESS) #Uso interno: medir una escala en este proceso
+    args = parser.parse_args()
+
+    if args.escala is not None:
+        from benchmarks.medidas import medir_escala
+        resultado = medir_escala(args.escala, args.repeticiones)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        return
+
+    resultados = _leer_json(args.resultados) if args.resultados else ejecutar(args.tamanos, args.repeticiones)
+    if args.salida and not args.resultados:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Resultados guardados en {args.salida}")
+    if args.comparar:
+        regresiones, mejoras = comparar(_leer_json(args.comparar), resultados, args.tolerancia)
+        _mostrar_comparacion(regresiones, mejoras, args.tolerancia)
+        if regresiones:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
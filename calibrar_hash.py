@@ -0,0 +1,23 @@
+import argparse, json
+from gestion_fichas.hashing import calibrar_iteraciones
+from config import HASH_NAME, HASH_ITERATIONS, HASH_PARAMS_FILE
+
+#Elige las iteraciones de PBKDF2 para que un login tarde lo que se quiera en ESTA máquina, p.ej.:
+#   python calibrar_hash.py --objetivo-ms 250
+#   python calibrar_hash.py --objetivo-ms 250 --guardar   (lo deja en data/hash_params.json)
+#Los usuarios existentes pasan a los nuevos parámetros la próxima vez que inicien sesión.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibra el coste del hash de contraseñas.")
+    parser.add_argument("--objetivo-ms", type=float, default=250, help="Tiempo objetivo por hash en milisegundos (por defecto 250)")
+    parser.add_argument("--guardar", action="store_true", help=f"Guarda el resultado en {HASH_PARAMS_FILE}")
+    args = parser.parse_args()
+    print(f"🔧 Midiendo PBKDF2-{HASH_NAME} en esta máquina...")
+    iteraciones, estimado_ms = calibrar_iteraciones(args.objetivo_ms, HASH_NAME)
+    print(f"✅ {iteraciones} iteraciones ≈ {estimado_ms:.0f} ms por hash (ahora se usan {HASH_ITERATIONS}).")
+    if args.guardar:
+        with open(HASH_PARAMS_FILE, "w", encoding="utf-8") as f:
+            json.dump({"hash_name": HASH_NAME, "iterations": iteraciones}, f, indent=4)
+        print(f"💾 Guardado en {HASH_PARAMS_FILE}. Se aplica al reiniciar la aplicación (HASH_NAME y HASH_ITERATIONS tienen prioridad).")
+    else:
+        print(f"Para usarlo: HASH_ITERATIONS={iteraciones} o vuelve a ejecutar con --guardar.")
+    print("🔚 Calibración completada.")
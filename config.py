@@ -1,29 +1,144 @@
-import os
+import os, json
 
 #=== Ruta base del proyecto ===
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 #=== Rutas de carpeta de datos
-DATA_DIR = os.path.join(BASE_DIR, "data")
-LOG_DIR = os.path.join(BASE_DIR, "logs")
+#Se pueden cambiar por entorno (p.ej. los benchmarks trabajan en una carpeta temporal)
+DATA_DIR = os.environ.get("GESTION_FICHAS_DATA_DIR", os.path.join(BASE_DIR, "data"))
+LOG_DIR = os.environ.get("GESTION_FICHAS_LOG_DIR", os.path.join(BASE_DIR, "logs"))
 GESTION_DIR = os.path.join(BASE_DIR, "gestion_fichas")
 
 #=== Rutas de archivos JSON
 USUARIOS_FILE = os.path.join(DATA_DIR, "usuarios.json")
 FICHAS_FILE = os.path.join(DATA_DIR, "fichas.json")
 SESSION_FILE = os.path.join(DATA_DIR, "session.json")
+SQLITE_FILE = os.path.join(DATA_DIR, "gestion_fichas.db")
 
 #=== Rutas de archivos de logs
 APP_LOG_FILE = os.path.join(LOG_DIR, "app.log")
 ERROR_LOG_FILE = os.path.join(LOG_DIR, "error.log")
 USER_LOG_FILE = os.path.join(LOG_DIR, "user.log")
 
+#Rotación de los logs: "tamano" (al llegar a LOG_MAX_BYTES) o "diaria" (a medianoche); se guardan LOG_BACKUPS antiguos
+LOG_ROTACION = os.environ.get("LOG_ROTACION", "tamano")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUPS = 5
+
 #=== COnfiguraciones generales ===
 DEFAULT_ROLE = "editor"
 ADMIN_ROLE = "admin"
 
+#Cada cuánto se comprueba (con un stat) si usuarios.json ha cambiado fuera de este proceso
+USUARIOS_REVALIDAR_SEG = float(os.environ.get("USUARIOS_REVALIDAR_SEG", 1))
+
+#=== Configuraciones de almacenamiento ===
+#"json" (fichas.json + usuarios.json) o "sqlite" (SQLITE_FILE). Ver migrar_sqlite.py para pasar de uno a otro.
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+#Tamaño del journal de fichas a partir del cual se compacta en un nuevo fichas.json
+FICHAS_JOURNAL_MAX_BYTES = 4 * 1024 * 1024
+#Commit agrupado: el hilo escritor espera hasta ESCRITURA_VENTANA_MS (o ESCRITURA_MAX_OPS cambios) por lote
+ESCRITURA_VENTANA_MS = float(os.environ.get("ESCRITURA_VENTANA_MS", 2))
+ESCRITURA_MAX_OPS = int(os.environ.get("ESCRITURA_MAX_OPS", 256))
+
+#Agregados del panel (fichas por ciudad, edades, altas por día): se guardan junto a los datos
+#como mucho cada ESTADISTICAS_PERSISTIR_SEG tras un cambio (0 = no se guardan, se recalculan al arrancar)
+ESTADISTICAS_PERSISTIR_SEG = float(os.environ.get("ESTADISTICAS_PERSISTIR_SEG", 5))
+ESTADISTICAS_CIUDADES = 10 #Ciudades con más fichas que se muestran
+ESTADISTICAS_DIAS = 30 #Últimos días con altas que se muestran
+
+#Formato de fichas.json / usuarios.json al guardar: "json" (compacto; con orjson si está instalado)
+#o "msgpack" (si está instalado). Al leer se detecta solo, así que se puede cambiar sin migrar.
+CODEC_DATOS = os.environ.get("CODEC_DATOS", "json")
+
+#=== Configuraciones del listado de fichas ===
+FICHAS_POR_PAGINA = 50
+FICHAS_POR_PAGINA_MAX = 500
+#Memoria para las tablas de /fichas ya renderizadas (ver webapp.fragmentos). 0 = sin caché
+FRAGMENTOS_MAX_BYTES = int(os.environ.get("FRAGMENTOS_MAX_BYTES", 32 * 1024 * 1024))
+
+#=== Configuraciones de importación ===
+IMPORTACION_TAMANO_LOTE = 5000 #Filas válidas que se guardan de una vez
+IMPORTACION_MAX_ERRORES_WEB = 100 #Filas rechazadas que se muestran en la página (el informe completo se descarga)
+
+#=== Configuraciones de contraseñas ===
+#Procesos que calculan PBKDF2 (0 = en el hilo de la petición) y hashes que pueden esperar turno;
+#por encima de eso se responde "ocupado" en lugar de encolar.
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+HASH_COLA_MAX = int(os.environ.get("HASH_COLA_MAX", 32))
+#Parámetros de PBKDF2 para contraseñas nuevas. Cada usuario guarda los suyos y se rehace el hash
+#al iniciar sesión si no coinciden con estos. Algoritmo e iteraciones salen de las variables de entorno,
+#de lo que dejó calibrar_hash.py --guardar o, si no hay nada, sha256 con 200.000.
+HASH_PARAMS_FILE = os.path.join(DATA_DIR, "hash_params.json")
+
+def _parametros_calibrados():
+    #(hash_name, iterations) guardados por calibrar_hash.py, o None
+    try:
+        with open(HASH_PARAMS_FILE, "r", encoding="utf-8") as f:
+            datos = json.load(f)
+        return str(datos.get("hash_name", "sha256")), int(datos["iterations"])
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+
+_CALIBRADOS = _parametros_calibrados()
+HASH_NAME = os.environ.get("HASH_NAME") or (_CALIBRADOS[0] if _CALIBRADOS else "sha256")
+#Las iteraciones calibradas solo valen con el algoritmo con el que se midieron
+HASH_ITERATIONS = (int(os.environ.get("HASH_ITERATIONS", 0))
+                   or (_CALIBRADOS[1] if _CALIBRADOS and _CALIBRADOS[0] == HASH_NAME else 0)
+                   or 200_000)
+
+#=== Límite de intentos de login ===
+#Token bucket: ráfaga permitida y recarga por minuto, por nombre de usuario y por IP
+LOGIN_RAFAGA_USUARIO = int(os.environ.get("LOGIN_RAFAGA_USUARIO", 5))
+LOGIN_POR_MINUTO_USUARIO = float(os.environ.get("LOGIN_POR_MINUTO_USUARIO", 5))
+LOGIN_RAFAGA_IP = int(os.environ.get("LOGIN_RAFAGA_IP", 20))
+LOGIN_POR_MINUTO_IP = float(os.environ.get("LOGIN_POR_MINUTO_IP", 30))
+#Tras LOGIN_FALLOS_SIN_ESPERA fallos seguidos hay que esperar 1, 2, 4... segundos (hasta el máximo)
+LOGIN_FALLOS_SIN_ESPERA = 3
+LOGIN_ESPERA_BASE_SEG = 1
+LOGIN_ESPERA_MAX_SEG = 300
+#Los fallos seguidos se olvidan tras este tiempo sin fallar (o con un login correcto); hasta entonces la
+#espera sigue creciendo aunque el cubo se haya rellenado
+LOGIN_FALLOS_OLVIDO_SEG = 3600
+#Limpieza de claves inactivas y tope de claves por tipo
+LOGIN_PURGA_SEG = 60
+LOGIN_MAX_CLAVES = 100_000
+
+#=== Perfilado ===
+#Con PERFILADO=1 se perfila con cProfile esa fracción de las peticiones a las vistas indicadas en
+#PERFILADO_VISTAS (nombres de vista de main_routes separados por comas; vacío = todas las de main_routes),
+#y un admin puede pedirlo también con ?perfilar=1. Con PERFILADO=0 no se perfila nada, ni con ?perfilar=1.
+PERFILADO = os.environ.get("PERFILADO", "0") == "1"
+PERFILADO_FRACCION = float(os.environ.get("PERFILADO_FRACCION", 0.01))
+PERFILADO_VISTAS = [v.strip() for v in os.environ.get("PERFILADO_VISTAS", "").split(",") if v.strip()]
+PERFILADO_DIR = os.path.join(LOG_DIR, "perfiles")
+PERFILADO_MAX_PERFILES = 20 #Se borran los más antiguos
+
+#=== Métricas ===
+#/metrics solo responde a administradores con sesión iniciada o, para Prometheus u otro recolector,
+#a peticiones con "Authorization: Bearer <METRICAS_TOKEN>". Sin token configurado, solo administradores.
+METRICAS_TOKEN = os.environ.get("METRICAS_TOKEN", "")
+
+#=== Servidor ===
+#app.py arranca en modo "desarrollo" (servidor de Flask con debug) o "produccion" (waitress, o el
+#servidor con hilos de werkzeug si no está instalado), sin tener que editar app.py.
+SERVIDOR_MODO = os.environ.get("SERVIDOR_MODO", "desarrollo")
+SERVIDOR_HOST = os.environ.get("SERVIDOR_HOST", "127.0.0.1")
+SERVIDOR_PUERTO = int(os.environ.get("PORT", 5000))
+SERVIDOR_HILOS = int(os.environ.get("SERVIDOR_HILOS", 8)) #Peticiones atendidas a la vez
+SERVIDOR_CONEXIONES_MAX = int(os.environ.get("SERVIDOR_CONEXIONES_MAX", 100)) #Conexiones abiertas (waitress)
+SERVIDOR_BACKLOG = int(os.environ.get("SERVIDOR_BACKLOG", 1024)) #Conexiones esperando accept() en el socket
+
 #=== Configuraciones de sesión ===
 SESSION_TIMEOUT_MINUTES = 30
+TOKEN_EXPIRATION_HOURS = 12 #duración de la sesión (ajustable)
+#Cada cuánto se vuelca a SESSION_FILE el registro de sesiones abiertas si ha cambiado (0 = no se guarda)
+SESSION_PERSISTIR_SEG = float(os.environ.get("SESSION_PERSISTIR_SEG", 5))
+#Tokens de sesión: "memoria" (de cada proceso) o "sqlite" (compartidos entre procesos del servidor)
+SESIONES_BACKEND = os.environ.get("SESIONES_BACKEND", "memoria")
+SESIONES_SQLITE_FILE = os.path.join(DATA_DIR, "sesiones.db")
+SESIONES_MAX = int(os.environ.get("SESIONES_MAX", 100_000)) #Al llegar al tope se expulsa la que antes caduca (también en el registro de SESSION_FILE)
+SESIONES_BARRIDO_SEG = 60 #Con SQLite, cada cuánto se borran las caducadas
 
 #Asegurarse que la carpeta de datos existe
 os.makedirs(DATA_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,18 @@
+import argparse
+from gestion_fichas.fichas import exportar_fichas
+from gestion_fichas.exportacion import FORMATOS_EXPORTACION
+
+#Exporta las fichas sin preguntas, p.ej.:
+#   python exportar_fichas.py fichas.csv
+#   python exportar_fichas.py - --formato ndjson --ciudad Madrid --edad-min 18 > adultos_madrid.ndjson
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta las fichas a CSV o NDJSON.")
+    parser.add_argument("destino", help="Archivo de salida, o - para la salida estándar")
+    parser.add_argument("--formato", choices=sorted(FORMATOS_EXPORTACION), default="csv")
+    parser.add_argument("--ciudad", help="Solo fichas de esta ciudad (sin distinguir tildes ni mayúsculas)")
+    parser.add_argument("--edad-min", type=int)
+    parser.add_argument("--edad-max", type=int)
+    args = parser.parse_args()
+    total = exportar_fichas(args.destino, args.formato, args.ciudad, args.edad_min, args.edad_max)
+    if args.destino != "-":
+        print(f"✅ {total} fichas exportadas a {args.destino}.")
@@ -0,0 +1,523 @@
+import heapq, json, os, threading, time, uuid
+from gestion_fichas.codec import DatosCorruptos, leer_archivo, volcar, linea_json, leer_linea
+from gestion_fichas.indices import CLAVES_ORDEN, OrdenFichas, IndiceBusqueda, decodificar_cursor
+from gestion_fichas.escritor import EscritorAgrupado
+from gestion_fichas.estadisticas import EstadisticasFichas, PersistenciaEstadisticas
+from gestion_fichas.metricas import cronometro
+from gestion_fichas.logger_config import app_logger, error_logger
+from config import FICHAS_FILE, FICHAS_JOURNAL_MAX_BYTES, SQLITE_FILE, STORAGE_BACKEND, ESTADISTICAS_PERSISTIR_SEG
+
+#Con coincidencias en al menos 1/BUSQUEDA_FRACCION_RECORRER de las fichas, una página de búsqueda
+#se saca recorriendo el índice por nombre en lugar de seleccionar entre las coincidencias
+BUSQUEDA_FRACCION_RECORRER = 8
+
+#=== Utilidades ===
+def _firma_archivo(ruta):
+    #Devuelve (mtime_ns, tamaño, inodo) del archivo o None si no existe.
+    #Si cualquiera de los tres cambia, el contenido en caché ya no es válido.
+    try:
+        st = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _escribir_temporal(ruta, fichas, sufijo = ".tmp"):
+    #Escribe el contenido completo en un archivo temporal junto al destino y lo lleva a disco.
+    tmp = f"{ruta}{sufijo}"
+    with open(tmp, "wb") as f:
+        f.write(volcar(fichas))
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp
+
+def _escribir_atomico(ruta, fichas):
+    #Temporal + fsync + rename: o queda el archivo viejo o el nuevo, nunca uno a medias.
+    os.replace(_escribir_temporal(ruta, fichas), ruta)
+
+def asignar_ids(fichas):
+    #Da un id a las fichas que no lo tienen y devuelve cuántas se han corregido.
+    #Quien la llama tiene que guardarlas antes de usarlas: un id que solo existe en memoria
+    #cambiaría en la siguiente carga y las líneas del journal que lo usan ya no encontrarían su ficha.
+    corregidas = 0
+    for ficha in fichas:
+        if not ficha.get("id"):
+            ficha["id"] = str(uuid.uuid4())
+            corregidas += 1
+    return corregidas
+
+#=== Base común: fichas en memoria indexadas por id ===
+class _AlmacenBase:
+    """Parte común de los almacenes: caché en memoria id -> ficha y operaciones por registro.
+
+    Las subclases solo deciden cómo se persiste: _vigente(), _leer_todo(),
+    _escribir_lote(registros), _guardar_todo(fichas) y, opcionalmente, _tras_cambio().
+    Los índices de self._indices se mantienen al día en cada cambio (ver gestion_fichas.indices).
+
+    Los cambios se aplican en memoria con el lock tomado y se encolan en un
+    EscritorAgrupado; la petición espera fuera del lock a que su lote esté en
+    disco, así varias peticiones simultáneas comparten una sola escritura.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.RLock()
+        self._por_id = None #id -> ficha (None = todavía sin cargar). Mantiene el orden de inserción.
+        self._lista = None #Vista en lista de _por_id, se reconstruye tras cada cambio
+        self.ordenes = {campo: OrdenFichas(campo) for campo in CLAVES_ORDEN}
+        self.busqueda = IndiceBusqueda(("nombre", "ciudad"))
+        self.estadisticas = EstadisticasFichas()
+        self._indices = list(self.ordenes.values()) + [self.busqueda, self.estadisticas]
+        self._persistencia = PersistenciaEstadisticas(f"{ruta}.estadisticas", self._instantanea_estadisticas, ESTADISTICAS_PERSISTIR_SEG)
+        self._escritor = EscritorAgrupado(self._escribir_lote, nombre = f"escritor-{os.path.basename(ruta)}")
+        #Versión de los datos: sube con cada cambio y cada relectura. La época distingue este proceso
+        #de otros (y de reinicios), así "época-versión" no se repite para contenidos distintos.
+        self._epoca = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._modificado = time.time()
+
+    #--- Carga ---
+    def _indexar(self, fichas):
+        #Todas las fichas llegan ya con id (ver asignar_ids): el journal y las rutas las identifican por él
+        return {ficha["id"]: ficha for ficha in fichas}
+
+    def _recargar(self):
+        with cronometro("leer_fichas_disco"):
+            self._por_id = self._leer_todo()
+        self._lista = None
+        self._nueva_version()
+        for indice in self._indices:
+            indice.reconstruir(self._por_id.values())
+        #Los agregados guardados valen si describen exactamente estos archivos; si no, se recalculan al pedirlos.
+        #Después de reconstruir: reconstruir() los deja sin construir y se perdería lo restaurado.
+        guardadas = self._persistencia.leer(self._firma_disco())
+        if guardadas:
+            self.estadisticas.restaurar(guardadas)
+
+    def _asegurar_cargado(self):
+        #Mientras haya cambios propios en vuelo los archivos cambian por nuestra culpa: no se relee
+        if self._por_id is None or (not self._escritor.ocupado() and not self._vigente()):
+            self._recargar()
+
+    def _nueva_version(self):
+        self._version += 1
+        self._modificado = time.time()
+
+    def _cambio_aplicado(self):
+        #Tras aplicar en memoria un alta/edición/baja/guardado completo
+        self._nueva_version()
+        self._persistencia.marcar_cambio()
+
+    def _firma_disco(self):
+        #Identifica el contenido en disco (ver PersistenciaEstadisticas). Cada backend da la suya.
+        return [_firma_archivo(self.ruta)]
+
+    def _instantanea_estadisticas(self):
+        #(firma, agregados) si la memoria coincide con lo escrito; None si hay que reintentar; False si no hay nada que guardar
+        with self._lock:
+            if self._por_id is None or not self.estadisticas.construida():
+                return False
+            if self._escritor.ocupado() or not self._vigente():
+                return None
+            return self._firma_disco(), self.estadisticas.exportar()
+
+    #--- Lectura ---
+    def version(self):
+        #(etiqueta, instante del último cambio) de los datos actuales, para ETag / Last-Modified.
+        #Solo comprueba que la caché sigue al día (un stat): no recorre ni copia las fichas.
+        with self._lock:
+            self._asegurar_cargado()
+            return f"{self._epoca}-{self._version}", self._modificado
+
+    def fichas(self):
+        #Devuelve la lista en caché. Es de SOLO LECTURA: para modificar usar crear/actualizar/eliminar.
+        with self._lock:
+            self._asegurar_cargado()
+            if self._lista is None:
+                self._lista = list(self._por_id.values())
+            return self._lista
+
+    def calentar(self):
+        #Carga las fichas y construye ya los índices que si no se crean en la primera consulta. Devuelve cuántas hay.
+        with self._lock:
+            self._asegurar_cargado()
+            for indice in self.ordenes.values():
+                indice.paginar(self._por_id, 1)
+            self.busqueda.buscar(self._por_id, "")
+            return len(self._por_id)
+
+    def cargar(self):
+        #Devuelve una copia editable de las fichas (la caché no se ve afectada).
+        return [dict(f) for f in self.fichas()]
+
+    def obtener(self, id):
+        #Copia editable de la ficha con ese id, o None si no existe (acceso directo por el dict, sin recorrer la lista).
+        with self._lock:
+            self._asegurar_cargado()
+            ficha = self._por_id.get(id)
+            return dict(ficha) if ficha else None
+
+    def _primeras_por_nombre(self, ids, cuantas):
+        #Las 'cuantas' primeras coincidencias por nombre sin ordenar todas: si son muchas se recorre
+        #el índice por nombre (ya ordenado) hasta tenerlas; si son pocas, heapq.nsmallest sobre ellas.
+        orden = self.ordenes["nombre"]
+        if cuantas is None:
+            return sorted((self._por_id[id] for id in ids), key=orden.clave)
+        if len(ids) * BUSQUEDA_FRACCION_RECORRER >= len(self._por_id):
+            return orden.primeras(self._por_id, ids, cuantas)
+        return heapq.nsmallest(cuantas, (self._por_id[id] for id in ids), key=orden.clave)
+
+    def buscar(self, termino, campos = None, limite = None):
+        #Fichas cuyo nombre/ciudad contiene 'termino' (sin tildes ni mayúsculas), ordenadas por nombre.
+        with self._lock:
+            self._asegurar_cargado()
+            ids = self.busqueda.buscar(self._por_id, termino, campos)
+            return self._primeras_por_nombre(ids, limite or None)
+
+    def buscar_pagina(self, termino, por_pagina = 50, pagina = 1, campos = None):
+        #Una página de resultados de buscar(), con el total. Solo se ordenan las fichas hasta esa página.
+        with self._lock:
+            self._asegurar_cargado()
+            ids = self.busqueda.buscar(self._por_id, termino, campos)
+            total = len(ids)
+            paginas = max(1, -(-total // por_pagina))
+            pagina = min(max(1, pagina), paginas)
+            fichas = self._primeras_por_nombre(ids, pagina * por_pagina)[(pagina - 1) * por_pagina:]
+            return {"fichas": fichas, "total": total, "pagina": pagina, "paginas": paginas}
+
+    def pagina(self, orden = "fecha_creacion", por_pagina = 50, pagina = 1, despues = None, antes = None, descendente = False):
+        #Una página de fichas ordenadas por 'orden'. despues/antes son cursores devueltos por una página anterior.
+        with self._lock:
+            self._asegurar_cargado()
+            indice = self.ordenes[orden]
+            try:
+                return indice.paginar(self._por_id, por_pagina, pagina,
+                                      decodificar_cursor(despues) if despues else None,
+                                      decodificar_cursor(antes) if antes else None,
+                                      descendente)
+            except TypeError:
+                #Cursor de otro orden (p.ej. texto al ordenar por edad): se vuelve a la primera página
+                return indice.paginar(self._por_id, por_pagina, 1, descendente = descendente)
+
+    #--- Escritura por registro ---
+    def _tras_cambio(self):
+        pass
+
+    def _esperar(self, pendiente):
+        #Si el lote no llegó a disco, la memoria ya no refleja lo guardado: se relee en el siguiente acceso
+        try:
+            self._escritor.esperar(pendiente)
+        except Exception:
+            self.invalidar()
+            raise
+
+    def resumen_estadisticas(self, ciudades = 10, dias = 30):
+        #Agregados para el panel (ver gestion_fichas.estadisticas): no recorre las fichas salvo la primera vez
+        with self._lock:
+            self._asegurar_cargado()
+            return self.estadisticas.resumen(self._por_id, ciudades, dias)
+
+    def estadisticas_escritura(self):
+        #Tamaño de lote y latencia de las escrituras agrupadas
+        return self._escritor.estadisticas()
+
+    def crear(self, ficha):
+        with self._lock:
+            self._asegurar_cargado()
+            if ficha["id"] in self._por_id:
+                raise ValueError(f"Ya existe una ficha con id {ficha['id']}.")
+            ficha = dict(ficha)
+            pendiente = self._escritor.enviar({"op": "crear", "id": ficha["id"], "ficha": ficha})
+            self._por_id[ficha["id"]] = ficha
+            self._lista = None
+            for indice in self._indices:
+                indice.insertar(ficha)
+            self._cambio_aplicado()
+            self._tras_cambio()
+        self._esperar(pendiente)
+        return ficha
+
+    def crear_lote(self, fichas):
+        #Alta de muchas fichas con un único registro (una línea de journal / una transacción).
+        #Los índices reciben solo las fichas nuevas (insertar_lote), como en un alta normal.
+        if not fichas:
+            return []
+        with self._lock:
+            self._asegurar_cargado()
+            fichas = list({f["id"]: dict(f) for f in fichas}.values()) #Con un id repetido vale la última, como al reproducir el journal
+            pendiente = self._escritor.enviar({"op": "crear_lote", "fichas": fichas})
+            sustituidas = [self._por_id[f["id"]] for f in fichas if f["id"] in self._por_id]
+            for ficha in fichas:
+                self._por_id[ficha["id"]] = ficha
+            self._lista = None
+            for indice in self._indices:
+                for anterior in sustituidas:
+                    indice.eliminar(anterior)
+                indice.insertar_lote(fichas)
+            self._cambio_aplicado()
+            self._tras_cambio()
+        self._esperar(pendiente)
+        return fichas
+
+    def actualizar(self, ficha):
+        #Sustituye la ficha con el mismo id. Devuelve False si no existe.
+        with self._lock:
+            self._asegurar_cargado()
+            if ficha.get("id") not in self._por_id:
+                return False
+            ficha = dict(ficha)
+            pendiente = self._escritor.enviar({"op": "actualizar", "id": ficha["id"], "ficha": ficha})
+            anterior = self._por_id[ficha["id"]]
+            self._por_id[ficha["id"]] = ficha
+            self._lista = None
+            for indice in self._indices:
+                indice.actualizar(anterior, ficha)
+            self._cambio_aplicado()
+            self._tras_cambio()
+        self._esperar(pendiente)
+        return True
+
+    def eliminar(self, id):
+        #Elimina la ficha con ese id. Devuelve la ficha eliminada o None si no existía.
+        with self._lock:
+            self._asegurar_cargado()
+            if id not in self._por_id:
+                return None
+            pendiente = self._escritor.enviar({"op": "eliminar", "id": id})
+            ficha = self._por_id.pop(id)
+            self._lista = None
+            for indice in self._indices:
+                indice.eliminar(ficha)
+            self._cambio_aplicado()
+            self._tras_cambio()
+        self._esperar(pendiente)
+        return ficha
+
+    #--- Escritura completa ---
+    def guardar(self, fichas):
+        #Sustituye todo el contenido del almacén.
+        with self._lock:
+            #Lo que quede en cola es anterior a este contenido y no debe escribirse después
+            self._escritor.vaciar()
+            fichas = [dict(f) for f in fichas]
+            asignar_ids(fichas)
+            self._guardar_todo(fichas)
+            self._por_id = self._indexar(fichas)
+            self._lista = None
+            for indice in self._indices:
+                indice.reconstruir(self._por_id.values())
+            self._cambio_aplicado()
+
+    def invalidar(self):
+        #Fuerza una relectura en el siguiente acceso.
+        with self._lock:
+            self._por_id = None
+            self._lista = None
+
+#=== Almacén JSON: snapshot + journal ===
+class AlmacenFichas(_AlmacenBase):
+    """Fichas en memoria respaldadas por un snapshot JSON más un journal de cambios (solo se añade al final).
+
+    Cada alta/edición/baja escribe una línea en el journal en lugar de reescribir
+    todo fichas.json. Al cargar se aplica el journal sobre el snapshot y, cuando
+    el journal supera FICHAS_JOURNAL_MAX_BYTES, se compacta en segundo plano.
+    """
+
+    def __init__(self, ruta = FICHAS_FILE, journal_max_bytes = FICHAS_JOURNAL_MAX_BYTES):
+        super().__init__(ruta)
+        self.ruta_journal = f"{ruta}.journal"
+        self.ruta_journal_old = f"{ruta}.journal.old" #Journal rotado mientras se compacta
+        self.journal_max_bytes = journal_max_bytes
+        self._firma = None #Firmas de snapshot y journals cuando se cargaron
+        self._journal = None #Descriptor abierto en modo append
+        self._journal_lock = threading.Lock() #Protege el descriptor entre el hilo escritor y la compactación
+        self._compactando = False
+        self._generacion = 0 #Sube con cada guardar() completo; invalida compactaciones en curso
+
+    #--- Carga ---
+    def _firmas(self):
+        return (_firma_archivo(self.ruta), _firma_archivo(self.ruta_journal_old), _firma_archivo(self.ruta_journal))
+
+    def _vigente(self):
+        #Si cambia cualquiera de los tres archivos (p.ej. otro proceso), hay que releer
+        return self._firma == self._firmas()
+
+    def _firma_disco(self):
+        return self._firmas()
+
+    def _leer_snapshot(self):
+        #Mismos criterios que el antiguo cargar_fichas(): archivo dañado o inexistente -> lista vacía.
+        if not os.path.exists(self.ruta):
+            app_logger.info("Archivo fichas.json no encontrado.")
+            print(f"No se encontró {self.ruta}. Se creará uno nuevo al cargar.")
+            return []
+        try:
+            #El formato (JSON u otro codec) se detecta por la cabecera del archivo
+            return leer_archivo(self.ruta)
+        except DatosCorruptos:
+            error_logger.error(f"El archivo {self.ruta} estaba dañado o vacío.")
+            print(f"El archivo {self.ruta} está dañado o vacío. Se creará uno nuevo.")
+        except Exception as e:
+            error_logger.exception(f"Error al leer el archivo {self.ruta}: {e}")
+            print(f"Error leyendo {self.ruta}: {e}")
+        return []
+
+    def _aplicar(self, por_id, registro):
+        #Las operaciones guardan la ficha completa, así que reaplicarlas es idempotente.
+        op = registro.get("op")
+        if op in ("crear", "actualizar"):
+            por_id[registro["id"]] = registro["ficha"]
+        elif op == "crear_lote":
+            for ficha in registro["fichas"]:
+                por_id[ficha["id"]] = ficha
+        elif op == "eliminar":
+            por_id.pop(registro["id"], None)
+
+    def _reproducir_journal(self, ruta, por_id):
+        if not os.path.exists(ruta):
+            return 0
+        aplicados = 0
+        with open(ruta, "r", encoding="utf-8") as f:
+            for num, linea in enumerate(f, start=1):
+                if not linea.strip():
+                    continue
+                try:
+                    registro = leer_linea(linea)
+                except json.JSONDecodeError:
+                    #Una línea cortada por un corte de luz solo pierde esa operación
+                    error_logger.error(f"Línea {num} de {ruta} dañada, se ignora.")
+                    continue
+                self._aplicar(por_id, registro)
+                aplicados += 1
+        return aplicados
+
+    def _reparar_ids(self, snapshot):
+        #Fichas sin id (p.ej. de versiones antiguas o editadas a mano): se les da uno y se reescribe
+        #el snapshot antes de nada, así el id es el mismo en todas las cargas y el journal lo puede usar
+        corregidas = asignar_ids(snapshot)
+        if corregidas:
+            _escribir_atomico(self.ruta, snapshot)
+            self._firma = self._firmas()
+            app_logger.warning(f"{corregidas} fichas sin id en {self.ruta}: se les ha asignado uno y se ha reescrito el archivo.")
+
+    def _leer_todo(self):
+        self._firma = self._firmas()
+        snapshot = self._leer_snapshot()
+        self._reparar_ids(snapshot)
+        por_id = self._indexar(snapshot)
+        aplicados = self._reproducir_journal(self.ruta_journal_old, por_id)
+        aplicados += self._reproducir_journal(self.ruta_journal, por_id)
+        app_logger.info(f"{len(por_id)} fichas cargadas correctamente desde {self.ruta} ({aplicados} cambios del journal).")
+        return por_id
+
+    def leer_sin_modificar(self):
+        """Fichas del snapshot con sus journals aplicados, sin escribir nada ni cargar la caché (para migrar a otro backend).
+
+        A diferencia de cargar(), las fichas sin id reciben uno solo en la copia devuelta (no se
+        reescribe el snapshot) y un snapshot dañado lanza DatosCorruptos en lugar de tomarse como vacío.
+        """
+        snapshot = leer_archivo(self.ruta) if os.path.exists(self.ruta) else []
+        asignar_ids(snapshot)
+        por_id = self._indexar(snapshot)
+        self._reproducir_journal(self.ruta_journal_old, por_id)
+        self._reproducir_journal(self.ruta_journal, por_id)
+        return list(por_id.values())
+
+    #--- Escritura por registro (coste constante) ---
+    def _escribir_lote(self, registros):
+        #Hilo escritor: todas las líneas del lote en un solo write y un solo fsync.
+        lineas = "".join(linea_json(r) + "\n" for r in registros)
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = open(self.ruta_journal, "a", encoding="utf-8")
+            self._journal.write(lineas)
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+            self._firma = self._firmas()
+
+    def _tras_cambio(self):
+        #Se llama después de aplicar el cambio en memoria, para que el snapshot lo incluya.
+        if self._firma[2] is not None and self._firma[2][1] >= self.journal_max_bytes:
+            self._compactar_en_segundo_plano()
+
+    def _guardar_todo(self, fichas):
+        #Nuevo snapshot atómico y journal vacío.
+        _escribir_atomico(self.ruta, fichas)
+        self._generacion += 1
+        with self._journal_lock:
+            self._cerrar_journal()
+            for ruta in (self.ruta_journal_old, self.ruta_journal):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            self._firma = self._firmas()
+
+    def _cerrar_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    #--- Compactación ---
+    def _compactar_en_segundo_plano(self):
+        #Se llama con el lock tomado. Rota el journal y escribe el snapshot en otro hilo.
+        if self._compactando:
+            return
+        self._compactando = True
+        with self._journal_lock:
+            self._cerrar_journal()
+            if os.path.exists(self.ruta_journal_old):
+                #Quedó un journal rotado de una compactación anterior que no terminó: se le añade el actual
+                with open(self.ruta_journal, "r", encoding="utf-8") as origen, open(self.ruta_journal_old, "a", encoding="utf-8") as destino:
+                    destino.write(origen.read())
+                    destino.flush()
+                    os.fsync(destino.fileno())
+                os.remove(self.ruta_journal)
+            else:
+                os.replace(self.ruta_journal, self.ruta_journal_old)
+            self._firma = self._firmas()
+        #Las fichas se sustituyen, nunca se modifican en sitio, así que basta con copiar la lista.
+        #Los cambios aún en cola ya están en memoria: quedan en el snapshot y también en el journal nuevo.
+        estado = list(self._por_id.values())
+        args = (estado, self._generacion)
+        threading.Thread(target=self._compactar, args=args, name="compactar-fichas", daemon=True).start()
+
+    def _compactar(self, estado, generacion):
+        try:
+            #La escritura (lo costoso) se hace sin el lock; solo el rename final lo necesita
+            tmp = _escribir_temporal(self.ruta, estado, ".compactando")
+            with self._lock:
+                if generacion != self._generacion:
+                    #Alguien guardó el conjunto completo mientras tanto: este snapshot ya no vale
+                    os.remove(tmp)
+                    return
+                os.replace(tmp, self.ruta)
+                #El snapshot ya contiene todo lo del journal rotado
+                if os.path.exists(self.ruta_journal_old):
+                    os.remove(self.ruta_journal_old)
+                self._firma = self._firmas()
+            app_logger.info(f"Journal de {self.ruta} compactado ({len(estado)} fichas).")
+        except Exception as e:
+            #El journal rotado se conserva y se volverá a aplicar en la siguiente carga
+            error_logger.exception(f"Error compactando {self.ruta}: {e}")
+        finally:
+            with self._lock:
+                self._compactando = False
+
+#=== Registro de almacenes (uno por archivo) ===
+_ALMACENES = {}
+_ALMACENES_LOCK = threading.Lock()
+
+def obtener_almacen(ruta = None):
+    #Sin ruta se usa el backend configurado en config.STORAGE_BACKEND.
+    #Las rutas .db se abren con SQLite; el resto como JSON + journal.
+    if ruta is None:
+        ruta = SQLITE_FILE if STORAGE_BACKEND == "sqlite" else FICHAS_FILE
+    ruta = os.path.abspath(ruta)
+    with _ALMACENES_LOCK:
+        almacen = _ALMACENES.get(ruta)
+        if almacen is None:
+            if ruta.endswith(".db"):
+                from gestion_fichas.almacen_sqlite import AlmacenFichasSQLite
+                almacen = AlmacenFichasSQLite(ruta)
+            else:
+                almacen = AlmacenFichas(ruta)
+            _ALMACENES[ruta] = almacen
+        return almacen
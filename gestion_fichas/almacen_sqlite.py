@@ -0,0 +1,175 @@
+import os, sqlite3, threading
+from gestion_fichas.codec import linea_json, leer_linea
+from gestion_fichas.almacen import _AlmacenBase, _firma_archivo
+from gestion_fichas.logger_config import app_logger, error_logger
+from config import SQLITE_FILE
+
+#=== Esquema ===
+#Las columnas indexadas se extraen de cada registro; el registro completo va en 'datos'
+#para no perder campos que no tengan columna propia.
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS fichas (
+    orden INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    nombre TEXT COLLATE NOCASE,
+    edad INTEGER,
+    ciudad TEXT COLLATE NOCASE,
+    fecha_creacion TEXT,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fichas_nombre ON fichas(nombre);
+CREATE INDEX IF NOT EXISTS idx_fichas_ciudad ON fichas(ciudad);
+CREATE INDEX IF NOT EXISTS idx_fichas_edad ON fichas(edad);
+
+--Contador de cambios de fichas: PRAGMA data_version cambia con cualquier escritura en el archivo
+--(también las de usuarios), así que la caché de fichas se valida con este contador
+CREATE TABLE IF NOT EXISTS meta (
+    clave TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (clave, valor) VALUES ('version_fichas', 0);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    orden INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    datos TEXT NOT NULL
+);
+"""
+
+def conectar(ruta = SQLITE_FILE):
+    #Abre la base de datos en modo WAL (lectores y escritor no se bloquean entre sí).
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    conexion.executescript(ESQUEMA)
+    return conexion
+
+def _serializar(registro):
+    return linea_json(registro)
+
+def _fila_ficha(ficha):
+    return (ficha["id"], ficha.get("nombre"), ficha.get("edad"), ficha.get("ciudad"), ficha.get("fecha_creacion"), _serializar(ficha))
+
+#=== Almacén de fichas sobre SQLite ===
+INSERTAR_FICHA = "INSERT INTO fichas (id, nombre, edad, ciudad, fecha_creacion, datos) VALUES (?, ?, ?, ?, ?, ?)"
+
+class AlmacenFichasSQLite(_AlmacenBase):
+    """Misma interfaz que AlmacenFichas, pero cada cambio es una fila en una base SQLite.
+
+    La caché en memoria se da por buena mientras PRAGMA data_version no cambie (ninguna otra
+    conexión ha escrito) o, si cambia, mientras el contador version_fichas de la tabla meta sea
+    el mismo: así las escrituras de usuarios en el mismo archivo no obligan a releer las fichas.
+    """
+
+    def __init__(self, ruta = SQLITE_FILE):
+        super().__init__(ruta)
+        self._conexion = conectar(ruta)
+        self._conexion_lock = threading.Lock() #La conexión la comparten las peticiones y el hilo escritor
+        self._data_version = None
+        self._version_fichas = None #Contador de meta que refleja la caché (None = hay que releer)
+
+    def _leer_version(self):
+        #Con _conexion_lock tomado
+        return self._conexion.execute("SELECT valor FROM meta WHERE clave = 'version_fichas'").fetchone()[0]
+
+    def _vigente(self):
+        with self._conexion_lock:
+            data_version = self._conexion.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return True
+            #Otra conexión ha escrito: si no ha tocado las fichas, la caché sigue valiendo
+            if self._version_fichas is None or self._leer_version() != self._version_fichas:
+                return False
+            self._data_version = data_version
+            return True
+
+    def _firma_disco(self):
+        #El contador se guarda en la propia base, así que vale entre arranques; el inodo cubre que se sustituya el archivo
+        firma = _firma_archivo(self.ruta)
+        return [firma[2] if firma else None, self._version_fichas]
+
+    def _leer_todo(self):
+        with self._conexion_lock, self._conexion:
+            #Contador y filas en la misma transacción de lectura: corresponden al mismo estado
+            self._conexion.execute("BEGIN")
+            self._data_version = self._conexion.execute("PRAGMA data_version").fetchone()[0]
+            self._version_fichas = self._leer_version()
+            filas = self._conexion.execute("SELECT datos FROM fichas ORDER BY orden").fetchall()
+        por_id = self._indexar([leer_linea(datos) for (datos,) in filas])
+        app_logger.info(f"{len(por_id)} fichas cargadas correctamente desde {self.ruta}.")
+        return por_id
+
+    def _aplicar(self, registro):
+        op = registro["op"]
+        if op == "crear":
+            self._conexion.execute(INSERTAR_FICHA, _fila_ficha(registro["ficha"]))
+        elif op == "actualizar":
+            fila = _fila_ficha(registro["ficha"])
+            self._conexion.execute("UPDATE fichas SET nombre = ?, edad = ?, ciudad = ?, fecha_creacion = ?, datos = ? WHERE id = ?", fila[1:] + fila[:1])
+        elif op == "crear_lote":
+            self._conexion.executemany(INSERTAR_FICHA, [_fila_ficha(f) for f in registro["fichas"]])
+        elif op == "eliminar":
+            self._conexion.execute("DELETE FROM fichas WHERE id = ?", (registro["id"],))
+
+    def _subir_version(self):
+        #Con la transacción abierta. Devuelve (contador anterior, nuevo)
+        anterior = self._leer_version()
+        self._conexion.execute("UPDATE meta SET valor = ? WHERE clave = 'version_fichas'", (anterior + 1,))
+        return anterior, anterior + 1
+
+    def _escribir_lote(self, registros):
+        #Hilo escritor: todo el lote en una sola transacción (un solo commit a disco). Cada operación
+        #va en su SAVEPOINT: si una falla (p.ej. un id repetido) solo se deshace esa y se le devuelve su error.
+        fallos = {}
+        with self._conexion_lock:
+            with self._conexion:
+                self._conexion.execute("BEGIN IMMEDIATE")
+                for i, registro in enumerate(registros):
+                    self._conexion.execute("SAVEPOINT operacion")
+                    try:
+                        self._aplicar(registro)
+                    except sqlite3.IntegrityError as e:
+                        self._conexion.execute("ROLLBACK TO operacion")
+                        fallos[i] = e
+                    self._conexion.execute("RELEASE operacion")
+                anterior, version = self._subir_version()
+            #Si otro proceso cambió las fichas desde la última carga, la caché no tiene sus cambios: se relee
+            self._version_fichas = version if anterior == self._version_fichas else None
+        return fallos
+
+    def _guardar_todo(self, fichas):
+        with self._conexion_lock:
+            with self._conexion:
+                self._conexion.execute("BEGIN IMMEDIATE")
+                self._conexion.execute("DELETE FROM fichas")
+                self._conexion.executemany(INSERTAR_FICHA, [_fila_ficha(f) for f in fichas])
+                _, version = self._subir_version()
+            #Tras sustituirlo todo, la caché es exactamente este contenido
+            self._version_fichas = version
+
+#=== Usuarios sobre SQLite ===
+def cargar_usuarios_sqlite(ruta = SQLITE_FILE):
+    try:
+        conexion = conectar(ruta)
+        try:
+            filas = conexion.execute("SELECT datos FROM usuarios ORDER BY orden").fetchall()
+        finally:
+            conexion.close()
+        return [leer_linea(datos) for (datos,) in filas]
+    except Exception as e:
+        error_logger.exception(f"Error cargando usuarios de {ruta}: {e}")
+        return []
+
+def guardar_usuarios_sqlite(usuarios, ruta = SQLITE_FILE):
+    #Sustituye la tabla completa en una sola transacción.
+    conexion = conectar(ruta)
+    try:
+        with conexion:
+            conexion.execute("BEGIN")
+            conexion.execute("DELETE FROM usuarios")
+            conexion.executemany("INSERT INTO usuarios (id, username, datos) VALUES (?, ?, ?)",
+                                 [(u["id"], u["username"], _serializar(u)) for u in usuarios])
+    finally:
+        conexion.close()
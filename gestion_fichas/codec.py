@@ -0,0 +1,80 @@
+import json
+from gestion_fichas.logger_config import app_logger
+from config import CODEC_DATOS
+
+#=== Backends opcionales ===
+#orjson escribe el mismo JSON compacto pero bastante más rápido; msgpack es binario y más pequeño.
+#Si no están instalados se usa la librería estándar.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class DatosCorruptos(ValueError):
+    """El contenido del archivo no se puede decodificar (dañado, vacío o de un formato no disponible)."""
+
+#=== Codificación ===
+def _codec_activo():
+    if CODEC_DATOS == "msgpack" and msgpack is None:
+        app_logger.warning("CODEC_DATOS=msgpack pero msgpack no está instalado. Se usa JSON.")
+        return "json"
+    if CODEC_DATOS not in ("json", "msgpack"):
+        app_logger.warning(f"CODEC_DATOS={CODEC_DATOS} no reconocido. Se usa JSON.")
+        return "json"
+    return CODEC_DATOS
+
+CODEC = _codec_activo()
+
+def linea_json(obj) -> str:
+    #JSON compacto en una línea (journal, exportaciones). Con orjson si está disponible.
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def leer_linea(linea):
+    #Inversa de linea_json(). Los errores son json.JSONDecodeError (también con orjson).
+    if orjson is not None:
+        return orjson.loads(linea)
+    return json.loads(linea)
+
+def volcar(obj, codec = None) -> bytes:
+    #Serializa con el codec configurado. JSON siempre compacto y en UTF-8 (sin indentar).
+    codec = codec or CODEC
+    if codec == "msgpack":
+        return msgpack.packb(obj, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+#=== Decodificación ===
+def detectar(datos: bytes) -> str:
+    #Mira la cabecera: un archivo JSON empieza por '[' o '{' (tras espacios o BOM); lo demás se trata como msgpack.
+    inicio = datos.lstrip(b" \t\r\n\xef\xbb\xbf")[:1]
+    return "json" if inicio in (b"[", b"{") else "msgpack"
+
+def leer(datos: bytes):
+    #Decodifica el contenido de un archivo sea cual sea el codec con el que se escribió.
+    if not datos.strip():
+        raise DatosCorruptos("Archivo vacío.")
+    formato = detectar(datos)
+    try:
+        if formato == "msgpack":
+            if msgpack is None:
+                raise DatosCorruptos("El archivo está en msgpack pero msgpack no está instalado.")
+            return msgpack.unpackb(datos, raw=False)
+        datos = datos.lstrip(b" \t\r\n").removeprefix(b"\xef\xbb\xbf")
+        if orjson is not None:
+            return orjson.loads(datos)
+        return json.loads(datos.decode("utf-8"))
+    except DatosCorruptos:
+        raise
+    except Exception as e:
+        raise DatosCorruptos(str(e)) from e
+
+def leer_archivo(ruta):
+    with open(ruta, "rb") as f:
+        return leer(f.read())
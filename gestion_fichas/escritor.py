@@ -0,0 +1,130 @@
+import threading, time
+from gestion_fichas.logger_config import app_logger, error_logger
+from gestion_fichas.metricas import metricas
+from config import ESCRITURA_VENTANA_MS, ESCRITURA_MAX_OPS
+
+INTERVALO_RESUMEN_SEG = 60 #Cada cuánto se deja en app.log un resumen de lotes y latencias
+
+class _Pendiente:
+    __slots__ = ("registro", "hecho", "error")
+
+    def __init__(self, registro):
+        self.registro = registro
+        self.hecho = threading.Event()
+        self.error = None
+
+#=== Escritor con commit agrupado ===
+class EscritorAgrupado:
+    """Un único hilo escritor que junta los cambios pendientes y los persiste de una vez.
+
+    enviar() deja el registro en la cola y devuelve enseguida; esperar() bloquea
+    hasta que el lote en el que ha ido está en disco. El hilo espera como mucho
+    'ventana_ms' (o hasta 'max_ops' registros) antes de llamar a escribir_lote(registros).
+    escribir_lote puede devolver {posición en el lote: excepción} con los registros que fallaron
+    por separado; el resto del lote se da por escrito.
+    """
+
+    def __init__(self, escribir_lote, ventana_ms = ESCRITURA_VENTANA_MS, max_ops = ESCRITURA_MAX_OPS, nombre = "escritor"):
+        self._escribir_lote = escribir_lote
+        self.ventana = ventana_ms / 1000
+        self.max_ops = max_ops
+        self.nombre = nombre
+        self._cond = threading.Condition()
+        self._cola = []
+        self._en_curso = 0 #Registros que el hilo ya ha tomado y todavía no ha terminado de escribir
+        self._hilo = None
+        #Estadísticas
+        self.lotes = 0
+        self.operaciones = 0
+        self.max_lote = 0
+        self.ultima_latencia_ms = 0.0
+        self.max_latencia_ms = 0.0
+        self._latencia_total_ms = 0.0
+        self._ultimo_resumen = time.monotonic()
+
+    def enviar(self, registro):
+        pendiente = _Pendiente(registro)
+        with self._cond:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name=self.nombre, daemon=True)
+                self._hilo.start()
+            self._cola.append(pendiente)
+            self._cond.notify_all()
+        return pendiente
+
+    def esperar(self, pendiente):
+        #Vuelve cuando el lote está en disco; si la escritura falló, relanza el error.
+        pendiente.hecho.wait()
+        if pendiente.error is not None:
+            raise pendiente.error
+
+    def ocupado(self):
+        return bool(self._cola) or self._en_curso > 0
+
+    def vaciar(self):
+        #Espera a que no quede nada pendiente (antes de reescribir el archivo completo, por ejemplo).
+        with self._cond:
+            while self._cola or self._en_curso:
+                self._cond.wait()
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "lotes": self.lotes,
+                "operaciones": self.operaciones,
+                "lote_medio": self.operaciones / self.lotes if self.lotes else 0.0,
+                "max_lote": self.max_lote,
+                "latencia_media_ms": self._latencia_total_ms / self.lotes if self.lotes else 0.0,
+                "ultima_latencia_ms": self.ultima_latencia_ms,
+                "max_latencia_ms": self.max_latencia_ms,
+                "pendientes": len(self._cola) + self._en_curso,
+            }
+
+    def _tomar_lote(self):
+        with self._cond:
+            while not self._cola:
+                self._cond.wait()
+            #Se da un margen para que lleguen más cambios al mismo lote
+            limite = time.monotonic() + self.ventana
+            while len(self._cola) < self.max_ops:
+                resto = limite - time.monotonic()
+                if resto <= 0:
+                    break
+                self._cond.wait(resto)
+            lote, self._cola = self._cola[:self.max_ops], self._cola[self.max_ops:]
+            self._en_curso = len(lote)
+            return lote
+
+    def _bucle(self):
+        while True:
+            lote = self._tomar_lote()
+            inicio = time.perf_counter()
+            error, fallos = None, None
+            try:
+                fallos = self._escribir_lote([p.registro for p in lote])
+            except Exception as e:
+                error = e
+                error_logger.exception(f"Error escribiendo un lote de {len(lote)} cambios ({self.nombre}): {e}")
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            metricas.observar("gestion_fichas_operacion_segundos", latencia_ms / 1000, operacion="escribir_lote")
+            with self._cond:
+                self.lotes += 1
+                self.operaciones += len(lote)
+                self.max_lote = max(self.max_lote, len(lote))
+                self.ultima_latencia_ms = latencia_ms
+                self.max_latencia_ms = max(self.max_latencia_ms, latencia_ms)
+                self._latencia_total_ms += latencia_ms
+                self._en_curso = 0
+                self._cond.notify_all()
+            for i, pendiente in enumerate(lote):
+                pendiente.error = error or (fallos or {}).get(i)
+                pendiente.hecho.set()
+            self._quizas_resumir()
+
+    def _quizas_resumir(self):
+        ahora = time.monotonic()
+        if ahora - self._ultimo_resumen >= INTERVALO_RESUMEN_SEG:
+            self._ultimo_resumen = ahora
+            e = self.estadisticas()
+            app_logger.info(f"Escritura agrupada ({self.nombre}): {e['lotes']} lotes, {e['lote_medio']:.1f} cambios/lote "
+                            f"(máx {e['max_lote']}), latencia media {e['latencia_media_ms']:.2f} ms (máx {e['max_latencia_ms']:.2f} ms).")
@@ -0,0 +1,204 @@
+import atexit, heapq, os, threading, time
+from collections import Counter
+from gestion_fichas.codec import DatosCorruptos, leer_archivo, volcar, linea_json, leer_linea
+from gestion_fichas.indices import _clave_fecha
+from gestion_fichas.logger_config import error_logger
+
+#=== Agregados de fichas mantenidos al día ===
+#Totales, fichas por ciudad, histograma de edades y altas por día para el panel. Se llevan como
+#un índice más del almacén: cada alta/edición/baja suma o resta sus valores (O(1)), y en una
+#edición se quita lo que aportaba la ficha anterior y se suma lo de la nueva. Consultarlos no
+#recorre las fichas. Se guardan junto a los datos para no tener que recalcularlos al arrancar.
+
+SIN_VALOR = "(sin dato)"
+ANCHO_EDAD = 10 #Años por barra del histograma
+FORMATO = 2 #Sube si cambian las claves de los agregados: los guardados con otro formato se recalculan
+
+def _ciudad(ficha):
+    return (ficha.get("ciudad") or "").strip() or SIN_VALOR
+
+def _tramo_edad(ficha):
+    edad = ficha.get("edad")
+    if not isinstance(edad, int) or isinstance(edad, bool) or edad < 0:
+        return SIN_VALOR
+    inicio = edad // ANCHO_EDAD * ANCHO_EDAD
+    return f"{inicio:03d}-{inicio + ANCHO_EDAD - 1:03d}" #Con ceros: el orden de texto es el numérico
+
+def _etiqueta_tramo(tramo):
+    inicio, fin = tramo.split("-")
+    return f"{int(inicio)}-{int(fin)}"
+
+def _dia(ficha):
+    #Las fichas del CLI guardan "2025/10/30 ..." y las de la web "2025-10-30T...": mismo día, misma clave
+    return _clave_fecha(ficha.get("fecha_creacion"))[:10] or SIN_VALOR
+
+def _sumar(contador, clave, delta):
+    contador[clave] += delta
+    if not contador[clave]:
+        del contador[clave]
+
+class EstadisticasFichas:
+    """Agregados de las fichas, con la misma interfaz de mantenimiento que los índices de gestion_fichas.indices.
+
+    Como ellos, se construye en la primera consulta (o se restaura de disco) y a partir de ahí
+    solo se aplica la diferencia de cada cambio.
+    """
+
+    def __init__(self):
+        self._datos = None #None = todavía sin construir
+
+    #--- Mantenimiento ---
+    def reconstruir(self, fichas):
+        self._datos = None
+
+    def _construir(self, fichas):
+        self._datos = {"total": 0, "suma_edades": 0, "con_edad": 0, "modificadas": 0,
+                       "ciudades": Counter(), "edades": Counter(), "dias": Counter()}
+        for ficha in fichas:
+            self._aplicar(ficha, 1)
+
+    def _aplicar(self, ficha, delta):
+        datos = self._datos
+        datos["total"] += delta
+        edad = ficha.get("edad")
+        if _tramo_edad(ficha) != SIN_VALOR:
+            datos["suma_edades"] += edad * delta
+            datos["con_edad"] += delta
+        if ficha.get("fecha_modificacion"):
+            datos["modificadas"] += delta
+        _sumar(datos["ciudades"], _ciudad(ficha), delta)
+        _sumar(datos["edades"], _tramo_edad(ficha), delta)
+        _sumar(datos["dias"], _dia(ficha), delta)
+
+    def insertar(self, ficha):
+        if self._datos is not None:
+            self._aplicar(ficha, 1)
+
+    def insertar_lote(self, fichas):
+        if self._datos is not None:
+            for ficha in fichas:
+                self._aplicar(ficha, 1)
+
+    def eliminar(self, ficha):
+        if self._datos is not None:
+            self._aplicar(ficha, -1)
+
+    def actualizar(self, anterior, nueva):
+        if self._datos is not None:
+            self._aplicar(anterior, -1)
+            self._aplicar(nueva, 1)
+
+    #--- Consulta ---
+    def asegurar(self, por_id):
+        if self._datos is None:
+            self._construir(por_id.values())
+
+    def resumen(self, por_id, ciudades = 10, dias = 30):
+        """Totales, las 'ciudades' con más fichas, el histograma de edades y las altas de los últimos 'dias' días con altas."""
+        self.asegurar(por_id)
+        datos = self._datos
+        edades = sorted((tramo, n) for tramo, n in datos["edades"].items() if tramo != SIN_VALOR)
+        por_dia = sorted((dia, n) for dia, n in datos["dias"].items() if dia != SIN_VALOR)[-dias:]
+        return {
+            "total": datos["total"],
+            "modificadas": datos["modificadas"],
+            "edad_media": round(datos["suma_edades"] / datos["con_edad"], 1) if datos["con_edad"] else None,
+            "sin_edad": datos["edades"].get(SIN_VALOR, 0),
+            "num_ciudades": len(datos["ciudades"]),
+            #Empates por nombre: el orden no depende de si se restauró de disco o se recalculó
+            "ciudades": [{"ciudad": c, "fichas": n} for c, n in heapq.nsmallest(ciudades, datos["ciudades"].items(), key=lambda par: (-par[1], par[0]))],
+            "edades": [{"tramo": _etiqueta_tramo(tramo), "fichas": n} for tramo, n in edades],
+            "por_dia": [{"dia": dia, "fichas": n} for dia, n in por_dia],
+        }
+
+    #--- Persistencia ---
+    def construida(self):
+        return self._datos is not None
+
+    def exportar(self):
+        return {clave: dict(valor) if isinstance(valor, Counter) else valor for clave, valor in self._datos.items()}
+
+    def restaurar(self, datos):
+        self._datos = {clave: Counter(valor) if isinstance(valor, dict) else valor for clave, valor in datos.items()}
+
+#=== Volcado a disco ===
+def _normalizar(firma):
+    #Tuplas -> listas, como quedan tras pasar por el archivo
+    return leer_linea(linea_json(firma))
+
+class PersistenciaEstadisticas:
+    """Guarda los agregados junto a los datos, agrupando cambios como el registro de sesiones.
+
+    'instantanea()' la aporta el almacén: devuelve (firma de los datos en disco, agregados) solo
+    cuando lo que hay en memoria es exactamente lo escrito; si no (escrituras en vuelo), None y se
+    reintenta en el siguiente intervalo. False si no hay agregados que guardar (nadie los ha pedido). Al cargar, los agregados guardados solo se usan si la
+    firma coincide con la de los archivos actuales.
+    """
+
+    def __init__(self, ruta, instantanea, persistir_seg):
+        self.ruta = ruta
+        self.instantanea = instantanea
+        self.persistir_seg = persistir_seg
+        self._lock = threading.Lock()
+        self._cambios = False
+        self._despertar = threading.Event()
+        self._hilo = None
+        if persistir_seg > 0:
+            atexit.register(self.volcar, True)
+
+    def leer(self, firma):
+        #Agregados guardados si corresponden a 'firma', o None
+        if self.persistir_seg <= 0 or not os.path.exists(self.ruta):
+            return None
+        try:
+            guardado = leer_archivo(self.ruta)
+        except (OSError, DatosCorruptos) as e:
+            error_logger.error(f"No se pudieron leer las estadísticas de {self.ruta}: {e}. Se recalculan.")
+            return None
+        if not isinstance(guardado, dict) or guardado.get("formato") != FORMATO or guardado.get("firma") != _normalizar(firma):
+            return None
+        return guardado.get("datos")
+
+    def volcar(self, forzar = False):
+        #Escribe los agregados si han cambiado (o siempre con 'forzar', p.ej. al salir tras una compactación)
+        with self._lock:
+            if not (self._cambios or forzar):
+                return True
+            self._cambios = False
+        instantanea = self.instantanea()
+        if instantanea is False:
+            return True
+        if instantanea is None:
+            with self._lock:
+                self._cambios = True
+            return False
+        firma, datos = instantanea
+        try:
+            tmp = f"{self.ruta}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(volcar({"formato": FORMATO, "firma": _normalizar(firma), "datos": datos}))
+            os.replace(tmp, self.ruta)
+        except OSError as e:
+            error_logger.exception(f"Error guardando las estadísticas en {self.ruta}: {e}")
+            with self._lock:
+                self._cambios = True
+            return False
+        return True
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait()
+            time.sleep(self.persistir_seg) #Se juntan los cambios de este intervalo
+            self._despertar.clear()
+            if not self.volcar():
+                self._despertar.set() #Había escrituras en vuelo: otro intento en el siguiente intervalo
+
+    def marcar_cambio(self):
+        if self.persistir_seg <= 0:
+            return
+        with self._lock:
+            self._cambios = True
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._bucle, name=f"estadisticas-{os.path.basename(self.ruta)}", daemon=True)
+                self._hilo.start()
+        self._despertar.set()
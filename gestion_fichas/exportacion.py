@@ -0,0 +1,58 @@
+import csv, io
+from gestion_fichas.codec import linea_json
+from gestion_fichas.indices import plegar
+
+#=== Exportación en streaming ===
+#Todo son generadores: se recorre la lista en memoria del almacén y se va entregando
+#texto por trozos, sin construir nunca el archivo completo.
+CAMPOS_EXPORTACION = ["id", "nombre", "edad", "ciudad", "fecha_creacion", "fecha_modificacion"]
+TAMANO_TROZO = 64 * 1024 #Caracteres acumulados antes de entregar un trozo
+
+def filtrar_fichas(fichas, ciudad = None, edad_min = None, edad_max = None):
+    #Aplica los filtros mientras se recorre (la ciudad sin distinguir tildes ni mayúsculas).
+    ciudad = plegar(ciudad) if ciudad else None
+    for ficha in fichas:
+        if ciudad is not None and plegar(ficha.get("ciudad")) != ciudad:
+            continue
+        if edad_min is not None or edad_max is not None:
+            try:
+                edad = int(ficha.get("edad"))
+            except (TypeError, ValueError):
+                continue
+            if (edad_min is not None and edad < edad_min) or (edad_max is not None and edad > edad_max):
+                continue
+        yield ficha
+
+def _en_trozos(partes):
+    #Junta textos pequeños en trozos de ~TAMANO_TROZO para no hacer un write por fila.
+    buffer, tam = [], 0
+    for parte in partes:
+        buffer.append(parte)
+        tam += len(parte)
+        if tam >= TAMANO_TROZO:
+            yield "".join(buffer)
+            buffer, tam = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+def _filas_csv(fichas):
+    salida = io.StringIO()
+    escritor = csv.DictWriter(salida, fieldnames=CAMPOS_EXPORTACION, extrasaction="ignore")
+    for ficha in fichas:
+        escritor.writerow(ficha)
+        yield salida.getvalue()
+        salida.seek(0)
+        salida.truncate(0)
+
+def exportar_csv(fichas):
+    #La cabecera sale sola y enseguida, así el cliente recibe el primer byte sin esperar a las filas.
+    yield ",".join(CAMPOS_EXPORTACION) + "\r\n"
+    yield from _en_trozos(_filas_csv(fichas))
+
+def exportar_ndjson(fichas):
+    yield from _en_trozos(linea_json({c: f.get(c) for c in CAMPOS_EXPORTACION}) + "\n" for f in fichas)
+
+FORMATOS_EXPORTACION = {
+    "csv": exportar_csv,
+    "ndjson": exportar_ndjson,
+}
@@ -1,8 +1,12 @@
-import json, os, uuid
+import os, sys, uuid
 from datetime import datetime
 from gestion_fichas.utils import pedir_nombre, pedir_edad, pedir_ciudad
 from gestion_fichas.logger_config import app_logger, error_logger, user_logger
-from config import FICHAS_FILE, DATA_DIR
+from gestion_fichas.almacen import obtener_almacen
+from gestion_fichas.metricas import medido
+from gestion_fichas.exportacion import FORMATOS_EXPORTACION, filtrar_fichas
+from gestion_fichas.importacion import LECTORES_IMPORTACION, InformeErrores, abrir_texto, formato_por_nombre, importar_fichas
+from config import DATA_DIR
 
 #=== Configuración de rutas ===
 #Carpeta base --> donde está este archivo (gestion_fichas/)
@@ -15,40 +19,26 @@ os.makedirs(DATA_DIR, exist_ok=True)
 #NOMBRE_ARCHIVO = os.path.join(DATA_DIR, "fichas.json")
 
 #=== Funciones de carga y guardado ===
-def cargar_fichas(nombre_archivo = FICHAS_FILE):
-    #Carga las fichas desde un archivo JSON si existe, o crea una lista vacia.
-    if os.path.exists(nombre_archivo):
-        try:
-            with open(nombre_archivo, "r", encoding="utf-8") as f:
-                fichas = json.load(f)
-                app_logger.info(f"{len(fichas)} fichas cargadas correctamente desde {nombre_archivo}.")
-                return fichas
-        except json.JSONDecodeError:
-            error_logger.error(f"El archivo {nombre_archivo} estaba dañado o vacío.")
-            print(f"El archivo {nombre_archivo} está dañado o vacío. Se creará uno nuevo.")
-            return []
-        except Exception as e:
-            error_logger.exception(f"Error al leer el archivo {nombre_archivo}: {e}")
-            print(f"Error leyendo {nombre_archivo}: {e}")
-            return []
-    else:
-        app_logger.info("Archivo fichas.json no encontrado.")
-        print(f"No se encontró {nombre_archivo}. Se creará uno nuevo al cargar.")
-        return []
+@medido("cargar_fichas")
+def cargar_fichas(nombre_archivo = None):
+    #Devuelve una copia editable de las fichas. El archivo solo se vuelve a leer
+    #si ha cambiado en disco (ver AlmacenFichas), o una lista vacía si no existe.
+    #Sin nombre_archivo se usa el backend configurado (JSON o SQLite).
+    return obtener_almacen(nombre_archivo).cargar()
 
-def guardar_fichas(fichas, nombre_archivo = FICHAS_FILE):
-    #Guarda la lista completa en JSON (sobreescribe).
+@medido("guardar_fichas")
+def guardar_fichas(fichas, nombre_archivo = None):
+    #Guarda la lista completa en JSON (sobreescribe) y actualiza la caché.
     try:
-        with open(nombre_archivo, "w", encoding="utf-8") as f:
-            json.dump(fichas, f, ensure_ascii=False, indent=4)
+        obtener_almacen(nombre_archivo).guardar(fichas)
         app_logger.info(f"Se guardaron {len(fichas)} fichas en el archivo.")
     except Exception as e:
         error_logger.exception(f"Error al guardar la ficha: {e}")
         print(f"Error al guardar fichas: {e}")
     else:
-        print(f"Fichas guardadas en {nombre_archivo} (total: {len(fichas)}).")
+        print(f"Fichas guardadas en {obtener_almacen(nombre_archivo).ruta} (total: {len(fichas)}).")
 
-def crear_ficha(fichas, nombre_archivo = FICHAS_FILE):
+def crear_ficha(fichas, nombre_archivo = None):
     try:
         #Crea una nueva ficha y la añade a la lista, guardando después.
         nombre = pedir_nombre()
@@ -71,8 +61,8 @@ def crear_ficha(fichas, nombre_archivo = FICHAS_FILE):
                 user_logger.info("Se ha cancelado la creación de una ficha al haber una con el mismo nombre.")
                 print("Cancelado.")
                 return
+        obtener_almacen(nombre_archivo).crear(nueva_ficha)
         fichas.append(nueva_ficha)
-        guardar_fichas(fichas, nombre_archivo)
         user_logger.info(f"Ficha creada: {nombre} / {edad} / {ciudad}")
     except Exception as e:
         error_logger.exception(f"Error al crear ficha: {e}")
@@ -97,7 +87,8 @@ def mostrar_datos(fichas):
     print("==========================\n")
 
 def buscar_fichas_por_nombre(fichas, termino):
-    #Búsqueda (devuelve lista de tuplas(idx, ficha))
+    #Búsqueda (devuelve lista de tuplas(idx, ficha)) sobre una lista ya cargada.
+    #Para buscar en el almacén con su índice, usar buscar_fichas_en_almacen().
     termino = termino.strip().lower()
     resultados = []
     for idx, f in enumerate(fichas):
@@ -105,16 +96,32 @@ def buscar_fichas_por_nombre(fichas, termino):
             resultados.append((idx, f))
     return resultados
 
-def buscar_ficha(fichas):
+def buscar_fichas_en_almacen(termino, nombre_archivo = None):
+    #Búsqueda por subcadena en el nombre usando el índice del almacén (sin tildes ni mayúsculas).
+    #Devuelve lista de tuplas (id, ficha) con copias editables.
+    encontradas = obtener_almacen(nombre_archivo).buscar(termino, campos = ("nombre",))
+    return [(f["id"], dict(f)) for f in encontradas]
+
+def _sincronizar_lista(fichas, ficha, eliminar = False):
+    #Mantiene al día la lista que maneja el menú (copia de cargar_fichas()) tras guardar en el almacén.
+    for i, f in enumerate(fichas):
+        if f.get("id") == ficha["id"]:
+            if eliminar:
+                fichas.pop(i)
+            else:
+                fichas[i] = ficha
+            return
+
+def buscar_ficha(fichas = None, nombre_archivo = None):
     termino = input("Introduce el nombre a buscar: ").strip()
-    resultados = buscar_fichas_por_nombre(fichas, termino)
+    resultados = buscar_fichas_en_almacen(termino, nombre_archivo)
     if not resultados:
         app_logger.warning("No se han encontrado coincidencias en la búsqueda.")
         print("No se encuetran coincidencias.")
         return
     app_logger.info(f"Se encontraron {len(resultados)} fichas que coinciden con la búsqueda realizada.")
     print(f"\nSe encontraron {len(resultados)} que coindice/n:")
-    for i, (idx, f) in enumerate(resultados, start=1):
+    for i, (id_ficha, f) in enumerate(resultados, start=1):
         print(
             f"\nFicha: {i}"
             f"\nNombre: {f['nombre']}"
@@ -124,21 +131,21 @@ def buscar_ficha(fichas):
             f"\nModificada: {f['fecha_modificacion']}"
         )
 
-def modificar_ficha(fichas, nombre_archivo = FICHAS_FILE):
+def modificar_ficha(fichas, nombre_archivo = None):
     nombre_buscado= input("Introduce el nombre de la ficha que quieras buscar/modificar: ").strip().lower()
-    coincidencias = buscar_fichas_por_nombre(fichas, nombre_buscado)
+    coincidencias = buscar_fichas_en_almacen(nombre_buscado, nombre_archivo)
     if not coincidencias:
         app_logger.info(f"No se han encontrado coincidencias para {nombre_buscado}.")
         print("No se encontraron fichas con ese nombre.")
         return
     print(f"\nSe encontraron {len(coincidencias)} coincidencia/s:\n")
-    for i, (idx, f) in enumerate(coincidencias, start=1):
+    for i, (id_ficha, f) in enumerate(coincidencias, start=1):
         print(
             f"Ficha [{i}]"
             f"\nNombre: {f.get('nombre')}"
             f"\nEdad: {f.get('edad')}"
             f"\nCiudad: {f.get('ciudad')}"
-            f"\nindex: {idx}"
+            f"\nid: {id_ficha}"
         )
     if len(coincidencias) > 1:
         try:
@@ -152,7 +159,7 @@ def modificar_ficha(fichas, nombre_archivo = FICHAS_FILE):
             return
     else:
         sel_index = 0
-    idx_global, ficha = coincidencias[sel_index] #Índice real en la lista fichas
+    id_ficha, ficha = coincidencias[sel_index]
     while True:
         print("\nDatos actuales:")
         print(f"1. Nombre: {ficha['nombre']}")
@@ -163,42 +170,42 @@ def modificar_ficha(fichas, nombre_archivo = FICHAS_FILE):
         eleccion = input("Elige que desea cambiar (1 - 5): ").strip()
         if eleccion == "1":
             ficha["nombre"] = pedir_nombre()
-            user_logger.info(f"Nombre modificado para idx = {idx_global}.")
+            user_logger.info(f"Nombre modificado para id = {id_ficha}.")
         elif eleccion == "2":
             ficha["edad"] = pedir_edad()
-            user_logger.info(f"Edad modificada para idx = {idx_global}.")
+            user_logger.info(f"Edad modificada para id = {id_ficha}.")
         elif eleccion == "3":
             ficha["ciudad"] = pedir_ciudad()
-            user_logger.info(f"Ciudad modificada para idx = {idx_global}.")
+            user_logger.info(f"Ciudad modificada para id = {id_ficha}.")
         elif eleccion == "4":
             ficha["fecha_modificacion"] = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
-            fichas[idx_global] = ficha #Se actualiza la lista principal
-            guardar_fichas(fichas, nombre_archivo)
-            user_logger.info(f"Ficha idx = {idx_global} guardada (modificada).")
+            obtener_almacen(nombre_archivo).actualizar(ficha)
+            _sincronizar_lista(fichas, ficha) #Se actualiza la lista principal
+            user_logger.info(f"Ficha id = {id_ficha} guardada (modificada).")
             print("Ficha modificada y guardada.")
             return #Se puede cambiar por un return para volver al menu principal
         elif eleccion == "5":
-            app_logger.info(f"Se ha cancelado y no se ha actualizado la ficha idx = {idx_global}.")
+            app_logger.info(f"Se ha cancelado y no se ha actualizado la ficha id = {id_ficha}.")
             print("Modificación cancelada, no se ha guardado nada.")
             return
         else:
             print("Opción NO válida. Inténtelo de nuevo.")
 
-def eliminar_ficha(fichas, nombre_archivo = FICHAS_FILE):
+def eliminar_ficha(fichas, nombre_archivo = None):
     nombre_buscado= input("Introduce el nombre de la ficha que quieras eliminar: ").strip().lower()
-    coincidencias = buscar_fichas_por_nombre(fichas, nombre_buscado)
+    coincidencias = buscar_fichas_en_almacen(nombre_buscado, nombre_archivo)
     if not coincidencias:
         app_logger.warning(f"No se ha encontrado fichas para eliminar con {nombre_buscado}.")
         print("No se encontraron fichas con ese nombre.")
         return
     print(f"\nSe encontraron {len(coincidencias)} coincidencia/s:\n")
-    for i, (idx, f) in enumerate(coincidencias, start=1):
+    for i, (id_ficha, f) in enumerate(coincidencias, start=1):
         print(
             f"Ficha [{i}]"
             f"\nNombre: {f.get('nombre')}"
             f"\nEdad: {f.get('edad')}"
             f"\nCiudad: {f.get('ciudad')}"
-            f"\nindex: {idx}"
+            f"\nid: {id_ficha}"
         )
     if len(coincidencias) > 1:
         try:
@@ -212,7 +219,7 @@ def eliminar_ficha(fichas, nombre_archivo = FICHAS_FILE):
             return
     else:
         sel_index = 0
-    idx_global, ficha_a_eliminar = coincidencias[sel_index]
+    id_ficha, ficha_a_eliminar = coincidencias[sel_index]
     print(
         f"\nNombre: {ficha_a_eliminar.get('nombre')}"
         f"\nEdad: {ficha_a_eliminar.get('edad')}"
@@ -221,13 +228,47 @@ def eliminar_ficha(fichas, nombre_archivo = FICHAS_FILE):
     confirmar = input("Esta acción no se puede deshacer. ¿Eliminar definitivamente la ficha? (s/n): ").strip().lower()
     if confirmar == "s":
         try:
-            fichas.pop(idx_global)
-            guardar_fichas(fichas, nombre_archivo)
-            user_logger.info(f"Ficha eliminada con idx = {idx_global}, Nombre: {ficha_a_eliminar.get('nombre')}")
+            obtener_almacen(nombre_archivo).eliminar(id_ficha)
+            _sincronizar_lista(fichas, ficha_a_eliminar, eliminar = True)
+            user_logger.info(f"Ficha eliminada con id = {id_ficha}, Nombre: {ficha_a_eliminar.get('nombre')}")
             print("Ficha eliminada correctamente.")
         except Exception as e:
-            error_logger.exception(f"Error eliminando la ficha idx = {idx_global}: {e}")
+            error_logger.exception(f"Error eliminando la ficha id = {id_ficha}: {e}")
             print("Error al eliminar la ficha.")
     else:
         app_logger.info("Se ha cancelado la eliminación de la ficha.")
-        print("Acción cancelada.")
\ No newline at end of file
+        print("Acción cancelada.")
+
+def exportar_fichas(destino, formato = "csv", ciudad = None, edad_min = None, edad_max = None, nombre_archivo = None):
+    #Exportación no interactiva a un archivo (o a la salida estándar con destino "-"). Devuelve cuántas fichas se escribieron.
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato no soportado: {formato}. Usa uno de: {', '.join(FORMATOS_EXPORTACION)}.")
+    exportadas = 0
+    def contar(fichas):
+        nonlocal exportadas
+        for ficha in fichas:
+            exportadas += 1
+            yield ficha
+    seleccion = contar(filtrar_fichas(obtener_almacen(nombre_archivo).fichas(), ciudad, edad_min, edad_max))
+    salida = sys.stdout if destino == "-" else open(destino, "w", encoding="utf-8", newline="")
+    try:
+        for trozo in FORMATOS_EXPORTACION[formato](seleccion):
+            salida.write(trozo)
+    finally:
+        if salida is not sys.stdout:
+            salida.close()
+    app_logger.info(f"Exportadas {exportadas} fichas en formato {formato} a {destino}.")
+    return exportadas
+
+def importar_fichas_desde_archivo(ruta, formato = None, ruta_errores = None, nombre_archivo = None):
+    #Importación no interactiva de un CSV/NDJSON. Las filas rechazadas se escriben en ruta_errores (CSV).
+    formato = formato or formato_por_nombre(ruta)
+    if formato not in LECTORES_IMPORTACION:
+        raise ValueError(f"No se reconoce el formato de {ruta}. Usa uno de: {', '.join(LECTORES_IMPORTACION)}.")
+    ruta_errores = ruta_errores or f"{ruta}.errores.csv"
+    with open(ruta, "rb") as entrada, open(ruta_errores, "w", encoding="utf-8", newline="") as errores:
+        resumen = importar_fichas(LECTORES_IMPORTACION[formato](abrir_texto(entrada)), obtener_almacen(nombre_archivo), InformeErrores(errores))
+    if not resumen["rechazadas"]:
+        os.remove(ruta_errores)
+    user_logger.info(f"Importadas {resumen['importadas']} fichas desde {ruta} ({resumen['rechazadas']} rechazadas).")
+    return resumen
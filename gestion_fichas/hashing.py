@@ -0,0 +1,152 @@
+import hashlib, multiprocessing, threading, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from gestion_fichas.logger_config import app_logger, error_logger
+from gestion_fichas.metricas import metricas
+from config import HASH_WORKERS, HASH_COLA_MAX
+
+#=== Hashing de contraseñas fuera del hilo de la petición ===
+#PBKDF2 con 200.000 iteraciones tarda decenas de ms de CPU y retiene el GIL: hecho en el hilo
+#de la petición, unos pocos logins a la vez frenan todas las demás peticiones. Aquí se manda a
+#un pool de procesos con un límite de trabajos en vuelo; si está lleno se falla enseguida con
+#HashingOcupado en lugar de encolar sin fin.
+#Los trabajadores se arrancan con spawn, que vuelve a importar el script principal: los scripts
+#que toquen contraseñas deben tener su código bajo if __name__ == "__main__" (como app.py).
+
+class HashingOcupado(RuntimeError):
+    """Hay demasiados hashes en curso: la petición debe responder 'ocupado' e intentarlo más tarde."""
+
+def _pbkdf2(nombre, password, salt, iteraciones):
+    #Se ejecuta en el proceso trabajador (tiene que ser una función de módulo para poder enviarla)
+    return hashlib.pbkdf2_hmac(nombre, password, salt, iteraciones)
+
+class EjecutorHash:
+    """Pool de procesos acotado para PBKDF2.
+
+    Admite como mucho 'trabajadores + cola_max' hashes a la vez (en cálculo o esperando).
+    Con trabajadores = 0 calcula en el propio hilo (scripts de consola, entornos sin multiprocessing).
+    """
+
+    def __init__(self, trabajadores = HASH_WORKERS, cola_max = HASH_COLA_MAX):
+        self.trabajadores = trabajadores
+        self.cola_max = cola_max
+        self._huecos = threading.BoundedSemaphore(max(1, trabajadores) + cola_max)
+        self._lock = threading.Lock()
+        self._pool = None
+        #Estadísticas
+        self.en_curso = 0
+        self.max_en_curso = 0
+        self.hashes = 0
+        self.rechazados = 0
+        self.ultima_latencia_ms = 0.0
+        self.max_latencia_ms = 0.0
+        self._latencia_total_ms = 0.0
+
+    def _obtener_pool(self):
+        with self._lock:
+            if self._pool is None and self.trabajadores > 0:
+                try:
+                    #spawn: los trabajadores no heredan hilos ni locks del servidor
+                    self._pool = ProcessPoolExecutor(self.trabajadores, mp_context=multiprocessing.get_context("spawn"))
+                except (OSError, NotImplementedError) as e:
+                    app_logger.warning(f"No se pudo crear el pool de hashing ({e}). Se calcula en el hilo de la petición.")
+                    self.trabajadores = 0
+            return self._pool
+
+    def _descartar_pool(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def pbkdf2(self, nombre, password, salt, iteraciones):
+        if not self._huecos.acquire(blocking=False):
+            with self._lock:
+                self.rechazados += 1
+            app_logger.warning(f"Hashing ocupado: {self.en_curso} hashes en curso, se rechaza la petición.")
+            raise HashingOcupado("Demasiadas operaciones de contraseña en curso.")
+        inicio = time.perf_counter()
+        with self._lock:
+            self.en_curso += 1
+            self.max_en_curso = max(self.max_en_curso, self.en_curso)
+        try:
+            pool = self._obtener_pool()
+            if pool is None:
+                return _pbkdf2(nombre, password, salt, iteraciones)
+            try:
+                return pool.submit(_pbkdf2, nombre, password, salt, iteraciones).result()
+            except BrokenProcessPool as e:
+                #Un trabajador murió: se rehace el pool en la siguiente llamada y esta se calcula aquí
+                error_logger.error(f"Pool de hashing roto ({e}). Se vuelve a crear.")
+                self._descartar_pool(pool)
+                return _pbkdf2(nombre, password, salt, iteraciones)
+        finally:
+            latencia_ms = (time.perf_counter() - inicio) * 1000
+            metricas.observar("gestion_fichas_operacion_segundos", latencia_ms / 1000, operacion="hash_password")
+            with self._lock:
+                self.en_curso -= 1
+                self.hashes += 1
+                self.ultima_latencia_ms = latencia_ms
+                self.max_latencia_ms = max(self.max_latencia_ms, latencia_ms)
+                self._latencia_total_ms += latencia_ms
+            self._huecos.release()
+
+    def estadisticas(self):
+        #Profundidad de la cola y latencia (espera + cálculo) de los hashes
+        with self._lock:
+            return {
+                "trabajadores": self.trabajadores,
+                "cola_max": self.cola_max,
+                "en_curso": self.en_curso,
+                "en_cola": max(0, self.en_curso - max(1, self.trabajadores)),
+                "max_en_curso": self.max_en_curso,
+                "hashes": self.hashes,
+                "rechazados": self.rechazados,
+                "latencia_media_ms": self._latencia_total_ms / self.hashes if self.hashes else 0.0,
+                "ultima_latencia_ms": self.ultima_latencia_ms,
+                "max_latencia_ms": self.max_latencia_ms,
+            }
+
+    def calentar(self):
+        #Arranca ya los procesos del pool (con spawn cada uno tarda en importar) con trabajos triviales
+        pool = self._obtener_pool()
+        if pool is not None:
+            for futuro in [pool.submit(_pbkdf2, "sha256", b"", b"", 1) for _ in range(self.trabajadores)]:
+                futuro.result()
+        return self.trabajadores
+
+    def cerrar(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+#=== Calibración ===
+ITERACIONES_MINIMAS = 100_000 #Por debajo de esto no se recomienda aunque la máquina sea lenta
+
+def calibrar_iteraciones(objetivo_ms, hash_name = "sha256", muestra = 50_000, repeticiones = 5):
+    """Mide PBKDF2 en esta máquina y devuelve (iteraciones, ms estimados) para tardar ~objetivo_ms por hash.
+
+    Se cronometra 'muestra' iteraciones varias veces, se toma la más rápida (la menos
+    afectada por otros procesos) y se escala: el coste de PBKDF2 es lineal en las iteraciones.
+    """
+    mejor = min(_cronometrar(hash_name, muestra) for _ in range(repeticiones))
+    iteraciones = int(objetivo_ms / 1000 / mejor * muestra) // 1000 * 1000 #Redondeado a millares
+    iteraciones = max(ITERACIONES_MINIMAS, iteraciones)
+    return iteraciones, iteraciones * mejor / muestra * 1000
+
+def _cronometrar(hash_name, iteraciones):
+    inicio = time.perf_counter()
+    hashlib.pbkdf2_hmac(hash_name, b"calibracion", b"\x00" * 16, iteraciones)
+    return time.perf_counter() - inicio
+
+_EJECUTOR = EjecutorHash()
+
+def pbkdf2(nombre, password, salt, iteraciones):
+    return _EJECUTOR.pbkdf2(nombre, password, salt, iteraciones)
+
+def calentar_hashing():
+    return _EJECUTOR.calentar()
+
+def estadisticas_hashing():
+    return _EJECUTOR.estadisticas()
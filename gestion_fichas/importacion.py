@@ -0,0 +1,142 @@
+import csv, io, json, uuid
+from datetime import datetime
+from gestion_fichas.codec import leer_linea, linea_json
+from gestion_fichas.utils import validar_nombre, validar_edad, validar_ciudad
+from gestion_fichas.logger_config import app_logger, error_logger
+from config import IMPORTACION_TAMANO_LOTE
+
+#=== Importación masiva ===
+#El archivo se lee fila a fila (nunca entero en memoria). Las filas válidas se acumulan
+#y se guardan cada IMPORTACION_TAMANO_LOTE con almacen.crear_lote(); las rechazadas
+#van al informe de errores y la importación sigue.
+CAMPOS_INFORME = ["linea", "error", "datos"]
+
+#=== Lectura en streaming ===
+#Los archivos se abren con errors="surrogateescape" (ver abrir_texto): un byte que no es UTF-8
+#no corta la lectura, queda marcado en el texto y esa fila se rechaza con su número de línea.
+NO_UTF8 = "La fila no está en UTF-8 (guarda el archivo con codificación UTF-8)."
+
+def _es_utf8(texto):
+    try:
+        texto.encode("utf-8")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def leer_csv(texto):
+    #'texto' es un archivo abierto en modo texto. Devuelve (número de línea, fila) por cada registro.
+    lector = csv.DictReader(texto)
+    while True:
+        try:
+            fila = next(lector)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            #Registro mal formado (p.ej. un campo mayor que csv.field_size_limit): se rechaza y se sigue.
+            #line_num aún no cuenta la línea fallida
+            yield lector.line_num + 1, ValueError(f"CSV mal formado: {e}.")
+            continue
+        if not all(_es_utf8(str(valor)) for par in fila.items() for valor in par):
+            yield lector.line_num, ValueError(NO_UTF8)
+            continue
+        yield lector.line_num, fila
+
+def leer_ndjson(texto):
+    for num, linea in enumerate(texto, start=1):
+        if not linea.strip():
+            continue
+        if not _es_utf8(linea):
+            yield num, ValueError(NO_UTF8)
+            continue
+        try:
+            fila = leer_linea(linea)
+        except json.JSONDecodeError:
+            yield num, ValueError("Línea JSON mal formada.")
+            continue
+        yield num, fila if isinstance(fila, dict) else ValueError("Cada línea debe ser un objeto JSON.")
+
+LECTORES_IMPORTACION = {
+    "csv": leer_csv,
+    "ndjson": leer_ndjson,
+}
+
+def formato_por_nombre(nombre_archivo):
+    #"datos.ndjson" -> "ndjson". None si la extensión no es de un formato soportado.
+    extension = str(nombre_archivo or "").rsplit(".", 1)[-1].lower()
+    return {"jsonl": "ndjson"}.get(extension, extension) if extension in ("csv", "ndjson", "jsonl") else None
+
+#=== Validación ===
+def validar_fila(fila, fecha):
+    #Aplica las mismas reglas que pedir_nombre/pedir_edad/pedir_ciudad y devuelve la ficha lista para guardar.
+    if isinstance(fila, Exception):
+        raise ValueError(str(fila))
+    return {
+        "id": str(fila.get("id") or "").strip() or str(uuid.uuid4()),
+        "nombre": validar_nombre(fila.get("nombre")),
+        "edad": validar_edad(fila.get("edad")),
+        "ciudad": validar_ciudad(fila.get("ciudad")),
+        "fecha_creacion": str(fila.get("fecha_creacion") or "").strip() or fecha,
+        "fecha_modificacion": str(fila.get("fecha_modificacion") or "").strip() or None,
+    }
+
+#=== Importación ===
+class InformeErrores:
+    """Acumula las filas rechazadas: las escribe en CSV (si hay destino) y guarda las primeras para mostrarlas."""
+
+    def __init__(self, destino = None, max_guardados = 100):
+        self.total = 0
+        self.primeros = []
+        self.max_guardados = max_guardados
+        self._escritor = None
+        if destino is not None:
+            self._escritor = csv.DictWriter(destino, fieldnames=CAMPOS_INFORME)
+            self._escritor.writeheader()
+
+    def añadir(self, linea, error, fila):
+        datos = "" if isinstance(fila, Exception) else linea_json(fila)
+        error = {"linea": linea, "error": str(error), "datos": datos}
+        self.total += 1
+        if len(self.primeros) < self.max_guardados:
+            self.primeros.append(error)
+        if self._escritor is not None:
+            self._escritor.writerow(error)
+
+def importar_fichas(filas, almacen, informe = None, tamano_lote = IMPORTACION_TAMANO_LOTE):
+    """Valida y guarda las filas (pares (línea, fila) de leer_csv/leer_ndjson) por lotes.
+
+    Devuelve un dict con importadas, rechazadas y lotes. Un id repetido (en el
+    archivo o ya existente en el almacén) se rechaza para no pisar fichas.
+    """
+    informe = informe or InformeErrores()
+    fecha = datetime.now().isoformat()
+    existentes = {f["id"] for f in almacen.fichas()}
+    lote, importadas, lotes, linea = [], 0, 0, 0
+    try:
+        for linea, fila in filas:
+            try:
+                ficha = validar_fila(fila, fecha)
+                if ficha["id"] in existentes:
+                    raise ValueError(f"Ya existe una ficha con id {ficha['id']}.")
+            except ValueError as e:
+                informe.añadir(linea, e, fila)
+                continue
+            existentes.add(ficha["id"])
+            lote.append(ficha)
+            if len(lote) >= tamano_lote:
+                almacen.crear_lote(lote)
+                importadas, lotes, lote = importadas + len(lote), lotes + 1, []
+    except (UnicodeError, csv.Error) as e:
+        #El lector no puede seguir (p.ej. un archivo abierto sin abrir_texto): se guarda lo leído hasta
+        #aquí, como con el resto de lotes, y el resto del archivo queda rechazado en el informe
+        error_logger.error(f"Importación interrumpida tras la línea {linea}: {e}")
+        informe.añadir(linea + 1, ValueError(f"No se pudo leer el resto del archivo: {e}"), ValueError())
+    if lote:
+        almacen.crear_lote(lote)
+        importadas, lotes = importadas + len(lote), lotes + 1
+    app_logger.info(f"Importación: {importadas} fichas en {lotes} lotes, {informe.total} filas rechazadas.")
+    return {"importadas": importadas, "rechazadas": informe.total, "lotes": lotes}
+
+def abrir_texto(binario):
+    #Envuelve un flujo binario (p.ej. una subida de Flask) como texto; admite UTF-8 con o sin BOM.
+    #Los bytes que no son UTF-8 no lanzan UnicodeDecodeError: los lectores rechazan esas filas.
+    return io.TextIOWrapper(binario, encoding="utf-8-sig", errors="surrogateescape", newline="")
@@ -0,0 +1,224 @@
+import base64, json, unicodedata
+from bisect import bisect_left, bisect_right, insort
+
+#=== Índices en memoria sobre el almacén de fichas ===
+#Cada índice implementa reconstruir(fichas), insertar(ficha), insertar_lote(fichas),
+#actualizar(anterior, nueva) y eliminar(ficha). El almacén los llama tras cada carga y cada cambio (ver _AlmacenBase).
+
+#=== Claves de ordenación ===
+def _clave_texto(valor):
+    return str(valor or "").casefold()
+
+def _clave_edad(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return -1
+
+def _clave_fecha(valor):
+    #Las fichas del CLI usan "2025/10/30 11:34:39" y las de la web isoformat "2025-10-30T11:34:39.212099"
+    return str(valor or "").replace("/", "-").replace(" ", "T")
+
+CLAVES_ORDEN = {
+    "nombre": _clave_texto,
+    "edad": _clave_edad,
+    "ciudad": _clave_texto,
+    "fecha_creacion": _clave_fecha,
+}
+
+#=== Cursores ===
+def codificar_cursor(clave):
+    return base64.urlsafe_b64encode(json.dumps(clave, ensure_ascii=False).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor):
+    #Devuelve la clave (tupla) o None si el cursor no es válido.
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valor, id = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        return (valor, id)
+    except Exception:
+        return None
+
+#=== Orden mantenido incrementalmente ===
+class OrdenFichas:
+    """Lista ordenada de claves (valor, id) para un campo.
+
+    Se construye la primera vez que se pide una página y a partir de ahí solo se
+    inserta/borra la clave afectada por cada cambio (bisect), así que pedir una
+    página cuesta lo mismo con mil fichas que con un millón.
+    """
+
+    def __init__(self, campo):
+        self.campo = campo
+        self._clave_campo = CLAVES_ORDEN[campo]
+        self._claves = None #None = todavía sin construir
+
+    def clave(self, ficha):
+        return (self._clave_campo(ficha.get(self.campo)), ficha["id"])
+
+    #--- Mantenimiento ---
+    def reconstruir(self, fichas):
+        #Se construye de forma perezosa en la primera página pedida
+        self._claves = None
+
+    def insertar(self, ficha):
+        if self._claves is not None:
+            insort(self._claves, self.clave(ficha))
+
+    def insertar_lote(self, fichas):
+        #Un insort por ficha movería la lista entera cada vez: se añaden al final y se ordena una
+        #vez (timsort solo tiene que mezclar el tramo nuevo con el ya ordenado)
+        if self._claves is not None:
+            self._claves.extend(self.clave(f) for f in fichas)
+            self._claves.sort()
+
+    def eliminar(self, ficha):
+        if self._claves is not None:
+            clave = self.clave(ficha)
+            pos = bisect_left(self._claves, clave)
+            if pos < len(self._claves) and self._claves[pos] == clave:
+                del self._claves[pos]
+
+    def actualizar(self, anterior, nueva):
+        if self._claves is not None and self.clave(anterior) != self.clave(nueva):
+            self.eliminar(anterior)
+            self.insertar(nueva)
+
+    #--- Consulta ---
+    def _asegurar(self, por_id):
+        if self._claves is None:
+            self._claves = sorted(self.clave(f) for f in por_id.values())
+        return self._claves
+
+    def primeras(self, por_id, ids, cuantas):
+        #Las 'cuantas' primeras fichas en este orden de entre 'ids'. Recorre las claves ya ordenadas
+        #y para en cuanto las tiene: con muchas coincidencias no hace falta ordenarlas.
+        encontradas = []
+        for _, id in self._asegurar(por_id):
+            if id in ids:
+                encontradas.append(por_id[id])
+                if len(encontradas) >= cuantas:
+                    break
+        return encontradas
+
+    def paginar(self, por_id, por_pagina, pagina = 1, despues = None, antes = None, descendente = False):
+        """Devuelve un dict con las fichas de la página y los cursores para moverse.
+
+        'despues'/'antes' son claves (valor, id) de paginación por cursor; si no
+        se indican se usa el número de página.
+        """
+        claves = self._asegurar(por_id)
+        total = len(claves)
+        #Posiciones sobre la secuencia vista (ascendente o descendente)
+        if despues is not None:
+            inicio = total - bisect_left(claves, despues) if descendente else bisect_right(claves, despues)
+        elif antes is not None:
+            fin = total - bisect_right(claves, antes) if descendente else bisect_left(claves, antes)
+            inicio = max(0, fin - por_pagina)
+        else:
+            inicio = max(0, (pagina - 1) * por_pagina)
+        fin = min(total, inicio + por_pagina)
+        if descendente:
+            trozo = claves[total - fin:total - inicio][::-1]
+        else:
+            trozo = claves[inicio:fin]
+        return {
+            "fichas": [por_id[id] for _, id in trozo],
+            "total": total,
+            "pagina": inicio // por_pagina + 1,
+            "paginas": max(1, -(-total // por_pagina)),
+            "anterior": codificar_cursor(trozo[0]) if trozo and inicio > 0 else None,
+            "siguiente": codificar_cursor(trozo[-1]) if trozo and fin < total else None,
+        }
+
+#=== Búsqueda por texto ===
+def plegar(texto):
+    #Minúsculas y sin tildes: "Álvaro" y "alvaro" son la misma clave de búsqueda.
+    descompuesto = unicodedata.normalize("NFKD", str(texto or ""))
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+def _trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceBusqueda:
+    """Índice de trigramas sobre campos de texto (por defecto nombre y ciudad) para búsquedas por subcadena.
+
+    Un término de 3 o más letras solo revisa las fichas que contienen todos sus
+    trigramas; los más cortos recorren los valores ya plegados, sin tocar las fichas.
+    """
+
+    def __init__(self, campos = ("nombre", "ciudad")):
+        self.campos = tuple(campos)
+        self._textos = None #campo -> {id: texto plegado}. None = todavía sin construir
+        self._trigramas = None #campo -> {trigrama: set(ids)}
+
+    #--- Mantenimiento ---
+    def reconstruir(self, fichas):
+        #Como los órdenes, se construye en la primera búsqueda
+        self._textos = None
+        self._trigramas = None
+
+    def _construir(self, fichas):
+        self._textos = {campo: {} for campo in self.campos}
+        self._trigramas = {campo: {} for campo in self.campos}
+        for ficha in fichas:
+            self._añadir(ficha)
+
+    def _añadir(self, ficha):
+        for campo in self.campos:
+            texto = plegar(ficha.get(campo))
+            self._textos[campo][ficha["id"]] = texto
+            indice = self._trigramas[campo]
+            for tri in _trigramas(texto):
+                indice.setdefault(tri, set()).add(ficha["id"])
+
+    def _quitar(self, ficha):
+        for campo in self.campos:
+            texto = self._textos[campo].pop(ficha["id"], "")
+            indice = self._trigramas[campo]
+            for tri in _trigramas(texto):
+                ids = indice.get(tri)
+                if ids is not None:
+                    ids.discard(ficha["id"])
+                    if not ids:
+                        del indice[tri]
+
+    def insertar(self, ficha):
+        if self._textos is not None:
+            self._añadir(ficha)
+
+    def insertar_lote(self, fichas):
+        if self._textos is not None:
+            for ficha in fichas:
+                self._añadir(ficha)
+
+    def eliminar(self, ficha):
+        if self._textos is not None:
+            self._quitar(ficha)
+
+    def actualizar(self, anterior, nueva):
+        if self._textos is not None and any(anterior.get(c) != nueva.get(c) for c in self.campos):
+            self._quitar(anterior)
+            self._añadir(nueva)
+
+    #--- Consulta ---
+    def buscar(self, por_id, termino, campos = None):
+        #Devuelve el conjunto de ids cuyo campo (de 'campos') contiene 'termino', sin distinguir tildes ni mayúsculas.
+        if self._textos is None:
+            self._construir(por_id.values())
+        termino = plegar(termino.strip())
+        ids = set()
+        for campo in campos or self.campos:
+            textos = self._textos[campo]
+            if len(termino) < 3:
+                ids.update(id for id, texto in textos.items() if termino in texto)
+                continue
+            listas = [self._trigramas[campo].get(tri, ()) for tri in _trigramas(termino)]
+            candidatos = set(min(listas, key=len))
+            for lista in listas:
+                candidatos.intersection_update(lista)
+                if not candidatos:
+                    break
+            #Tener todos los trigramas no garantiza la subcadena ("abcxbcd" y "abcd"): se comprueba
+            ids.update(id for id in candidatos if termino in textos[id])
+        return ids
@@ -0,0 +1,167 @@
+import math, threading, time
+from gestion_fichas.logger_config import app_logger
+from config import (LOGIN_RAFAGA_USUARIO, LOGIN_POR_MINUTO_USUARIO, LOGIN_RAFAGA_IP, LOGIN_POR_MINUTO_IP,
+                    LOGIN_FALLOS_SIN_ESPERA, LOGIN_ESPERA_BASE_SEG, LOGIN_ESPERA_MAX_SEG,
+                    LOGIN_FALLOS_OLVIDO_SEG, LOGIN_PURGA_SEG, LOGIN_MAX_CLAVES)
+
+#=== Limitador de intentos de login ===
+#Cada intento de login cuesta un PBKDF2 completo. Antes de calcularlo se comprueba, solo con
+#aritmética en memoria, que ni el usuario ni la IP han agotado su cubo de intentos (token bucket)
+#ni están en espera por fallos seguidos (espera exponencial). Si no, se rechaza sin hashear.
+
+class _Cubo:
+    __slots__ = ("fichas", "actualizado", "fallos", "ultimo_fallo", "espera_hasta")
+
+    def __init__(self, capacidad, ahora):
+        self.fichas = float(capacidad)
+        self.actualizado = ahora
+        self.fallos = 0 #Fallos seguidos desde el último acierto
+        self.ultimo_fallo = 0.0
+        self.espera_hasta = 0.0
+
+class _Cubos:
+    """Cubos de un tipo de clave (usuario o IP) con la misma capacidad y ritmo de recarga."""
+
+    def __init__(self, capacidad, por_minuto, olvido_seg = LOGIN_FALLOS_OLVIDO_SEG):
+        self.capacidad = capacidad
+        self.ritmo = por_minuto / 60 #Fichas por segundo
+        self.olvido_seg = olvido_seg
+        self.cubos = {}
+
+    def _recargar(self, cubo, ahora):
+        cubo.fichas = min(self.capacidad, cubo.fichas + (ahora - cubo.actualizado) * self.ritmo)
+        cubo.actualizado = ahora
+
+    def espera(self, clave, ahora):
+        #Segundos que faltan para poder intentarlo (0 = se puede), sin consumir nada
+        cubo = self.cubos.get(clave)
+        if cubo is None:
+            return 0.0
+        self._recargar(cubo, ahora)
+        if cubo.espera_hasta > ahora:
+            return cubo.espera_hasta - ahora
+        if cubo.fichas < 1:
+            return (1 - cubo.fichas) / self.ritmo if self.ritmo else math.inf
+        return 0.0
+
+    def consumir(self, clave, ahora):
+        cubo = self.cubos.get(clave)
+        if cubo is None:
+            cubo = self.cubos[clave] = _Cubo(self.capacidad, ahora)
+        cubo.fichas -= 1
+
+    def resultado(self, clave, exito, ahora):
+        #Lleva la cuenta de fallos seguidos y fija la espera exponencial
+        cubo = self.cubos.get(clave)
+        if cubo is None:
+            return
+        if exito:
+            cubo.fallos = 0
+            cubo.espera_hasta = 0.0
+            return
+        if ahora - cubo.ultimo_fallo >= self.olvido_seg:
+            cubo.fallos = 0 #Hacía mucho del último fallo: se empieza de nuevo
+        cubo.fallos += 1
+        cubo.ultimo_fallo = ahora
+        if cubo.fallos > LOGIN_FALLOS_SIN_ESPERA:
+            espera = min(LOGIN_ESPERA_MAX_SEG, LOGIN_ESPERA_BASE_SEG * 2 ** (cubo.fallos - LOGIN_FALLOS_SIN_ESPERA - 1))
+            cubo.espera_hasta = ahora + espera
+
+    def _con_fallos(self, cubo, ahora):
+        return cubo.fallos and ahora - cubo.ultimo_fallo < self.olvido_seg
+
+    def purgar(self, ahora, max_claves):
+        #Fuera los cubos que ya se han rellenado, no están en espera y no llevan fallos recientes: no aportan nada.
+        #Los que tienen fallos se quedan, si no quien fuera al ritmo de recarga volvería siempre a la primera espera.
+        for clave in [c for c, cubo in self.cubos.items()
+                      if cubo.espera_hasta <= ahora and not self._con_fallos(cubo, ahora)
+                      and cubo.fichas + (ahora - cubo.actualizado) * self.ritmo >= self.capacidad]:
+            del self.cubos[clave]
+        #Si aun así hay demasiados (un ataque con muchas IPs), se quitan los más antiguos, primero los que no llevan fallos
+        if len(self.cubos) > max_claves:
+            antiguos = sorted(self.cubos, key=lambda c: (bool(self._con_fallos(self.cubos[c], ahora)), self.cubos[c].actualizado))[:len(self.cubos) - max_claves]
+            for clave in antiguos:
+                del self.cubos[clave]
+            return len(antiguos)
+        return 0
+
+class LimitadorLogin:
+    """Token bucket por usuario y por IP, con espera exponencial tras fallos seguidos del mismo usuario.
+
+    Uso: comprobar(usuario, ip) antes de verificar la contraseña (devuelve los segundos a
+    esperar o 0) y resultado(usuario, ip, exito) después.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.usuarios = _Cubos(LOGIN_RAFAGA_USUARIO, LOGIN_POR_MINUTO_USUARIO)
+        self.ips = _Cubos(LOGIN_RAFAGA_IP, LOGIN_POR_MINUTO_IP)
+        self._proxima_purga = time.monotonic() + LOGIN_PURGA_SEG
+        #Contadores
+        self.permitidos = 0
+        self.rechazados_usuario = 0
+        self.rechazados_ip = 0
+        self.exitos = 0
+        self.fallos = 0
+        self.expulsados = 0
+
+    @staticmethod
+    def _clave_usuario(username):
+        return str(username or "").strip().casefold()
+
+    def comprobar(self, username, ip):
+        ahora = time.monotonic()
+        usuario = self._clave_usuario(username)
+        with self._lock:
+            self._quizas_purgar(ahora)
+            espera_ip = self.ips.espera(ip, ahora)
+            if espera_ip:
+                self.rechazados_ip += 1
+                return espera_ip
+            espera_usuario = self.usuarios.espera(usuario, ahora)
+            if espera_usuario:
+                self.rechazados_usuario += 1
+                return espera_usuario
+            self.ips.consumir(ip, ahora)
+            self.usuarios.consumir(usuario, ahora)
+            self.permitidos += 1
+            return 0.0
+
+    def resultado(self, username, ip, exito):
+        ahora = time.monotonic()
+        usuario = self._clave_usuario(username)
+        with self._lock:
+            if exito:
+                self.exitos += 1
+            else:
+                self.fallos += 1
+            #La espera por fallos es solo por usuario: una IP compartida (NAT, proxy) no debe bloquear a
+            #todos sus usuarios por los fallos de uno; a la IP ya la frena su propio cubo.
+            self.usuarios.resultado(usuario, exito, ahora)
+
+    def _quizas_purgar(self, ahora):
+        if ahora < self._proxima_purga:
+            return
+        self._proxima_purga = ahora + LOGIN_PURGA_SEG
+        expulsados = self.ips.purgar(ahora, LOGIN_MAX_CLAVES) + self.usuarios.purgar(ahora, LOGIN_MAX_CLAVES)
+        if expulsados:
+            self.expulsados += expulsados
+            app_logger.warning(f"Limitador de login lleno: se descartan {expulsados} claves antiguas.")
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "permitidos": self.permitidos,
+                "rechazados_usuario": self.rechazados_usuario,
+                "rechazados_ip": self.rechazados_ip,
+                "exitos": self.exitos,
+                "fallos": self.fallos,
+                "claves_usuario": len(self.usuarios.cubos),
+                "claves_ip": len(self.ips.cubos),
+                "expulsados": self.expulsados,
+            }
+
+limitador_login = LimitadorLogin()
+
+def estadisticas_login():
+    return limitador_login.estadisticas()
@@ -1,9 +1,7 @@
-import logging, os
-from config import LOG_DIR, APP_LOG_FILE, ERROR_LOG_FILE, USER_LOG_FILE
+import atexit, logging, logging.handlers, os, queue
+from config import LOG_DIR, APP_LOG_FILE, ERROR_LOG_FILE, USER_LOG_FILE, LOG_ROTACION, LOG_MAX_BYTES, LOG_BACKUPS
 
 #=== Configuración de rutas ===
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-LOG_DIR = os.path.join(BASE_DIR, "..", "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
 #=== Rutas de los archivos de log ===
@@ -14,52 +12,77 @@ os.makedirs(LOG_DIR, exist_ok=True)
 #=== Formato general ===
 formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
 
-#=== HANDLERS ===
-#--- Mensajes generales ---
-app_handler = logging.FileHandler(APP_LOG_FILE, encoding="utf-8")
-app_handler.setLevel(logging.INFO)
-app_handler.setFormatter(formatter)
+#=== Escritura en segundo plano ===
+#Los loggers solo dejan el registro en una cola (QueueHandler, microsegundos). Un hilo
+#(QueueListener) lo saca y lo escribe en el archivo que toque, con rotación por tamaño
+#o diaria (LOG_ROTACION). Cada archivo filtra sus registros:
+#   app.log   -> logger "gestion_fichas" (INFO o más)
+#   error.log -> cualquier ERROR (también los de app_logger)
+#   user.log  -> logger "gestion_fichas.user"
+class _SoloLogger(logging.Filter):
+    def __init__(self, nombre):
+        super().__init__()
+        self.nombre = nombre
 
-#--- Errores ---
-error_handler = logging.FileHandler(ERROR_LOG_FILE, encoding="utf-8")
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(formatter)
+    def filter(self, record):
+        return record.name == self.nombre
 
-#--- Acciones del usuario ---
-user_handler = logging.FileHandler(USER_LOG_FILE, encoding="utf-8")
-user_handler.setLevel(logging.INFO)
-user_handler.setFormatter(formatter)
+def _handler_archivo(ruta, nivel, filtro = None):
+    if LOG_ROTACION == "diaria":
+        handler = logging.handlers.TimedRotatingFileHandler(ruta, when="midnight", backupCount=LOG_BACKUPS, encoding="utf-8")
+    else:
+        handler = logging.handlers.RotatingFileHandler(ruta, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+    handler.setLevel(nivel)
+    handler.setFormatter(formatter)
+    if filtro is not None:
+        handler.addFilter(filtro)
+    return handler
 
 #=== LOGGERS ===
-#--- Logger general ---
-app_logger = logging.getLogger("gestion_fichas")
+app_logger = logging.getLogger("gestion_fichas") #Logger general
+error_logger = logging.getLogger("gestion_fichas.error") #Logger de errores
+user_logger = logging.getLogger("gestion_fichas.user") #Logger de acciones del usuario
 app_logger.setLevel(logging.INFO)
-
-#Para evitare duplicidades de handlers
-if not app_logger.hasHandlers():
-    app_logger.addHandler(app_handler)
-    app_logger.addHandler(error_handler)
-    #app_logger.addHandler(user_handler)
-
-# --- Logger de errores ---
-error_logger = logging.getLogger("gestion_fichas.error")
 error_logger.setLevel(logging.ERROR)
-error_logger.addHandler(error_handler)
-error_logger.propagate = False  # 🔒 No propaga al padre
-
-# --- Logger de usuario ---
-user_logger = logging.getLogger("gestion_fichas.user")
 user_logger.setLevel(logging.INFO)
-user_logger.addHandler(user_handler)
+error_logger.propagate = False  # 🔒 No propaga al padre
 user_logger.propagate = False  # 🔒 Evita duplicación en app.log
 
-#=== Loggers secundarios ===
-error_logger = logging.getLogger("gestion_fichas.error")
-user_logger = logging.getLogger("gestion_fichas.user")
+def configurar_logging():
+    """Conecta los tres loggers a la cola y arranca el hilo escritor.
+
+    Es idempotente: si el módulo se vuelve a importar (recarga de Flask, otro nombre de
+    módulo) se reutiliza la cola ya montada en vez de añadir handlers duplicados.
+    """
+    listener = getattr(app_logger, "_listener_archivos", None)
+    if listener is not None:
+        return listener
+    cola = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        cola,
+        _handler_archivo(APP_LOG_FILE, logging.INFO, _SoloLogger(app_logger.name)),
+        _handler_archivo(ERROR_LOG_FILE, logging.ERROR),
+        _handler_archivo(USER_LOG_FILE, logging.INFO, _SoloLogger(user_logger.name)),
+        respect_handler_level=True,
+    )
+    handler_cola = logging.handlers.QueueHandler(cola)
+    for logger in (app_logger, error_logger, user_logger):
+        logger.handlers = [handler_cola]
+    listener.start()
+    app_logger._listener_archivos = listener
+    atexit.register(detener_logging)
+    return listener
+
+def detener_logging():
+    #Vacía la cola y cierra los archivos (se llama sola al salir)
+    listener = getattr(app_logger, "_listener_archivos", None)
+    if listener is not None:
+        app_logger._listener_archivos = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
 
-#Reutilizan los mismos handlers del logger principal
-error_logger.handlers = app_logger.handlers
-user_logger.handlers = app_logger.handlers
+configurar_logging()
 
 """#Nombre del archivo de log por fecha
 log_filename = os.path.join(LOG_DIR, f"log_{datetime.now().strftime('%Y-%m-%d')}.log")
@@ -0,0 +1,127 @@
+import bisect, functools, threading, time
+from contextlib import contextmanager
+
+#=== Métricas en memoria ===
+#Histogramas de latencia con cubos fijos: ocupan lo mismo con diez peticiones que con diez
+#millones, y de los cubos se sacan los percentiles (aproximados) y el formato de Prometheus.
+CUBOS_SEG = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PERCENTILES = (0.5, 0.95, 0.99)
+
+class Histograma:
+    __slots__ = ("limites", "cuentas", "total", "suma")
+
+    def __init__(self, limites = CUBOS_SEG):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1) #El último cubo es +Inf
+        self.total = 0
+        self.suma = 0.0
+
+    def observar(self, valor):
+        self.cuentas[bisect.bisect_left(self.limites, valor)] += 1
+        self.total += 1
+        self.suma += valor
+
+    def percentil(self, p):
+        #Interpolación lineal dentro del cubo donde cae el percentil
+        if not self.total:
+            return 0.0
+        objetivo = p * self.total
+        acumulado = 0
+        for i, cuenta in enumerate(self.cuentas):
+            if acumulado + cuenta >= objetivo and cuenta:
+                inferior = self.limites[i - 1] if i > 0 else 0.0
+                superior = self.limites[i] if i < len(self.limites) else self.limites[-1]
+                return inferior + (superior - inferior) * (objetivo - acumulado) / cuenta
+            acumulado += cuenta
+        return self.limites[-1]
+
+class RegistroMetricas:
+    """Histogramas por (nombre, etiquetas) y colectores que aportan valores de otros módulos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {} #nombre -> {etiquetas (tupla ordenada): Histograma}
+        self._ayudas = {}
+        self._colectores = []
+
+    def describir(self, nombre, ayuda):
+        self._ayudas[nombre] = ayuda
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._histogramas.setdefault(nombre, {})
+            histograma = serie.get(clave)
+            if histograma is None:
+                histograma = serie[clave] = Histograma()
+            histograma.observar(valor)
+
+    def registrar_colector(self, colector):
+        #colector() devuelve una lista de (nombre, tipo, ayuda, valor, etiquetas) que se leen al exportar
+        self._colectores.append(colector)
+
+    def resumen(self, nombre):
+        #{etiquetas: {"total", "media", "p50", "p95", "p99"}} para logs o pruebas
+        with self._lock:
+            return {clave: {"total": h.total, "media": h.suma / h.total if h.total else 0.0,
+                            **{f"p{int(p * 100)}": h.percentil(p) for p in PERCENTILES}}
+                    for clave, h in self._histogramas.get(nombre, {}).items()}
+
+    def exportar_prometheus(self):
+        lineas = []
+        with self._lock:
+            for nombre, serie in sorted(self._histogramas.items()):
+                lineas.append(f"# HELP {nombre} {self._ayudas.get(nombre, nombre)}")
+                lineas.append(f"# TYPE {nombre} histogram")
+                for clave, h in sorted(serie.items()):
+                    acumulado = 0
+                    for limite, cuenta in zip(list(h.limites) + ["+Inf"], h.cuentas):
+                        acumulado += cuenta
+                        lineas.append(f"{nombre}_bucket{_etiquetas(clave + (('le', limite),))} {acumulado}")
+                    lineas.append(f"{nombre}_sum{_etiquetas(clave)} {h.suma}")
+                    lineas.append(f"{nombre}_count{_etiquetas(clave)} {h.total}")
+                #Percentiles calculados aquí mismo, para consultarlos sin histogram_quantile()
+                lineas.append(f"# TYPE {nombre}_percentil gauge")
+                for clave, h in sorted(serie.items()):
+                    for p in PERCENTILES:
+                        lineas.append(f"{nombre}_percentil{_etiquetas(clave + (('percentil', p),))} {h.percentil(p)}")
+        vistos = set()
+        for colector in list(self._colectores):
+            for nombre, tipo, ayuda, valor, etiquetas in colector():
+                if nombre not in vistos:
+                    vistos.add(nombre)
+                    lineas.append(f"# HELP {nombre} {ayuda}")
+                    lineas.append(f"# TYPE {nombre} {tipo}")
+                lineas.append(f"{nombre}{_etiquetas(tuple(sorted(etiquetas.items())))} {valor}")
+        return "\n".join(lineas) + "\n"
+
+def _etiquetas(clave):
+    if not clave:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in clave) + "}"
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+metricas = RegistroMetricas()
+metricas.describir("gestion_fichas_peticion_segundos", "Duración de las peticiones HTTP por endpoint.")
+metricas.describir("gestion_fichas_operacion_segundos", "Duración de operaciones internas (carga, guardado, hashing, plantillas).")
+
+#=== Cronómetros ===
+@contextmanager
+def cronometro(operacion):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.observar("gestion_fichas_operacion_segundos", time.perf_counter() - inicio, operacion=operacion)
+
+def medido(operacion):
+    #Decorador: cronometra cada llamada a la función como 'operacion'
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with cronometro(operacion):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
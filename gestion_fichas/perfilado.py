@@ -0,0 +1,96 @@
+import cProfile, functools, os, pstats, random, threading, time
+from datetime import datetime
+from gestion_fichas.logger_config import app_logger, error_logger
+from config import PERFILADO_DIR, PERFILADO_FRACCION, PERFILADO_MAX_PERFILES
+
+#=== Perfilado bajo demanda ===
+#Una vista envuelta con perfilar() se ejecuta bajo cProfile si toca por muestreo (fracción de
+#peticiones) o si se pide explícitamente. Se guarda el .prof (para pstats/snakeviz) y un
+#.collapsed.txt con pilas "a;b;c microsegundos" para flamegraph.pl o speedscope.
+#Solo se perfila una petición a la vez y se conservan los últimos PERFILADO_MAX_PERFILES.
+_EN_CURSO = threading.Lock()
+_GUARDADOS_LOCK = threading.Lock()
+PROFUNDIDAD_MAX = 64
+
+def _nombre_funcion(funcion):
+    archivo, linea, nombre = funcion
+    if archivo == "~":
+        return nombre #Funciones internas, p.ej. "<built-in method time.sleep>"
+    return f"{nombre} ({os.path.basename(archivo)}:{linea})".replace(";", ",")
+
+def pilas_colapsadas(stats):
+    """Reconstruye pilas aproximadas a partir de las aristas llamante -> llamado de pstats.
+
+    cProfile no guarda pilas completas: el tiempo de cada función se reparte entre sus
+    llamantes en proporción al tiempo acumulado de cada arista. Devuelve {pila: microsegundos}.
+    """
+    llamados = {}
+    raices = []
+    for funcion, (_, _, _, acumulado, llamantes) in stats.stats.items():
+        if not llamantes:
+            raices.append(funcion)
+        for llamante, (_, _, _, acumulado_arista) in llamantes.items():
+            llamados.setdefault(llamante, []).append((funcion, acumulado_arista / acumulado if acumulado else 0.0))
+    pilas = {}
+    def recorrer(funcion, camino, fraccion):
+        propio = stats.stats[funcion][2] * fraccion
+        camino = camino + (funcion,)
+        if propio > 0:
+            clave = ";".join(_nombre_funcion(f) for f in camino)
+            pilas[clave] = pilas.get(clave, 0) + propio * 1e6
+        if len(camino) >= PROFUNDIDAD_MAX:
+            return
+        for hijo, parte in llamados.get(funcion, ()):
+            if hijo not in camino and fraccion * parte > 1e-6:
+                recorrer(hijo, camino, fraccion * parte)
+    for raiz in raices:
+        recorrer(raiz, (), 1.0)
+    return {pila: int(us) for pila, us in pilas.items() if int(us) > 0}
+
+def _guardar(perfil, nombre_vista, duracion_ms):
+    os.makedirs(PERFILADO_DIR, exist_ok=True)
+    base = os.path.join(PERFILADO_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{nombre_vista}_{duracion_ms:.0f}ms")
+    perfil.dump_stats(f"{base}.prof")
+    with open(f"{base}.collapsed.txt", "w", encoding="utf-8") as f:
+        for pila, us in sorted(pilas_colapsadas(pstats.Stats(perfil)).items()):
+            f.write(f"{pila} {us}\n")
+    _recortar()
+    return os.path.basename(base)
+
+def _recortar():
+    #Búfer circular en disco: solo se quedan los últimos PERFILADO_MAX_PERFILES perfiles
+    with _GUARDADOS_LOCK:
+        perfiles = sorted(n for n in os.listdir(PERFILADO_DIR) if n.endswith(".prof"))
+        for nombre in perfiles[:max(0, len(perfiles) - PERFILADO_MAX_PERFILES)]:
+            for ruta in (nombre, nombre[:-len(".prof")] + ".collapsed.txt"):
+                try:
+                    os.remove(os.path.join(PERFILADO_DIR, ruta))
+                except FileNotFoundError:
+                    pass
+
+def toca_muestrear(fraccion = PERFILADO_FRACCION):
+    return random.random() < fraccion
+
+def perfilar(vista, nombre_vista, decidir):
+    """Envuelve 'vista'. decidir() dice si esta petición se perfila (se llama dentro de la petición)."""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        if not decidir() or not _EN_CURSO.acquire(blocking=False):
+            return vista(*args, **kwargs)
+        try:
+            perfil = cProfile.Profile()
+            inicio = time.perf_counter()
+            perfil.enable()
+            try:
+                return vista(*args, **kwargs)
+            finally:
+                perfil.disable()
+                duracion_ms = (time.perf_counter() - inicio) * 1000
+                try:
+                    nombre = _guardar(perfil, nombre_vista, duracion_ms)
+                    app_logger.info(f"Perfil de {nombre_vista} guardado en {PERFILADO_DIR} ({nombre}, {duracion_ms:.1f} ms).")
+                except Exception as e:
+                    error_logger.exception(f"No se pudo guardar el perfil de {nombre_vista}: {e}")
+        finally:
+            _EN_CURSO.release()
+    return envoltura
@@ -0,0 +1,177 @@
+import heapq, os, sqlite3, threading, time
+from gestion_fichas.logger_config import app_logger
+from config import SESIONES_BACKEND, SESIONES_SQLITE_FILE, SESIONES_MAX, SESIONES_BARRIDO_SEG
+
+#=== Almacén de sesiones (token -> usuario) con caducidad ===
+#Ambas implementaciones tienen la misma interfaz: crear(token, user_id, expira),
+#obtener(token) -> user_id o None, eliminar(token) -> bool y barrer(). 'expira' es un
+#timestamp de time.time() para que valga igual en todos los procesos.
+#En memoria el "user_id" puede ser cualquier valor: el registro de session_manager guarda ahí los datos de la sesión.
+
+class SesionesMemoria:
+    """Sesiones de este proceso en un dict más un montículo (heap) ordenado por caducidad.
+
+    barrer() solo mira la cima del montículo: cada sesión caducada sale en O(log n) sin
+    recorrer las vigentes. Con 'maximo' sesiones vivas, la siguiente expulsa a la que antes caduca.
+    """
+
+    def __init__(self, maximo = SESIONES_MAX):
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._sesiones = {} #token -> (user_id, expira)
+        self._caducidades = [] #heap de (expira, token); puede tener entradas ya borradas
+        self.expulsadas = 0
+
+    def crear(self, token, user_id, expira):
+        with self._lock:
+            self._barrer(time.time())
+            while len(self._sesiones) >= self.maximo:
+                self._expulsar_primera()
+            self._sesiones[token] = (user_id, expira)
+            heapq.heappush(self._caducidades, (expira, token))
+
+    def obtener(self, token):
+        with self._lock:
+            sesion = self._sesiones.get(token)
+            if sesion is None:
+                return None
+            if sesion[1] < time.time():
+                del self._sesiones[token] #Borra la sesión expirada
+                return None
+            return sesion[0]
+
+    def eliminar(self, token):
+        return self.eliminar_valor(token) is not None
+
+    def eliminar_valor(self, token):
+        #Como eliminar(), pero devuelve el valor que tenía la sesión (o None)
+        with self._lock:
+            sesion = self._sesiones.pop(token, None)
+            return sesion[0] if sesion else None
+
+    def elementos(self):
+        #[(token, valor, expira)] de las sesiones vigentes, en orden de creación
+        with self._lock:
+            self._barrer(time.time())
+            return [(token, valor, expira) for token, (valor, expira) in self._sesiones.items()]
+
+    def barrer(self):
+        with self._lock:
+            return self._barrer(time.time())
+
+    def _barrer(self, ahora):
+        borradas = 0
+        while self._caducidades and self._caducidades[0][0] < ahora:
+            expira, token = heapq.heappop(self._caducidades)
+            sesion = self._sesiones.get(token)
+            if sesion is not None and sesion[1] == expira:
+                del self._sesiones[token]
+                borradas += 1
+        #Las entradas de sesiones cerradas a mano se quedan en el heap: si se acumulan, se rehace
+        if len(self._caducidades) > 2 * len(self._sesiones) + 64:
+            self._caducidades = [(s[1], t) for t, s in self._sesiones.items()]
+            heapq.heapify(self._caducidades)
+        return borradas
+
+    def _expulsar_primera(self):
+        expira, token = heapq.heappop(self._caducidades)
+        sesion = self._sesiones.get(token)
+        if sesion is not None and sesion[1] == expira:
+            del self._sesiones[token]
+            self.expulsadas += 1
+
+    def __len__(self):
+        return len(self._sesiones)
+
+ESQUEMA_SESIONES = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS sesiones (
+    token TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    expira REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones(expira);
+--Número de sesiones, llevado por triggers en la misma transacción que cada alta o baja (vale para todos
+--los procesos): comprobar el tope no tiene que contar la tabla. Se cuenta una vez al crearlo.
+CREATE TABLE IF NOT EXISTS sesiones_total (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    total INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO sesiones_total (id, total) SELECT 1, COUNT(*) FROM sesiones WHERE NOT EXISTS (SELECT 1 FROM sesiones_total);
+CREATE TRIGGER IF NOT EXISTS sesiones_alta AFTER INSERT ON sesiones BEGIN
+    UPDATE sesiones_total SET total = total + 1 WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS sesiones_baja AFTER DELETE ON sesiones BEGIN
+    UPDATE sesiones_total SET total = total - 1 WHERE id = 1;
+END;
+COMMIT;
+"""
+
+class SesionesSQLite:
+    """Sesiones compartidas por todos los procesos del servidor en una tabla SQLite (WAL).
+
+    El índice por 'expira' y el total que llevan los triggers hacen que el barrido y la expulsión
+    por tamaño no recorran la tabla. El barrido se hace como mucho cada SESIONES_BARRIDO_SEG, al crear sesiones.
+    """
+
+    def __init__(self, ruta = SESIONES_SQLITE_FILE, maximo = SESIONES_MAX):
+        self.ruta = ruta
+        self.maximo = maximo
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(ESQUEMA_SESIONES)
+        self._lock = threading.Lock()
+        self._proximo_barrido = 0.0
+        self.expulsadas = 0
+
+    def crear(self, token, user_id, expira):
+        ahora = time.time()
+        with self._lock, self._conexion:
+            self._conexion.execute("BEGIN IMMEDIATE")
+            if ahora >= self._proximo_barrido:
+                self._proximo_barrido = ahora + SESIONES_BARRIDO_SEG
+                self._conexion.execute("DELETE FROM sesiones WHERE expira < ?", (ahora,))
+            #Solo se borra (por el índice de 'expira') cuando el alta pasaría del tope
+            sobran = self._total() - self.maximo + 1
+            if sobran > 0:
+                self._conexion.execute("DELETE FROM sesiones WHERE token IN (SELECT token FROM sesiones ORDER BY expira LIMIT ?)", (sobran,))
+                self.expulsadas += sobran
+            #Upsert y no INSERT OR REPLACE: el REPLACE borra sin disparar el trigger de bajas y descuadraría el total
+            self._conexion.execute("INSERT INTO sesiones (token, user_id, expira) VALUES (?, ?, ?) "
+                                   "ON CONFLICT(token) DO UPDATE SET user_id = excluded.user_id, expira = excluded.expira", (token, user_id, expira))
+
+    def _total(self):
+        return self._conexion.execute("SELECT total FROM sesiones_total WHERE id = 1").fetchone()[0]
+
+    def obtener(self, token):
+        with self._lock:
+            fila = self._conexion.execute("SELECT user_id, expira FROM sesiones WHERE token = ?", (token,)).fetchone()
+            if fila is None:
+                return None
+            if fila[1] < time.time():
+                self._conexion.execute("DELETE FROM sesiones WHERE token = ?", (token,))
+                return None
+            return fila[0]
+
+    def eliminar(self, token):
+        with self._lock:
+            return self._conexion.execute("DELETE FROM sesiones WHERE token = ?", (token,)).rowcount > 0
+
+    def barrer(self):
+        with self._lock:
+            return self._conexion.execute("DELETE FROM sesiones WHERE expira < ?", (time.time(),)).rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._total()
+
+def crear_almacen_sesiones(backend = SESIONES_BACKEND):
+    #"memoria" (por defecto, cada proceso las suyas) o "sqlite" (compartidas entre procesos)
+    if backend == "sqlite":
+        app_logger.info(f"Sesiones compartidas en {SESIONES_SQLITE_FILE}.")
+        return SesionesSQLite()
+    if backend != "memoria":
+        app_logger.warning(f"SESIONES_BACKEND={backend} no reconocido. Se usan sesiones en memoria.")
+    return SesionesMemoria()
@@ -1,7 +1,8 @@
-import json, os
+import atexit, hashlib, json, os, threading, time
 from datetime import datetime
-from gestion_fichas.logger_config import app_logger
-from config import SESSION_FILE, DATA_DIR
+from gestion_fichas.logger_config import app_logger, error_logger
+from gestion_fichas.sesiones import SesionesMemoria
+from config import SESSION_FILE, DATA_DIR, SESSION_PERSISTIR_SEG, TOKEN_EXPIRATION_HOURS, SESIONES_MAX
 
 #BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 #DATA_DIR = os.path.join(BASE_DIR, "data")
@@ -9,33 +10,157 @@ from config import SESSION_FILE, DATA_DIR
 
 os.makedirs(DATA_DIR, exist_ok=True)
 
+#=== Registro de sesiones por token ===
+def clave_token(token):
+    #El registro (y SESSION_FILE) guarda el SHA-256 del token, nunca el token: quien lea el archivo no puede usarlo
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class RegistroSesiones:
+    """Sesiones abiertas (hash del token -> datos), una por usuario conectado.
+
+    Se guardan en el almacén con caducidad de gestion_fichas.sesiones: las caducadas se
+    purgan al iniciar y consultar sesiones y nunca hay más de 'maximo'. Si 'persistir_seg' > 0,
+    un hilo vuelca el registro a SESSION_FILE como mucho una vez cada 'persistir_seg' segundos
+    (y al salir), de modo que muchos logins/logouts seguidos cuestan una sola escritura.
+    """
+
+    def __init__(self, ruta = SESSION_FILE, persistir_seg = SESSION_PERSISTIR_SEG, maximo = SESIONES_MAX):
+        self.ruta = ruta
+        self.persistir_seg = persistir_seg
+        self._lock = threading.Lock()
+        self._sesiones = SesionesMemoria(maximo) #clave_token -> datos, con su caducidad
+        self._cambios = False
+        self._despertar = threading.Event()
+        self._hilo = None
+        if persistir_seg > 0:
+            for clave, datos in self._leer().items():
+                self._sesiones.crear(clave, datos, datos["expira"])
+            atexit.register(self.volcar)
+
+    #--- Persistencia ---
+    def _leer(self):
+        if not os.path.exists(self.ruta):
+            return {}
+        try:
+            with open(self.ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            error_logger.error(f"No se pudo leer {self.ruta}: {e}. Se empieza sin sesiones.")
+            return {}
+        if "token" in datos:
+            #Formato antiguo: una única sesión global
+            datos = {datos["token"]: datos}
+        ahora = time.time()
+        sesiones = {}
+        for clave, sesion in datos.items():
+            if not isinstance(sesion, dict) or sesion.get("expira", ahora) < ahora:
+                continue
+            if "token" in sesion:
+                #Archivos anteriores guardaban el token en claro: se pasa a su hash y no se vuelve a escribir
+                sesion = dict(sesion)
+                clave = clave_token(sesion.pop("token"))
+            sesion.setdefault("expira", ahora + TOKEN_EXPIRATION_HOURS * 3600)
+            sesiones[clave] = sesion
+        return sesiones
+
+    def volcar(self):
+        #Escribe el registro si ha cambiado desde el último volcado (temporal + rename).
+        with self._lock:
+            if not self._cambios:
+                return
+            copia = {clave: datos for clave, datos, _ in self._sesiones.elementos()}
+            self._cambios = False
+        try:
+            tmp = f"{self.ruta}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(copia, f, indent=4)
+            os.replace(tmp, self.ruta)
+        except OSError as e:
+            error_logger.exception(f"Error guardando las sesiones en {self.ruta}: {e}")
+            with self._lock:
+                self._cambios = True
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait()
+            time.sleep(self.persistir_seg) #Se juntan los cambios de este intervalo
+            self._despertar.clear()
+            self.volcar()
+
+    def _marcar_cambio(self):
+        self._cambios = True
+        if self.persistir_seg <= 0:
+            return
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="sesiones", daemon=True)
+            self._hilo.start()
+        self._despertar.set()
+
+    #--- Operaciones ---
+    def iniciar(self, usuario, token):
+        ahora = datetime.now()
+        datos = {
+            "usuario": usuario["username"],
+            "rol": usuario["role"],
+            "inicio": ahora.isoformat(),
+            "expira": ahora.timestamp() + TOKEN_EXPIRATION_HOURS * 3600,
+        }
+        with self._lock:
+            self._sesiones.crear(clave_token(token), datos, datos["expira"])
+            self._marcar_cambio()
+        return dict(datos, token = token)
+
+    def obtener(self, token):
+        datos = self._sesiones.obtener(clave_token(token))
+        return dict(datos) if datos else None
+
+    def ultima(self):
+        #(clave, datos) de la última sesión iniciada que sigue abierta, o None
+        elementos = self._sesiones.elementos()
+        if not elementos:
+            return None
+        clave, datos, _ = elementos[-1]
+        return clave, dict(datos)
+
+    def cerrar(self, token):
+        return self.cerrar_clave(clave_token(token))
+
+    def cerrar_clave(self, clave):
+        with self._lock:
+            datos = self._sesiones.eliminar_valor(clave)
+            if datos is not None:
+                self._marcar_cambio()
+            return datos
+
+    def __len__(self):
+        return len(self._sesiones)
+
+_REGISTRO = RegistroSesiones()
+
 def iniciar_sesion(usuario, token):
-    #Guarda la sesión actual en un archivo JSON
-    session_data = {
-        "usuario": usuario["username"],
-        "rol": usuario["role"],
-        "token": token,
-        "inicio": datetime.now().isoformat()
-    }
-    with open(SESSION_FILE, "w", encoding="utf-8") as f:
-        json.dump(session_data, f, indent=4)
+    #Registra la sesión de este token (sin escribir en disco en este momento)
+    session_data = _REGISTRO.iniciar(usuario, token)
     app_logger.info(f"Sesión iniciada para el usuario: {usuario['username']}.")
     return session_data
 
+def obtener_sesion(token):
+    #Datos de la sesión de ese token, o None
+    return _REGISTRO.obtener(token)
+
 def obtener_sesion_actual():
-    #Devuelve los datos de la sesión actual (si existe)
-    if not os.path.exists(SESSION_FILE):
-        return None
-    with open(SESSION_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
-    
-def cerrar_sesion():
-    #Elimina la sesión actual
-    if os.path.exists(SESSION_FILE):
-        with open(SESSION_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            usuario = data.get("usuario")
-        os.remove(SESSION_FILE)
-        app_logger.info(f"Sesión cerrada para el usuario: {usuario}")
+    #Devuelve los datos de la última sesión iniciada (si existe). Para la consola, donde hay una sola.
+    ultima = _REGISTRO.ultima()
+    return ultima[1] if ultima else None
+
+def cerrar_sesion(token = None):
+    #Elimina la sesión de ese token. Sin token se cierra la última iniciada (uso desde consola).
+    if token is not None:
+        data = _REGISTRO.cerrar(token)
+    else:
+        ultima = _REGISTRO.ultima()
+        data = _REGISTRO.cerrar_clave(ultima[0]) if ultima else None
+    if data:
+        app_logger.info(f"Sesión cerrada para el usuario: {data.get('usuario')}")
     else:
-        app_logger.warning("Intento de cierre de sesión sin sesión activa.")
\ No newline at end of file
+        app_logger.warning("Intento de cierre de sesión sin sesión activa.")
+    return data
@@ -1,7 +1,13 @@
-import os, json, uuid, secrets, hashlib, hmac
+import os, uuid, secrets, hmac, threading, time
 from datetime import datetime, timedelta
 from gestion_fichas.logger_config import app_logger, error_logger, user_logger
-from config import USUARIOS_FILE, DEFAULT_ROLE, ADMIN_ROLE
+from gestion_fichas.almacen import _firma_archivo, _escribir_atomico
+from gestion_fichas.codec import leer_archivo
+from gestion_fichas.hashing import pbkdf2
+from gestion_fichas.sesiones import crear_almacen_sesiones
+from gestion_fichas.metricas import medido
+from config import (USUARIOS_FILE, DEFAULT_ROLE, ADMIN_ROLE, STORAGE_BACKEND, SQLITE_FILE, USUARIOS_REVALIDAR_SEG, HASH_NAME, HASH_ITERATIONS,
+                    TOKEN_EXPIRATION_HOURS)
 
 #Rutas
 #BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -9,153 +15,342 @@ from config import USUARIOS_FILE, DEFAULT_ROLE, ADMIN_ROLE
 #os.makedirs(DATA_DIR, exist_ok=True)
 #USUARIOS_FILE = os.path.join(DATA_DIR, "usuarios.json")
 
-#Configuración de hashing
-HASH_NAME = "sha256"
-ITERATIONS = 200_000
+#Configuración de hashing (parámetros actuales, ver config.py)
+ITERATIONS = HASH_ITERATIONS
+#Los usuarios creados antes de guardar parámetros por usuario usaban estos
+HASH_NAME_LEGADO = "sha256"
+ITERATIONS_LEGADO = 200_000
+CAMPOS_PRIVADOS = ("salt", "password_hash", "hash_name", "iterations") #No salen de este módulo en los datos públicos
 SALT_SIZE = 16 #bytes
-TOKEN_EXPIRATION_HOURS = 12 #duración de la sesión (ajustable)
 
 #=== Utilidades de hashing ===
 def _generar_salt():
     return secrets.token_bytes(SALT_SIZE)
 
-def _hash_password(password: str, salt:bytes) -> str:
+def _hash_password(password: str, salt:bytes, hash_name: str = HASH_NAME, iterations: int = ITERATIONS) -> str:
     #Devuelve hex string del hash pbkdf2
+    #Se calcula en el pool de hashing; lanza HashingOcupado si está lleno
     pw = password.encode("utf-8")
-    dk = hashlib.pbkdf2_hmac(HASH_NAME, pw, salt, ITERATIONS)
+    dk = pbkdf2(hash_name, pw, salt, iterations)
     return dk.hex()
 
-def _verificar_password(password: str, salt: bytes, stored_hash_hex: str) -> bool:
-    candidate = _hash_password(password, salt)
+def _verificar_password(password: str, salt: bytes, stored_hash_hex: str, hash_name: str = HASH_NAME, iterations: int = ITERATIONS) -> bool:
+    candidate = _hash_password(password, salt, hash_name, iterations)
     #compare_digest para evitar timing attacks
     return hmac.compare_digest(candidate, stored_hash_hex)
 
+def _parametros_hash(user):
+    #(algoritmo, iteraciones) con los que se calculó el hash guardado del usuario
+    return user.get("hash_name", HASH_NAME_LEGADO), int(user.get("iterations", ITERATIONS_LEGADO))
+
+def _verificar_usuario(user, password):
+    return _verificar_password(password, bytes.fromhex(user["salt"]), user["password_hash"], *_parametros_hash(user))
+
+def _credenciales(password):
+    #Campos de contraseña de un usuario con salt nuevo y los parámetros actuales
+    salt = _generar_salt()
+    return {
+        "salt": salt.hex(), #Almacenamos salt en hex para serializar
+        "password_hash": _hash_password(password, salt),
+        "hash_name": HASH_NAME,
+        "iterations": ITERATIONS,
+    }
+
+def _necesita_rehash(user):
+    return _parametros_hash(user) != (HASH_NAME, ITERATIONS)
+
 #=== IO usuarios ===
+#Con STORAGE_BACKEND = "sqlite" los usuarios se leen y guardan en la tabla usuarios de SQLITE_FILE.
+@medido("cargar_usuarios")
 def cargar_usuarios():
+    #Copia editable de la lista de usuarios, servida desde el directorio en memoria (sin leer el archivo
+    #salvo que haya cambiado). Para guardar cambios, pasar la lista a guardar_usuarios().
+    return _DIRECTORIO.listar()
+
+@medido("leer_usuarios_disco")
+def _leer_usuarios():
+    if STORAGE_BACKEND == "sqlite":
+        from gestion_fichas.almacen_sqlite import cargar_usuarios_sqlite
+        return cargar_usuarios_sqlite()
     if not os.path.exists(USUARIOS_FILE):
         return []
     try:
-        with open(USUARIOS_FILE, "r", encoding = "utf-8") as f:
-            return json.load(f)
+        return leer_archivo(USUARIOS_FILE)
     except Exception as e:
         error_logger.exception(f"Error cargando usuarios: {e}")
         return []
 
 def guardar_usuarios(usuarios):
+    #Si la escritura falla se relanza el error: el directorio en memoria solo cambia cuando lo nuevo ya está en disco
     try:
-        with open(USUARIOS_FILE, "w", encoding = "utf-8") as f:
-            json.dump(usuarios, f, ensure_ascii=False, indent = 4)
-        app_logger.info(f"Guardados {len(usuarios)} usuarios.")
+        if STORAGE_BACKEND == "sqlite":
+            from gestion_fichas.almacen_sqlite import guardar_usuarios_sqlite
+            guardar_usuarios_sqlite(usuarios)
+        else:
+            #Temporal + rename: un corte a mitad deja el usuarios.json anterior, no uno truncado
+            _escribir_atomico(USUARIOS_FILE, usuarios)
     except Exception as e:
         error_logger.exception(f"Error guardando usuarios: {e}")
+        raise
+    _DIRECTORIO.tras_guardar(usuarios)
+    app_logger.info(f"Guardados {len(usuarios)} usuarios.")
+
+#=== Directorio de usuarios en memoria ===
+def _firma_usuarios():
+    #Con SQLite los cambios pueden quedar en el archivo -wal, así que se miran los dos
+    if STORAGE_BACKEND == "sqlite":
+        return (_firma_archivo(SQLITE_FILE), _firma_archivo(f"{SQLITE_FILE}-wal"))
+    return _firma_archivo(USUARIOS_FILE)
+
+def _clave_username(username):
+    #Los nombres de usuario no distinguen mayúsculas: "Admin" y "admin" son el mismo
+    return str(username or "").strip().casefold()
+
+class DirectorioUsuarios:
+    """Usuarios en memoria indexados por id y por nombre de usuario (dicts, búsquedas O(1)).
+
+    Se vuelven a leer solo si el archivo cambia en disco, y esa comprobación (un stat)
+    se hace como mucho cada USUARIOS_REVALIDAR_SEG; guardar_usuarios() lo mantiene al día
+    al momento, así que login y verificar_token no tocan el disco.
+    """
+
+    def __init__(self, revalidar_seg = USUARIOS_REVALIDAR_SEG):
+        self._lock = threading.RLock()
+        self._por_id = None #id -> usuario, en el mismo orden que en el archivo
+        self._por_nombre = {} #username plegado -> usuario
+        self._firma = None
+        self.revalidar_seg = revalidar_seg
+        self._proxima_revision = 0.0
+
+    def _indexar(self, usuarios):
+        self._por_id = {u["id"]: u for u in usuarios}
+        self._por_nombre = {}
+        for u in usuarios:
+            #Si hubiera nombres repetidos se queda el primero, como hacía _buscar_por_username
+            self._por_nombre.setdefault(_clave_username(u.get("username")), u)
+
+    def _asegurar_cargado(self):
+        ahora = time.monotonic()
+        if self._por_id is not None and ahora < self._proxima_revision:
+            return
+        self._proxima_revision = ahora + self.revalidar_seg
+        firma = _firma_usuarios()
+        if self._por_id is None or firma != self._firma:
+            self._indexar(_leer_usuarios())
+            self._firma = firma
+
+    def tras_guardar(self, usuarios):
+        with self._lock:
+            self._indexar([dict(u) for u in usuarios])
+            self._firma = _firma_usuarios()
+            self._proxima_revision = time.monotonic() + self.revalidar_seg
+
+    def invalidar(self):
+        with self._lock:
+            self._por_id = None
+
+    def calentar(self):
+        #Carga e indexa los usuarios antes de la primera petición. Devuelve cuántos hay.
+        with self._lock:
+            self._asegurar_cargado()
+            return len(self._por_id)
+
+    def listar(self):
+        with self._lock:
+            self._asegurar_cargado()
+            return [dict(u) for u in self._por_id.values()]
+
+    def obtener(self, id):
+        #Copia editable del usuario o None
+        with self._lock:
+            self._asegurar_cargado()
+            usuario = self._por_id.get(id)
+            return dict(usuario) if usuario else None
+
+    def obtener_por_username(self, username):
+        #Copia editable del usuario con ese nombre (sin distinguir mayúsculas) o None
+        with self._lock:
+            self._asegurar_cargado()
+            usuario = self._por_nombre.get(_clave_username(username))
+            return dict(usuario) if usuario else None
+
+    def añadir(self, usuario):
+        #Alta con la comprobación de nombre repetido dentro del lock. Lanza ValueError si ya existe.
+        with self._lock:
+            self._asegurar_cargado()
+            if _clave_username(usuario.get("username")) in self._por_nombre:
+                raise ValueError("El nombre del usuario ya existe.")
+            guardar_usuarios(list(self._por_id.values()) + [usuario])
+
+    #Los cambios se preparan sobre una copia: guardar_usuarios() reindexa el directorio solo si la escritura va bien
+    def actualizar(self, usuario):
+        with self._lock:
+            self._asegurar_cargado()
+            if usuario.get("id") not in self._por_id:
+                return False
+            usuarios = dict(self._por_id)
+            usuarios[usuario["id"]] = dict(usuario)
+            guardar_usuarios(list(usuarios.values()))
+            return True
+
+    def cambiar_credenciales(self, id, credenciales, hash_anterior):
+        #Pone 'credenciales' al usuario solo si su hash sigue siendo 'hash_anterior', comprobándolo con el lock
+        #tomado: si entretanto ha cambiado la contraseña, no se pisa. Devuelve True si se guardó.
+        with self._lock:
+            self._asegurar_cargado()
+            actual = self._por_id.get(id)
+            if actual is None or actual.get("password_hash") != hash_anterior:
+                return False
+            return self.actualizar({**actual, **credenciales})
+
+    def eliminar(self, id):
+        with self._lock:
+            self._asegurar_cargado()
+            usuario = self._por_id.get(id)
+            if usuario is not None:
+                guardar_usuarios([u for u in self._por_id.values() if u["id"] != id])
+            return usuario
+
+_DIRECTORIO = DirectorioUsuarios()
+
+def obtener_usuario_por_id(id):
+    return _DIRECTORIO.obtener(id)
+
+def obtener_usuario_por_username(username):
+    return _DIRECTORIO.obtener_por_username(username)
+
+def actualizar_usuario(usuario):
+    #Sustituye el usuario con el mismo id. Devuelve False si no existe.
+    return _DIRECTORIO.actualizar(usuario)
+
+def eliminar_usuario_por_id(id):
+    #Devuelve el usuario eliminado o None si no existía.
+    return _DIRECTORIO.eliminar(id)
+
+def calentar_usuarios():
+    return _DIRECTORIO.calentar()
 
 #=== Funciones Principales ===
 def _buscar_por_username(usuarios, username:str):
-    username = username.strip().lower()
+    #Para las funciones que trabajan sobre una lista ya cargada; si no, usar obtener_usuario_por_username().
+    username = _clave_username(username)
     for u in usuarios:
-        if u["username"].lower() == username:
+        if _clave_username(u["username"]) == username:
             return u
     return None
 
+def _publico(usuario):
+    return {k: v for k, v in usuario.items() if k not in CAMPOS_PRIVADOS}
+
 def registrar_usuario(username: str, password: str, role: str = "editor") -> dict:
     #Crea un usuario nuevo. Devuelve el usuario creado (sin password claro) o lanza ValueError
-    usuarios = cargar_usuarios()
-    if _buscar_por_username(usuarios, username):
+    if _DIRECTORIO.obtener_por_username(username):
         raise ValueError("El nombre del usuario ya existe.")
-    salt = _generar_salt()
-    hash_hex = _hash_password(password, salt)
     user = {
         "id": str(uuid.uuid4()),
         "username": username,
-        "salt": salt.hex(), #Almacenamos salt en hex para serializar
-        "password_hash": hash_hex,
+        **_credenciales(password),
         "role": role,
         "created_at":datetime.now().isoformat()
     }
-    usuarios.append(user)
-    guardar_usuarios(usuarios)
+    _DIRECTORIO.añadir(user)
     user_logger.info(f"Usuario registrado: {username} (role={role})")
-    return {k: v for k, v in user.items() if k not in ("salt", "password_hash")}
+    return _publico(user)
 
-_SESSIONS = {} #Sessions in memory: token -> {user_id, expires_at}
+_SESIONES = crear_almacen_sesiones() #token -> user_id con caducidad (ver gestion_fichas.sesiones)
 
 def autenticar_usuario(username: str, password: str):
     """Comprueba credenciales y devuelve (usuario_publico, token) si son válidas."""
-    usuarios = cargar_usuarios()
-    user = _buscar_por_username(usuarios, username)
+    user = _DIRECTORIO.obtener_por_username(username)
     if not user:
         return None
-    salt = bytes.fromhex(user["salt"])
-    if not _verificar_password(password, salt, user["password_hash"]):
+    if not _verificar_usuario(user, password):
         return None
-    #Generar token y guardar sesion en memoria
+    if _necesita_rehash(user):
+        _rehacer_hash(user, password)
+    #Generar token y guardar sesion
     token = secrets.token_urlsafe(32)
     expires_at = datetime.now() + timedelta(hours = TOKEN_EXPIRATION_HOURS)
-    _SESSIONS[token] = {"user_id": user["id"], "expires_at": expires_at}
+    _SESIONES.crear(token, user["id"], expires_at.timestamp())
     user_logger.info(f"Usuario autenticado: {username}")
     #Devolvemos token y datos públicos del usuario
-    public = {k: v for k, v in user.items() if k not in ("salt", "password_hash")}
-    return public, token
+    return _publico(user), token
+
+def _rehacer_hash(user, password):
+    #Tras un login correcto se aprovecha la contraseña en claro para pasar a los parámetros actuales.
+    #Si falla (p.ej. pool de hashing ocupado) el login sigue adelante y se reintenta en el siguiente.
+    #El hash nuevo se calcula fuera del lock; al guardar se comprueba que nadie ha cambiado la contraseña mientras tanto
+    anteriores = _parametros_hash(user)
+    try:
+        if _DIRECTORIO.cambiar_credenciales(user["id"], _credenciales(password), user["password_hash"]):
+            user_logger.info(f"Hash de {user['username']} actualizado de {anteriores} a {(HASH_NAME, ITERATIONS)}.")
+        else:
+            app_logger.info(f"No se actualiza el hash de {user['username']}: su contraseña cambió durante el login.")
+    except Exception as e:
+        app_logger.warning(f"No se pudo actualizar el hash de {user['username']}: {e}")
+
+def _poner_password(user, new_password, old_password = None, intentos = 3):
+    #Guarda solo los campos de contraseña con cambiar_credenciales (compare-and-set sobre el hash leído), así no se
+    #pisa un cambio de rol o de nombre hecho a la vez. Si el hash cambió entretanto (otro cambio, o el rehash de un
+    #login) se relee el usuario y, si se dio 'old_password', se vuelve a comprobar contra lo nuevo.
+    credenciales = _credenciales(new_password)
+    for _ in range(intentos):
+        if _DIRECTORIO.cambiar_credenciales(user["id"], credenciales, user["password_hash"]):
+            return True
+        user = _DIRECTORIO.obtener(user["id"])
+        if user is None or (old_password is not None and not _verificar_usuario(user, old_password)):
+            return False
+    return False
 
 def verificar_token(token: str):
     #Devuelve user public si token válido, sino None
-    ses = _SESSIONS.get(token)
-    if not ses:
-        return None
-    if ses["expires_at"] < datetime.now():
-        del _SESSIONS[token] #Borra la sesión expirada
+    user_id = _SESIONES.obtener(token) #None si no existe o ha caducado
+    if not user_id:
         return None
-    usuarios = cargar_usuarios() #Cargamos usuario
-    for u in usuarios:
-        if u["id"] == ses["user_id"]:
-            return {k: v for k, v in u.items() if k not in ("salt", "password_hash")}
-    return None
+    usuario = _DIRECTORIO.obtener(user_id) #Desde memoria, sin leer el archivo
+    return _publico(usuario) if usuario else None
 
 def logout(token: str):
-    #Se elimina la sesión en memoria (logout)
-    if token in _SESSIONS:
-        del _SESSIONS[token]
+    #Se elimina la sesión (logout)
+    if _SESIONES.eliminar(token):
         user_logger.info(f"Logout session token = {token}")
         return True
     return False
 
 def cambiar_pass_propio(username: str, old_password: str, new_password: str) -> bool:
     """Permite que un usuario cambie su propia contraseña."""
-    usuarios = cargar_usuarios()
-    user = _buscar_por_username(usuarios, username)
+    user = _DIRECTORIO.obtener_por_username(username)
     if not user:
         return False
-    salt = bytes.fromhex(user["salt"])
-    if not _verificar_password(old_password, salt, user["password_hash"]):
+    if not _verificar_usuario(user, old_password):
+        return False
+    if not _poner_password(user, new_password, old_password):
         return False
-    new_salt = _generar_salt()
-    user["salt"] = new_salt.hex()
-    user["password_hash"] = _hash_password(new_password, new_salt)
-    guardar_usuarios(usuarios)
     user_logger.info(f"Usuario {username} cambió su contraseña.")
     return True
 
+def _hay_usuarios():
+    if STORAGE_BACKEND == "sqlite":
+        return bool(_leer_usuarios())
+    return os.path.exists(USUARIOS_FILE) and os.path.getsize(USUARIOS_FILE) > 0
+
 def verificar_o_crear_admin_inicial():
     #Comprobar si hay usuarios. Si no, crear admin inicial.
-    if not os.path.exists(USUARIOS_FILE) or os.path.getsize(USUARIOS_FILE) == 0:
+    if not _hay_usuarios():
         print("\n=== No se han encontrado usuarios. Creando usuario administrador inicial===\n")
         username = input("Elige un nombre de usuario administrador: ").strip()
         password = input("Contraseña (mínimo 6 caracteres): ").strip()
         if len(password) < 6:
             print("La contraseña es demasiado corta. Inténtalo de nuevo.")
             return        
-        salt = _generar_salt()
-        hash_hex = _hash_password(password, salt)
         admin = {
             "id": str(uuid.uuid4()),
             "username": username,
-            "salt": salt.hex(),
-            "password_hash": hash_hex,
+            **_credenciales(password),
             "role": "admin",
             "created_at": datetime.now().isoformat()
             }
-        with open(USUARIOS_FILE, "w", encoding="utf-8") as f:
-            json.dump([admin], f, ensure_ascii=False, indent=4)
+        guardar_usuarios([admin])
         print(f"Usuario administrador '{username}' creado con éxito.")
         user_logger.info(f"Usuario administrador inicial creado: {username}")
         return admin
@@ -237,13 +432,10 @@ def cambiar_rol_admin(current_user):
 
 def cambiar_pass_usuario_admin(username: str, new_password: str) -> bool:
     """Permite a un administrador cambiar la contraseña de otro usuario."""
-    usuarios = cargar_usuarios()
-    user = _buscar_por_username(usuarios, username)
+    user = _DIRECTORIO.obtener_por_username(username)
     if not user:
         return False
-    new_salt = _generar_salt()
-    user["salt"] = new_salt.hex()
-    user["password_hash"] = _hash_password(new_password, new_salt)
-    guardar_usuarios(usuarios)
+    if not _poner_password(user, new_password):
+        return False
     user_logger.info(f"Contraseña de {username} actualizada por un administrador.")
     return True
@@ -1,31 +1,46 @@
 from datetime import datetime
 
-#Funciones
-def pedir_nombre():
-    nombre = input ("Introduce tu nombre: ").strip()
+#=== Validaciones ===
+#Las mismas reglas sirven para las preguntas por consola y para la importación masiva.
+#Devuelven el valor limpio o lanzan ValueError con el mensaje para el usuario.
+def validar_nombre(nombre):
+    nombre = str(nombre or "").strip()
     #Para asegurar que un humano introduce un nombre con caracteres.
-    while nombre.isdigit() or nombre == "":
-        print("Has escrito un número en vez de un nombre o no has escrito nada.")
-        nombre = input("Introduce tu nombre: ").strip()
+    if nombre.isdigit() or nombre == "":
+        raise ValueError("Has escrito un número en vez de un nombre o no has escrito nada.")
     return nombre
 
-def pedir_edad():
-    edad = input ("Introduce tu edad: ").strip()
-    #Nos aseguramos que un humano ha introducido un número válido para su edad.
-    while not edad.isdigit() or int(edad) <= 0:
-        print("No has introducido un número válido.")
-        edad = input ("Introduce tu edad: ").strip()
+def validar_edad(edad):
+    edad = str(edad if edad is not None else "").strip()
+    #Nos aseguramos que se ha introducido un número válido para la edad.
+    if not edad.isdigit() or int(edad) <= 0:
+        raise ValueError("No has introducido un número válido.")
     #Con nombre y ciudad no hace falta hacer esto porque ya se guarda como una cadena de caracteres.
-    edad = int (edad)
-    return edad  
+    return int(edad)
 
-def pedir_ciudad():
-    ciudad = input ("Introduce tu ciudad: ").strip()
-    #Nos asegururamos que un humano ha introducido un nombre válido y no un número.
-    while ciudad.isdigit() or ciudad == "":
-        print("Has escrito un número en vez de una ciudad o no has escrito nada.")
-        ciudad = input("Introduce tu ciudad: ").strip()
+def validar_ciudad(ciudad):
+    ciudad = str(ciudad or "").strip()
+    #Nos asegururamos que se ha introducido un nombre válido y no un número.
+    if ciudad.isdigit() or ciudad == "":
+        raise ValueError("Has escrito un número en vez de una ciudad o no has escrito nada.")
     return ciudad
 
+#Funciones
+def _pedir(mensaje, validar):
+    while True:
+        try:
+            return validar(input(mensaje))
+        except ValueError as e:
+            print(e)
+
+def pedir_nombre():
+    return _pedir("Introduce tu nombre: ", validar_nombre)
+
+def pedir_edad():
+    return _pedir("Introduce tu edad: ", validar_edad) #Devuelve un int
+
+def pedir_ciudad():
+    return _pedir("Introduce tu ciudad: ", validar_ciudad)
+
 def obtener_fecha():
-    return datetime.now().strftime("%Y/%m/%d %H:%M:%S")
\ No newline at end of file
+    return datetime.now().strftime("%Y/%m/%d %H:%M:%S")
@@ -0,0 +1,19 @@
+import argparse
+from gestion_fichas.fichas import importar_fichas_desde_archivo
+from gestion_fichas.importacion import LECTORES_IMPORTACION
+
+#Importa fichas en bloque, p.ej.:
+#   python importar_fichas.py nuevas.csv
+#   python importar_fichas.py volcado.ndjson --errores rechazadas.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa fichas desde un CSV o NDJSON (columnas nombre, edad, ciudad).")
+    parser.add_argument("archivo")
+    parser.add_argument("--formato", choices=sorted(LECTORES_IMPORTACION), help="Por defecto se deduce de la extensión")
+    parser.add_argument("--errores", help="Informe CSV de filas rechazadas (por defecto <archivo>.errores.csv)")
+    args = parser.parse_args()
+    print(f"🔧 Importando fichas desde {args.archivo}...")
+    resumen = importar_fichas_desde_archivo(args.archivo, args.formato, args.errores)
+    print(f"✅ {resumen['importadas']} fichas importadas en {resumen['lotes']} lotes.")
+    if resumen["rechazadas"]:
+        print(f"⚠️ {resumen['rechazadas']} filas rechazadas. Detalle en {args.errores or args.archivo + '.errores.csv'}.")
+    print("🔚 Importación completada.")
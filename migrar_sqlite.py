@@ -0,0 +1,39 @@
+import os
+from gestion_fichas.almacen import AlmacenFichas
+from gestion_fichas.almacen_sqlite import AlmacenFichasSQLite, guardar_usuarios_sqlite
+from gestion_fichas.logger_config import app_logger
+from gestion_fichas.codec import DatosCorruptos, leer_archivo
+from config import FICHAS_FILE, USUARIOS_FILE, SQLITE_FILE
+
+def migrar_a_sqlite(destino = SQLITE_FILE):
+    """
+    Copia fichas.json (incluido su journal) y usuarios.json a la base SQLite.
+    Los archivos JSON solo se leen: las fichas sin id reciben uno en la base, no en fichas.json.
+    Si fichas.json no existe se migran 0 fichas; si está dañado no se migra nada.
+    Si la base ya tenía datos, se sustituyen. Después hay que arrancar con STORAGE_BACKEND=sqlite para usarla.
+    """
+    try:
+        fichas = AlmacenFichas(FICHAS_FILE).leer_sin_modificar()
+    except DatosCorruptos:
+        print("❌ Error: fichas.json está corrupto o mal formateado. No se migra nada.")
+        app_logger.error("Error al leer fichas.json durante la migración a SQLite.")
+        return
+    AlmacenFichasSQLite(destino).guardar(fichas)
+    print(f"✅ {len(fichas)} fichas copiadas a {destino}.")
+
+    usuarios = []
+    if os.path.exists(USUARIOS_FILE):
+        try:
+            usuarios = leer_archivo(USUARIOS_FILE)
+        except DatosCorruptos:
+            print("❌ Error: usuarios.json está corrupto o mal formateado. No se migran usuarios.")
+            app_logger.error("Error JSON al leer usuarios.json durante la migración a SQLite.")
+            return
+    guardar_usuarios_sqlite(usuarios, destino)
+    print(f"✅ {len(usuarios)} usuarios copiados a {destino}.")
+    app_logger.info(f"Migración a SQLite completada: {len(fichas)} fichas y {len(usuarios)} usuarios en {destino}.")
+
+if __name__ == "__main__":
+    print("🔧 Iniciando migración de JSON a SQLite...")
+    migrar_a_sqlite()
+    print("🔚 Migración completada. Arranca con STORAGE_BACKEND=sqlite para usar la nueva base.")
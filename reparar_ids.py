@@ -1,7 +1,7 @@
-import json
-import uuid
 import os
 from gestion_fichas.logger_config import app_logger
+from gestion_fichas.codec import DatosCorruptos, leer_archivo
+from gestion_fichas.almacen import asignar_ids, _escribir_atomico
 from config import DATA_DIR
 
 # === Ruta del archivo de fichas ===
@@ -17,23 +17,17 @@ def reparar_ids_fichas():
         app_logger.error("Archivo fichas.json no encontrado al intentar reparar IDs.")
         return
 
-    with open(FICHAS_FILE, "r", encoding="utf-8") as f:
-        try:
-            fichas = json.load(f)
-        except json.JSONDecodeError:
-            print("❌ Error: fichas.json está corrupto o mal formateado.")
-            app_logger.error("Error JSON al leer fichas.json durante reparación.")
-            return
+    try:
+        fichas = leer_archivo(FICHAS_FILE)
+    except DatosCorruptos:
+        print("❌ Error: fichas.json está corrupto o mal formateado.")
+        app_logger.error("Error JSON al leer fichas.json durante reparación.")
+        return
 
-    corregidas = 0
-    for ficha in fichas:
-        if "id" not in ficha or not ficha["id"]:
-            ficha["id"] = str(uuid.uuid4())
-            corregidas += 1
+    corregidas = asignar_ids(fichas)
 
     if corregidas > 0:
-        with open(FICHAS_FILE, "w", encoding="utf-8") as f:
-            json.dump(fichas, f, ensure_ascii=False, indent=4)
+        _escribir_atomico(FICHAS_FILE, fichas)
         print(f"✅ Se añadieron IDs a {corregidas} fichas.")
         app_logger.info(f"Se añadieron IDs a {corregidas} fichas sin identificador.")
     else:
@@ -0,0 +1,183 @@
+import os, sqlite3, tempfile, time, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+os.environ.setdefault("ESTADISTICAS_PERSISTIR_SEG", "0")
+
+from gestion_fichas.almacen import AlmacenFichas
+from gestion_fichas.almacen_sqlite import AlmacenFichasSQLite
+from gestion_fichas.codec import leer_archivo, volcar
+from gestion_fichas.indices import decodificar_cursor
+
+def _ficha(id, nombre, ciudad = "Lugo", edad = 30, fecha = "2025-10-30T10:00:00"):
+    return {"id": id, "nombre": nombre, "edad": edad, "ciudad": ciudad, "fecha_creacion": fecha}
+
+def _carpeta(test):
+    carpeta = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+    test.addCleanup(carpeta.cleanup)
+    return carpeta.name
+
+def _contenido(almacen):
+    return sorted((f["id"], f["nombre"]) for f in almacen.fichas())
+
+class JournalJSON(unittest.TestCase):
+    def setUp(self):
+        self.ruta = os.path.join(_carpeta(self), "fichas.json")
+        self.almacen = AlmacenFichas(self.ruta)
+        self.almacen.guardar([_ficha("a", "Ana"), _ficha("b", "Bea")])
+
+    def test_los_cambios_van_al_journal_y_se_reproducen(self):
+        self.almacen.crear(_ficha("c", "Carla"))
+        self.almacen.actualizar(_ficha("a", "Ana María"))
+        self.almacen.eliminar("b")
+        self.almacen.crear_lote([_ficha("d", "Dani"), _ficha("e", "Eva")])
+        #El snapshot no se reescribe en cada cambio
+        self.assertEqual(sorted(f["id"] for f in leer_archivo(self.ruta)), ["a", "b"])
+        self.assertEqual(_contenido(AlmacenFichas(self.ruta)), [("a", "Ana María"), ("c", "Carla"), ("d", "Dani"), ("e", "Eva")])
+
+    def test_linea_cortada_solo_pierde_esa_operacion(self):
+        self.almacen.crear(_ficha("c", "Carla"))
+        with open(f"{self.ruta}.journal", "a", encoding="utf-8") as f:
+            f.write('{"op": "crear", "id": "x", "fic') #Corte a mitad de escritura
+        self.assertEqual(_contenido(AlmacenFichas(self.ruta)), [("a", "Ana"), ("b", "Bea"), ("c", "Carla")])
+
+    def test_guardar_vacia_el_journal(self):
+        self.almacen.crear(_ficha("c", "Carla"))
+        self.almacen.guardar([_ficha("z", "Zoe")])
+        self.assertFalse(os.path.exists(f"{self.ruta}.journal"))
+        self.assertEqual(_contenido(AlmacenFichas(self.ruta)), [("z", "Zoe")])
+
+    def test_otro_proceso_escribe_y_se_relee(self):
+        otro = AlmacenFichas(self.ruta)
+        otro.crear(_ficha("c", "Carla"))
+        self.assertEqual(self.almacen.obtener("c")["nombre"], "Carla")
+
+    def test_fichas_sin_id_reciben_uno_estable(self):
+        with open(self.ruta, "wb") as f:
+            f.write(volcar([{"nombre": "Sin id", "edad": 1, "ciudad": "Vigo"}]))
+        almacen = AlmacenFichas(self.ruta)
+        id_asignado = almacen.fichas()[0]["id"]
+        self.assertEqual(leer_archivo(self.ruta)[0]["id"], id_asignado)
+        self.assertEqual(AlmacenFichas(self.ruta).fichas()[0]["id"], id_asignado)
+
+    def test_leer_sin_modificar_no_toca_el_archivo(self):
+        with open(self.ruta, "wb") as f:
+            f.write(volcar([{"nombre": "Sin id"}]))
+        antes = os.stat(self.ruta).st_mtime_ns
+        self.assertTrue(AlmacenFichas(self.ruta).leer_sin_modificar()[0]["id"])
+        self.assertEqual(os.stat(self.ruta).st_mtime_ns, antes)
+        self.assertNotIn("id", leer_archivo(self.ruta)[0])
+
+class Compactacion(unittest.TestCase):
+    def setUp(self):
+        self.ruta = os.path.join(_carpeta(self), "fichas.json")
+        self.almacen = AlmacenFichas(self.ruta, journal_max_bytes = 200)
+
+    def _esperar_compactacion(self):
+        limite = time.monotonic() + 5
+        while self.almacen._compactando or os.path.exists(f"{self.ruta}.journal.old"):
+            self.assertLess(time.monotonic(), limite, "la compactación no terminó")
+            time.sleep(0.01)
+
+    def test_el_snapshot_recoge_el_journal(self):
+        for i in range(20):
+            self.almacen.crear(_ficha(f"f{i:02d}", f"Ficha {i}"))
+        self.almacen.eliminar("f00")
+        self._esperar_compactacion()
+        esperado = [(f"f{i:02d}", f"Ficha {i}") for i in range(1, 20)]
+        self.assertEqual(_contenido(self.almacen), esperado)
+        #El snapshot ya tiene casi todo: el journal que queda es pequeño
+        self.assertGreater(len(leer_archivo(self.ruta)), 10)
+        self.assertLess(os.path.getsize(f"{self.ruta}.journal") if os.path.exists(f"{self.ruta}.journal") else 0, 1000)
+        self.assertEqual(_contenido(AlmacenFichas(self.ruta)), esperado)
+
+    def test_journal_rotado_pendiente_se_aplica_al_cargar(self):
+        #Compactación interrumpida: quedó el journal rotado sin llegar al snapshot
+        self.almacen.guardar([_ficha("a", "Ana")])
+        with open(f"{self.ruta}.journal.old", "w", encoding="utf-8") as f:
+            f.write('{"op": "crear", "id": "b", "ficha": {"id": "b", "nombre": "Bea"}}\n')
+        with open(f"{self.ruta}.journal", "w", encoding="utf-8") as f:
+            f.write('{"op": "actualizar", "id": "b", "ficha": {"id": "b", "nombre": "Bea Ruiz"}}\n')
+        self.assertEqual(_contenido(AlmacenFichas(self.ruta)), [("a", "Ana"), ("b", "Bea Ruiz")])
+
+class BackendSQLite(unittest.TestCase):
+    def setUp(self):
+        self.ruta = os.path.join(_carpeta(self), "fichas.db")
+        self.almacen = AlmacenFichasSQLite(self.ruta)
+        self.almacen.guardar([_ficha("a", "Ana"), _ficha("b", "Bea")])
+
+    def test_cambios_persisten(self):
+        self.almacen.crear(_ficha("c", "Carla"))
+        self.almacen.actualizar(_ficha("a", "Ana María"))
+        self.almacen.eliminar("b")
+        self.almacen.crear_lote([_ficha("d", "Dani")])
+        self.assertEqual(_contenido(AlmacenFichasSQLite(self.ruta)), [("a", "Ana María"), ("c", "Carla"), ("d", "Dani")])
+
+    def test_id_repetido(self):
+        with self.assertRaises(ValueError):
+            self.almacen.crear(_ficha("a", "Otra Ana"))
+        self.assertEqual(self.almacen.obtener("a")["nombre"], "Ana")
+
+    def test_otra_conexion_escribe_y_se_relee(self):
+        otro = AlmacenFichasSQLite(self.ruta)
+        otro.crear(_ficha("c", "Carla"))
+        self.assertEqual(self.almacen.obtener("c")["nombre"], "Carla")
+
+    def test_escrituras_ajenas_a_fichas_no_invalidan_la_cache(self):
+        version = self.almacen.version()
+        conexion = sqlite3.connect(self.ruta)
+        with conexion:
+            conexion.execute("INSERT INTO usuarios (id, username, datos) VALUES ('u', 'u', '{}')")
+        conexion.close()
+        self.assertEqual(self.almacen.version(), version)
+
+class ConsultasIndexadas(unittest.TestCase):
+    def setUp(self):
+        self.almacen = AlmacenFichas(os.path.join(_carpeta(self), "fichas.json"))
+        self.almacen.guardar([_ficha("1", "Alvaro", "Málaga", 40), _ficha("2", "ALVAREZ", "Vigo", 20),
+                              _ficha("3", "Beatriz", "Lugo", 35), _ficha("4", "Carmen", "Alcalá", 50),
+                              _ficha("5", "David", "Ourense", 20)])
+
+    def test_busqueda_sin_tildes_ni_mayusculas(self):
+        self.assertEqual([f["id"] for f in self.almacen.buscar("alvar")], ["2", "1"])
+        self.assertEqual([f["id"] for f in self.almacen.buscar("MALAGA")], ["1"])
+        self.assertEqual([f["id"] for f in self.almacen.buscar("ala", campos = ("ciudad",))], ["1", "4"])
+        self.assertEqual(self.almacen.buscar("zz"), [])
+
+    def test_busqueda_al_dia_tras_cambios(self):
+        self.almacen.buscar("mar") #Construye el índice
+        self.almacen.crear(_ficha("6", "Marta"))
+        self.almacen.actualizar(_ficha("3", "Beatriz Martín"))
+        self.almacen.eliminar("6")
+        self.assertEqual([f["id"] for f in self.almacen.buscar("mart")], ["3"])
+
+    def test_busqueda_paginada(self):
+        pagina = self.almacen.buscar_pagina("a", por_pagina = 2, pagina = 2)
+        self.assertEqual((pagina["total"], pagina["paginas"], pagina["pagina"]), (5, 3, 2))
+        self.assertEqual([f["nombre"] for f in pagina["fichas"]], ["Beatriz", "Carmen"])
+
+    def test_cursores_recorren_todo_sin_repetir(self):
+        for descendente in (False, True):
+            vistos, despues = [], None
+            while True:
+                pagina = self.almacen.pagina("edad", por_pagina = 2, despues = despues, descendente = descendente)
+                vistos += [f["id"] for f in pagina["fichas"]]
+                despues = pagina["siguiente"]
+                if despues is None:
+                    break
+            esperado = ["2", "5", "3", "1", "4"] #Empates de edad por id
+            self.assertEqual(vistos, esperado[::-1] if descendente else esperado)
+
+    def test_cursor_anterior_vuelve_a_la_pagina_previa(self):
+        primera = self.almacen.pagina("nombre", por_pagina = 2)
+        segunda = self.almacen.pagina("nombre", por_pagina = 2, despues = primera["siguiente"])
+        self.assertEqual(self.almacen.pagina("nombre", por_pagina = 2, antes = segunda["anterior"])["fichas"], primera["fichas"])
+
+    def test_cursor_invalido_vuelve_al_principio(self):
+        self.assertIsNone(decodificar_cursor("no-es-un-cursor"))
+        self.assertEqual(self.almacen.pagina("edad", por_pagina = 2, despues = self.almacen.pagina("nombre", por_pagina = 2)["siguiente"])["pagina"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
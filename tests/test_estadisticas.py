@@ -0,0 +1,64 @@
+import os, tempfile, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+os.environ.setdefault("ESTADISTICAS_PERSISTIR_SEG", "0")
+
+from gestion_fichas.almacen import AlmacenFichas
+from gestion_fichas.estadisticas import EstadisticasFichas
+
+def _ficha(id, fecha, ciudad = "Lugo", edad = 30):
+    return {"id": id, "nombre": f"Ficha {id}", "edad": edad, "ciudad": ciudad, "fecha_creacion": fecha}
+
+class DiasConFormatosMezclados(unittest.TestCase):
+    #El CLI guarda "2025/10/30 11:34:39" y la web/importación "2025-10-30T11:34:39.212099"
+    FICHAS = [_ficha("a", "2025/10/29 09:00:00"), _ficha("b", "2025-10-30T10:00:00.000001"),
+              _ficha("c", "2025/10/30 11:34:39"), _ficha("d", "2025-10-31T08:00:00")]
+
+    def test_un_dia_una_clave(self):
+        estadisticas = EstadisticasFichas()
+        resumen = estadisticas.resumen({f["id"]: f for f in self.FICHAS})
+        self.assertEqual(resumen["por_dia"], [{"dia": "2025-10-29", "fichas": 1}, {"dia": "2025-10-30", "fichas": 2},
+                                              {"dia": "2025-10-31", "fichas": 1}])
+
+    def test_ultimos_dias_son_los_mas_recientes(self):
+        resumen = EstadisticasFichas().resumen({f["id"]: f for f in self.FICHAS}, dias = 2)
+        self.assertEqual([d["dia"] for d in resumen["por_dia"]], ["2025-10-30", "2025-10-31"])
+
+    def test_altas_y_bajas_incrementales(self):
+        estadisticas = EstadisticasFichas()
+        por_id = {f["id"]: f for f in self.FICHAS[:2]}
+        estadisticas.asegurar(por_id)
+        estadisticas.insertar(self.FICHAS[2])
+        estadisticas.insertar_lote([self.FICHAS[3]])
+        estadisticas.eliminar(self.FICHAS[1])
+        editada = dict(self.FICHAS[0], fecha_creacion = "2025-10-31T12:00:00")
+        estadisticas.actualizar(self.FICHAS[0], editada)
+        self.assertEqual(estadisticas.resumen(por_id)["por_dia"], [{"dia": "2025-10-30", "fichas": 1}, {"dia": "2025-10-31", "fichas": 2}])
+        #Lo mismo que recalcular desde cero
+        otra = EstadisticasFichas()
+        self.assertEqual(otra.resumen({f["id"]: f for f in (editada, self.FICHAS[2], self.FICHAS[3])}), estadisticas.resumen(por_id))
+
+class EstadisticasDelAlmacen(unittest.TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(carpeta.cleanup)
+        self.almacen = AlmacenFichas(os.path.join(carpeta.name, "fichas.json"))
+
+    def test_mantenidas_en_cada_cambio(self):
+        self.almacen.crear(_ficha("a", "2025/10/30 11:34:39", edad = 20))
+        self.almacen.resumen_estadisticas() #Se construyen aquí; desde ahora se aplican las diferencias
+        self.almacen.crear_lote([_ficha("b", "2025-10-30T12:00:00", ciudad = "Vigo", edad = 40)])
+        self.almacen.actualizar(dict(_ficha("a", "2025/10/30 11:34:39", edad = 24), fecha_modificacion = "2025-11-01T00:00:00"))
+        resumen = self.almacen.resumen_estadisticas()
+        self.assertEqual((resumen["total"], resumen["modificadas"], resumen["edad_media"]), (2, 1, 32.0))
+        self.assertEqual(resumen["por_dia"], [{"dia": "2025-10-30", "fichas": 2}])
+        self.almacen.eliminar("b")
+        resumen = self.almacen.resumen_estadisticas()
+        self.assertEqual([c["ciudad"] for c in resumen["ciudades"]], ["Lugo"])
+        self.assertEqual(resumen["total"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os, tempfile, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+os.environ.setdefault("ESTADISTICAS_PERSISTIR_SEG", "0")
+
+from gestion_fichas.almacen import obtener_almacen
+from webapp.fragmentos import CacheFragmentos, cache_tabla_fichas
+
+def _ficha(id, nombre):
+    return {"id": id, "nombre": nombre, "edad": 30, "ciudad": "Lugo", "fecha_creacion": "2025-10-30T10:00:00"}
+
+class _ConSesion(unittest.TestCase):
+    def setUp(self):
+        from webapp import create_app
+        self.app = create_app(calentar = False)
+        self.almacen = obtener_almacen()
+        self.almacen.guardar([_ficha("a", "Ana"), _ficha("b", "Bea")])
+        self.cliente = self._cliente("prueba")
+
+    def _cliente(self, usuario, rol = "editor"):
+        cliente = self.app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion["usuario"] = usuario
+            sesion["rol"] = rol
+        return cliente
+
+class PeticionesCondicionales(_ConSesion):
+    def test_304_mientras_no_cambian_los_datos(self):
+        primera = self.cliente.get("/fichas")
+        self.assertEqual(primera.status_code, 200)
+        etag = primera.headers["ETag"]
+        self.assertIn("no-cache", primera.headers["Cache-Control"])
+        segunda = self.cliente.get("/fichas", headers={"If-None-Match": etag})
+        self.assertEqual(segunda.status_code, 304)
+        self.assertEqual(segunda.get_data(), b"")
+
+    def test_un_cambio_invalida_el_etag(self):
+        etag = self.cliente.get("/fichas").headers["ETag"]
+        self.almacen.crear(_ficha("c", "Carla"))
+        respuesta = self.cliente.get("/fichas", headers={"If-None-Match": etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta.headers["ETag"], etag)
+        self.assertIn("Carla", respuesta.get_data(as_text=True))
+
+    def test_el_etag_depende_del_usuario_y_de_la_url(self):
+        etag = self.cliente.get("/fichas").headers["ETag"]
+        self.assertNotEqual(self._cliente("otra").get("/fichas").headers["ETag"], etag)
+        self.assertNotEqual(self.cliente.get("/fichas?sort=nombre").headers["ETag"], etag)
+
+class TablaCacheada(_ConSesion):
+    def test_se_reutiliza_hasta_que_cambian_los_datos(self):
+        self.cliente.get("/fichas?sort=nombre")
+        aciertos = cache_tabla_fichas.estadisticas()["aciertos"]
+        #Otro usuario, misma página: la tabla sale de la caché
+        self.assertIn("Bea", self._cliente("otra").get("/fichas?sort=nombre").get_data(as_text=True))
+        self.assertEqual(cache_tabla_fichas.estadisticas()["aciertos"], aciertos + 1)
+        self.almacen.actualizar(_ficha("b", "Beatriz"))
+        html = self.cliente.get("/fichas?sort=nombre").get_data(as_text=True)
+        self.assertIn("Beatriz", html)
+        self.assertEqual(cache_tabla_fichas.estadisticas()["aciertos"], aciertos + 1)
+
+class CacheFragmentosLRU(unittest.TestCase):
+    def test_otra_version_vacia_la_cache(self):
+        cache = CacheFragmentos(max_bytes = 10_000)
+        self.assertIsNone(cache.obtener("v1", "p1"))
+        cache.guardar("v1", "p1", "<tabla 1>")
+        self.assertEqual(cache.obtener("v1", "p1"), "<tabla 1>")
+        self.assertIsNone(cache.obtener("v2", "p1"))
+        self.assertEqual(cache.estadisticas()["invalidaciones"], 1)
+        #Un fragmento renderizado con la versión anterior ya no se guarda
+        cache.guardar("v1", "p1", "<tabla vieja>")
+        self.assertIsNone(cache.obtener("v2", "p1"))
+
+    def test_expulsa_la_menos_usada_al_pasar_del_presupuesto(self):
+        html = "x" * 1000
+        cache = CacheFragmentos(max_bytes = 2 * len(html) + 200)
+        cache.obtener("v", "a")
+        cache.guardar("v", "a", html)
+        cache.guardar("v", "b", html)
+        cache.obtener("v", "a") #"b" pasa a ser la menos usada
+        cache.guardar("v", "c", html)
+        self.assertIsNotNone(cache.obtener("v", "a"))
+        self.assertIsNone(cache.obtener("v", "b"))
+        self.assertEqual(cache.estadisticas()["expulsados"], 1)
+        self.assertLessEqual(cache.bytes, cache.max_bytes)
+
+if __name__ == "__main__":
+    unittest.main()
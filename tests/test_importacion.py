@@ -0,0 +1,62 @@
+import io, os, tempfile, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+os.environ.setdefault("ESTADISTICAS_PERSISTIR_SEG", "0")
+
+from gestion_fichas.almacen import AlmacenFichas, obtener_almacen
+from gestion_fichas.importacion import InformeErrores, abrir_texto, importar_fichas, leer_csv, leer_ndjson, NO_UTF8
+
+CSV_LATIN1 = "nombre,edad,ciudad\nAna,30,Lugo\nJosé,40,Málaga\nLuis,50,Vigo\n".encode("latin-1")
+
+class ImportacionNoUtf8(unittest.TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(carpeta.cleanup)
+        self.almacen = AlmacenFichas(os.path.join(carpeta.name, "fichas.json"))
+
+    def test_csv_latin1_rechaza_solo_las_filas_no_utf8(self):
+        informe = InformeErrores()
+        resumen = importar_fichas(leer_csv(abrir_texto(io.BytesIO(CSV_LATIN1))), self.almacen, informe)
+        self.assertEqual((resumen["importadas"], resumen["rechazadas"]), (2, 1))
+        self.assertEqual(informe.primeros[0]["linea"], 3)
+        self.assertEqual(informe.primeros[0]["error"], NO_UTF8)
+        self.assertEqual(sorted(f["nombre"] for f in self.almacen.fichas()), ["Ana", "Luis"])
+
+    def test_ndjson_latin1(self):
+        datos = '{"nombre": "Ana", "edad": 30, "ciudad": "Lugo"}\n{"nombre": "José", "edad": 40, "ciudad": "Lugo"}\n'.encode("latin-1")
+        resumen = importar_fichas(leer_ndjson(abrir_texto(io.BytesIO(datos))), self.almacen)
+        self.assertEqual((resumen["importadas"], resumen["rechazadas"]), (1, 1))
+
+    def test_csv_mal_formado_sigue_importando(self):
+        datos = b"nombre,edad,ciudad\nAna,30," + b"x" * 200_000 + b"\nLuis,50,Vigo\n"
+        informe = InformeErrores()
+        resumen = importar_fichas(leer_csv(abrir_texto(io.BytesIO(datos))), self.almacen, informe)
+        self.assertEqual((resumen["importadas"], resumen["rechazadas"]), (1, 1))
+        self.assertEqual(informe.primeros[0]["linea"], 2)
+
+    def test_flujo_estricto_no_lanza(self):
+        #Un flujo abierto sin abrir_texto: lo leído se guarda y el resto se rechaza, sin excepción
+        texto = io.TextIOWrapper(io.BytesIO(CSV_LATIN1), encoding="utf-8", newline="")
+        resumen = importar_fichas(leer_csv(texto), self.almacen, tamano_lote=1)
+        self.assertEqual(resumen["rechazadas"], 1)
+
+class SubidaWebNoUtf8(unittest.TestCase):
+    def test_subida_latin1_no_da_500(self):
+        from webapp import create_app
+        app = create_app(calentar = False)
+        obtener_almacen().guardar([]) #El almacén de la app es compartido con otros tests
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion["usuario"] = "prueba"
+            sesion["rol"] = "admin"
+        respuesta = cliente.post("/fichas/importar", data={"archivo": (io.BytesIO(CSV_LATIN1), "latin1.csv")},
+                                 content_type="multipart/form-data")
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("2 fichas importadas, 1 filas rechazadas", respuesta.get_data(as_text=True))
+        self.assertEqual(len(obtener_almacen().fichas()), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import os, tempfile, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+
+from gestion_fichas.limitador import _Cubos
+from config import LOGIN_FALLOS_SIN_ESPERA, LOGIN_ESPERA_BASE_SEG
+
+class EsperaExponencial(unittest.TestCase):
+    def setUp(self):
+        self.cubos = _Cubos(capacidad = 5, por_minuto = 5, olvido_seg = 3600)
+
+    def _fallar(self, ahora):
+        self.assertEqual(self.cubos.espera("ana", ahora), 0.0)
+        self.cubos.consumir("ana", ahora)
+        self.cubos.resultado("ana", False, ahora)
+        return self.cubos.espera("ana", ahora)
+
+    def test_al_ritmo_de_recarga_la_espera_sigue_creciendo(self):
+        #Un intento fallido por minuto: el cubo vuelve a estar lleno en cada purga, pero los fallos no se olvidan
+        ahora, esperas = 1000.0, []
+        for _ in range(LOGIN_FALLOS_SIN_ESPERA + 3):
+            esperas.append(self._fallar(ahora))
+            ahora += 60
+            self.cubos.purgar(ahora, max_claves = 100)
+        base = LOGIN_ESPERA_BASE_SEG
+        self.assertEqual(esperas[LOGIN_FALLOS_SIN_ESPERA:], [base, 2 * base, 4 * base])
+        self.assertEqual(self.cubos.cubos["ana"].fallos, LOGIN_FALLOS_SIN_ESPERA + 3)
+
+    def test_un_acierto_reinicia_y_permite_purgar(self):
+        for i in range(LOGIN_FALLOS_SIN_ESPERA + 1):
+            self._fallar(1000.0 + i * 60)
+        self.cubos.resultado("ana", True, 1300.0)
+        self.assertEqual(self.cubos.espera("ana", 1300.0), 0.0)
+        self.cubos.purgar(1400.0, max_claves = 100)
+        self.assertNotIn("ana", self.cubos.cubos)
+
+    def test_los_fallos_caducan(self):
+        for i in range(LOGIN_FALLOS_SIN_ESPERA + 1):
+            self._fallar(1000.0 + i * 60)
+        self.cubos.purgar(1180.0 + 3600, max_claves = 100)
+        self.assertNotIn("ana", self.cubos.cubos)
+        #Aunque no se hubiera purgado, un fallo tras el periodo de olvido cuenta como el primero
+        otros = _Cubos(capacidad = 5, por_minuto = 5, olvido_seg = 3600)
+        for ahora in (0.0, 60.0, 120.0, 180.0, 180.0 + 3600):
+            otros.consumir("ana", ahora)
+            otros.resultado("ana", False, ahora)
+        self.assertEqual(otros.cubos["ana"].fallos, 1)
+
+    def test_tope_de_claves_conserva_las_que_tienen_fallos(self):
+        self._fallar(1000.0)
+        for i in range(3):
+            self.cubos.consumir(f"ip{i}", 1001.0 + i)
+        self.assertEqual(self.cubos.purgar(1003.0, max_claves = 2), 2)
+        self.assertIn("ana", self.cubos.cubos)
+
+if __name__ == "__main__":
+    unittest.main()
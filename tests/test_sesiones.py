@@ -0,0 +1,92 @@
+import os, sqlite3, tempfile, time, unittest
+
+#Datos y logs en una carpeta temporal: config los lee al importarse
+_TMP = tempfile.mkdtemp(prefix="gestion_fichas_test_")
+os.environ.setdefault("GESTION_FICHAS_DATA_DIR", _TMP)
+os.environ.setdefault("GESTION_FICHAS_LOG_DIR", os.path.join(_TMP, "logs"))
+
+from gestion_fichas.sesiones import SesionesMemoria, SesionesSQLite
+
+class _CasosComunes:
+    #Mismo comportamiento en las dos implementaciones
+    def test_caducidad(self):
+        ahora = time.time()
+        self.sesiones.crear("viva", "u1", ahora + 60)
+        self.sesiones.crear("caducada", "u2", ahora - 1)
+        self.assertEqual(self.sesiones.obtener("viva"), "u1")
+        self.assertIsNone(self.sesiones.obtener("caducada"))
+        self.assertIsNone(self.sesiones.obtener("no-existe"))
+
+    def test_barrer_quita_solo_las_caducadas(self):
+        ahora = time.time()
+        for i in range(5):
+            self.sesiones.crear(f"t{i}", "u", ahora + (60 if i % 2 else -1))
+        self.sesiones.barrer()
+        self.assertEqual(len(self.sesiones), 2)
+
+    def test_eliminar(self):
+        self.sesiones.crear("t", "u", time.time() + 60)
+        self.assertTrue(self.sesiones.eliminar("t"))
+        self.assertFalse(self.sesiones.eliminar("t"))
+        self.assertIsNone(self.sesiones.obtener("t"))
+
+    def test_tope_expulsa_la_que_antes_caduca(self):
+        ahora = time.time()
+        for i, segundos in enumerate((300, 100, 200, 400)):
+            self.sesiones.crear(f"t{i}", f"u{i}", ahora + segundos)
+        self.sesiones.crear("nueva", "u", ahora + 500)
+        self.assertEqual(len(self.sesiones), 4)
+        self.assertIsNone(self.sesiones.obtener("t1"))
+        self.assertEqual(self.sesiones.obtener("t0"), "u0")
+
+class Memoria(_CasosComunes, unittest.TestCase):
+    def setUp(self):
+        self.sesiones = SesionesMemoria(maximo = 4)
+
+    def test_elementos_en_orden_de_creacion(self):
+        ahora = time.time()
+        self.sesiones.crear("b", 1, ahora + 60)
+        self.sesiones.crear("a", 2, ahora + 30)
+        self.assertEqual([t for t, _, _ in self.sesiones.elementos()], ["b", "a"])
+
+class SQLite(_CasosComunes, unittest.TestCase):
+    def setUp(self):
+        carpeta = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(carpeta.cleanup)
+        self.ruta = os.path.join(carpeta.name, "sesiones.db")
+        self.sesiones = SesionesSQLite(self.ruta, maximo = 4)
+
+    def _contar(self):
+        return sqlite3.connect(self.ruta).execute("SELECT COUNT(*) FROM sesiones").fetchone()[0]
+
+    def test_el_total_de_los_triggers_cuadra(self):
+        ahora = time.time()
+        self.sesiones.crear("a", "u", ahora + 60)
+        self.sesiones.crear("a", "u", ahora + 90) #Mismo token: se actualiza, no suma
+        self.sesiones.crear("b", "u", ahora - 1)
+        self.sesiones.obtener("b") #Caducada: se borra al leerla
+        self.sesiones.crear("c", "u", ahora + 60)
+        self.sesiones.eliminar("c")
+        for i in range(6):
+            self.sesiones.crear(f"t{i}", "u", ahora + 100 + i)
+        self.assertEqual(len(self.sesiones), self._contar())
+        self.assertEqual(len(self.sesiones), 4)
+
+    def test_compartidas_entre_procesos(self):
+        self.sesiones.crear("t", "u1", time.time() + 60)
+        otro = SesionesSQLite(self.ruta, maximo = 4)
+        self.assertEqual(otro.obtener("t"), "u1")
+        self.assertEqual(len(otro), 1)
+
+    def test_base_anterior_se_cuenta_al_abrir(self):
+        #Una base creada antes de existir el total: se cuenta una vez al crear la tabla
+        ruta = os.path.join(os.path.dirname(self.ruta), "antigua.db")
+        conexion = sqlite3.connect(ruta)
+        conexion.execute("CREATE TABLE sesiones (token TEXT PRIMARY KEY, user_id TEXT NOT NULL, expira REAL NOT NULL)")
+        conexion.executemany("INSERT INTO sesiones VALUES (?, 'u', ?)", [(f"t{i}", time.time() + 60) for i in range(3)])
+        conexion.commit()
+        conexion.close()
+        self.assertEqual(len(SesionesSQLite(ruta)), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,18 @@
-from flask import Flask
+from flask import Flask, g, request, session, before_render_template, template_rendered
 from webapp.routes import main_routes
-import os
+from gestion_fichas.metricas import metricas
+from gestion_fichas.hashing import estadisticas_hashing
+from gestion_fichas.limitador import estadisticas_login
+from gestion_fichas.almacen import obtener_almacen
+from gestion_fichas.perfilado import perfilar, toca_muestrear
+from webapp.fragmentos import cache_tabla_fichas
+from webapp.servidor import calentar_en_segundo_plano
+from config import PERFILADO, PERFILADO_VISTAS
+import os, time
 
-def create_app():
+def create_app(calentar = True):
+    #Con calentar=True se cargan datos, índices y pool de hashing en segundo plano y /salud pasa a 200
+    #al terminar (ver webapp.servidor). Los benchmarks lo hacen ellos mismos con calentar=False.
     #Ruta absoluta a la carpeta templates dentro de webapp
     base_dir = os.path.dirname(os.path.abspath(__file__))
     templates_dir = os.path.join(base_dir, "templates")
@@ -10,4 +20,66 @@ def create_app():
     app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-change-me") # Cambiar por una clave segura luego
     #Importar rutas
     app.register_blueprint(main_routes)
-    return app
\ No newline at end of file
+    _instrumentar(app)
+    _preparar_perfilado(app)
+    if calentar:
+        calentar_en_segundo_plano(app)
+    return app
+
+#=== Métricas (ver gestion_fichas.metricas y la ruta /metrics) ===
+def _instrumentar(app):
+    @app.before_request
+    def _inicio_peticion():
+        g._inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def _fin_peticion(response):
+        inicio = g.pop("_inicio_peticion", None)
+        if inicio is not None:
+            metricas.observar("gestion_fichas_peticion_segundos", time.perf_counter() - inicio,
+                              endpoint=request.endpoint or "sin_ruta", metodo=request.method, estado=response.status_code)
+        return response
+
+    def _antes_de_plantilla(sender, template, context, **extra):
+        g._inicio_plantilla = time.perf_counter()
+
+    def _plantilla_hecha(sender, template, context, **extra):
+        inicio = g.pop("_inicio_plantilla", None)
+        if inicio is not None:
+            metricas.observar("gestion_fichas_operacion_segundos", time.perf_counter() - inicio,
+                              operacion="render_plantilla", plantilla=template.name)
+
+    #weak=False: son funciones locales y, si no, blinker las perdería al salir de aquí
+    before_render_template.connect(_antes_de_plantilla, app, weak=False)
+    template_rendered.connect(_plantilla_hecha, app, weak=False)
+
+#=== Perfilado (ver gestion_fichas.perfilado) ===
+def _perfilar_esta_peticion():
+    #Solo se llega aquí con PERFILADO activo (si no, las vistas no se envuelven)
+    if toca_muestrear():
+        return True
+    return request.args.get("perfilar") == "1" and session.get("rol") == "admin"
+
+def _preparar_perfilado(app):
+    #Con PERFILADO desactivado las vistas quedan tal cual: ni muestreo ni ?perfilar=1
+    if not PERFILADO:
+        return
+    for endpoint, vista in list(app.view_functions.items()):
+        blueprint, _, nombre = endpoint.partition(".")
+        if blueprint == main_routes.name and (not PERFILADO_VISTAS or nombre in PERFILADO_VISTAS):
+            app.view_functions[endpoint] = perfilar(vista, nombre, _perfilar_esta_peticion)
+
+def _colector_interno():
+    #Contadores que ya llevan el pool de hashing, el limitador de login, el escritor de fichas y la caché de la tabla
+    valores = []
+    for clave, valor in estadisticas_hashing().items():
+        valores.append((f"gestion_fichas_hashing_{clave}", "gauge", "Pool de hashing de contraseñas.", valor, {}))
+    for clave, valor in estadisticas_login().items():
+        valores.append((f"gestion_fichas_login_{clave}", "gauge", "Limitador de intentos de login.", valor, {}))
+    for clave, valor in obtener_almacen().estadisticas_escritura().items():
+        valores.append((f"gestion_fichas_escritura_{clave}", "gauge", "Escritura agrupada de fichas.", valor, {}))
+    for clave, valor in cache_tabla_fichas.estadisticas().items():
+        valores.append((f"gestion_fichas_cache_tabla_{clave}", "gauge", "Caché de la tabla de fichas renderizada.", valor, {}))
+    return valores
+
+metricas.registrar_colector(_colector_interno)
@@ -0,0 +1,79 @@
+import sys, threading
+from collections import OrderedDict
+from config import FRAGMENTOS_MAX_BYTES
+
+#=== Caché de fragmentos renderizados ===
+#La tabla de /fichas solo depende de los datos y de la página pedida (orden, dirección, tamaño,
+#cursores), no de quién la mira: se guarda el HTML ya renderizado y las visitas siguientes a esa
+#página se lo ahorran. Todas las entradas son de una misma versión del almacén; en cuanto llega
+#otra versión se vacía entera, así nunca se sirve una tabla de datos que ya han cambiado.
+
+class CacheFragmentos:
+    """LRU de fragmentos HTML con un presupuesto de memoria en bytes, ligada a la versión de los datos."""
+
+    def __init__(self, max_bytes = FRAGMENTOS_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict() #clave -> html, de menos a más recientemente usado
+        self._version = None
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsados = 0
+        self.invalidaciones = 0
+
+    def _cambiar_version(self, version):
+        #Con el lock tomado. Los fragmentos de la versión anterior ya no sirven
+        if version != self._version:
+            if self._entradas:
+                self.invalidaciones += 1
+            self._entradas.clear()
+            self.bytes = 0
+            self._version = version
+
+    def obtener(self, version, clave):
+        #HTML guardado para esa clave con esa versión de los datos, o None
+        with self._lock:
+            self._cambiar_version(version)
+            html = self._entradas.get(clave)
+            if html is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return html
+
+    def guardar(self, version, clave, html):
+        tamano = sys.getsizeof(html)
+        with self._lock:
+            #Si entretanto ha llegado otra versión, este fragmento ya nació viejo
+            if version != self._version or tamano > self.max_bytes:
+                return
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self.bytes -= sys.getsizeof(anterior)
+            self._entradas[clave] = html
+            self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                _, expulsado = self._entradas.popitem(last=False)
+                self.bytes -= sys.getsizeof(expulsado)
+                self.expulsados += 1
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsados": self.expulsados,
+                "invalidaciones": self.invalidaciones,
+            }
+
+cache_tabla_fichas = CacheFragmentos()
@@ -1,32 +1,71 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from datetime import datetime
-from gestion_fichas.usuarios import (autenticar_usuario, cargar_usuarios, guardar_usuarios, registrar_usuario, cambiar_pass_propio, cambiar_pass_usuario_admin,
-                                    _generar_salt, _hash_password)
-from gestion_fichas.fichas import cargar_fichas, guardar_fichas
-from gestion_fichas.session_manager import cerrar_sesion
+from flask import Blueprint, Response, current_app, jsonify, make_response, render_template, request, redirect, url_for, flash, session, stream_with_context, send_from_directory
+from datetime import datetime, timezone
+from werkzeug.http import is_resource_modified
+from gestion_fichas.usuarios import (autenticar_usuario, logout as cerrar_token, cargar_usuarios, guardar_usuarios, registrar_usuario, cambiar_pass_propio, cambiar_pass_usuario_admin,
+                                    obtener_usuario_por_id, actualizar_usuario, eliminar_usuario_por_id, _generar_salt, _hash_password)
+from gestion_fichas.almacen import obtener_almacen
+from gestion_fichas.indices import CLAVES_ORDEN
+from gestion_fichas.exportacion import exportar_csv, exportar_ndjson, filtrar_fichas
+from gestion_fichas.importacion import LECTORES_IMPORTACION, InformeErrores, abrir_texto, formato_por_nombre, importar_fichas
+from gestion_fichas.hashing import HashingOcupado
+from gestion_fichas.limitador import limitador_login
+from gestion_fichas.metricas import metricas
+from gestion_fichas.session_manager import iniciar_sesion, cerrar_sesion
 from gestion_fichas.logger_config import app_logger, user_logger
+from webapp.fragmentos import cache_tabla_fichas
+from markupsafe import Markup
+from config import FICHAS_POR_PAGINA, FICHAS_POR_PAGINA_MAX, IMPORTACION_MAX_ERRORES_WEB, LOG_DIR, ESTADISTICAS_CIUDADES, ESTADISTICAS_DIAS, METRICAS_TOKEN
+import hashlib
+import hmac
+import math
+import os
 import uuid
 
 main_routes = Blueprint('main_routes', __name__)
 
 # === LOGIN ===
+#Respuesta rápida cuando el pool de hashing está lleno (ver gestion_fichas.hashing)
+SEGUNDOS_REINTENTO = 2
+
+def _ocupado(plantilla, **contexto):
+    flash("El servidor está ocupado. Inténtalo de nuevo en unos segundos.", "warning")
+    return render_template(plantilla, **contexto), 503, {"Retry-After": str(SEGUNDOS_REINTENTO)}
+
+@main_routes.app_errorhandler(HashingOcupado)
+def hashing_ocupado(e):
+    return _ocupado('ocupado.html')
+
 @main_routes.route('/', methods=['GET', 'POST'])
 #@main_routes.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username'].strip()
         password = request.form['password'].strip()
+        ip = request.remote_addr or "-"
+        #Se rechaza antes de calcular ningún hash
+        espera = limitador_login.comprobar(username, ip)
+        if espera:
+            segundos = math.ceil(espera)
+            user_logger.warning(f"Login limitado para usuario '{username}' desde {ip} ({segundos} s).")
+            flash(f"Demasiados intentos. Espera {segundos} segundos antes de volver a intentarlo.", "danger")
+            return render_template('login.html'), 429, {"Retry-After": str(segundos)}
         try:
-            user, token = autenticar_usuario(username, password)
+            resultado = autenticar_usuario(username, password)
+            limitador_login.resultado(username, ip, resultado is not None)
+            user, token = resultado or (None, None)
             if user:
                 session['usuario'] = user['username']
                 session['rol'] = user['role']
+                session['token'] = token
+                iniciar_sesion(user, token)
                 user_logger.info(f"Usuario '{username}' ha iniciado sesión.")
                 flash(f"Bienvenido, {username}!", "success")
                 return redirect(url_for('main_routes.dashboard'))
             else:
                 flash("Credenciales inválidas.", "danger")
                 user_logger.warning(f"Intento fallido de inicio de sesión para usuario '{username}'.")
+        except HashingOcupado:
+            return _ocupado('login.html')
         except Exception as e:
             app_logger.error(f"Error durante el inicio de sesión: {e}")
             flash("Ocurrió un error. Inténtalo de nuevo.", "danger")
@@ -40,13 +79,31 @@ def dashboard():
         return redirect(url_for('main_routes.login'))
     username = session["usuario"]
     rol = session.get("rol", "editor")
-    return render_template('dashboard.html', username = username, role = rol)
+    estadisticas = obtener_almacen().resumen_estadisticas(ESTADISTICAS_CIUDADES, ESTADISTICAS_DIAS)
+    return render_template('dashboard.html', username = username, role = rol, estadisticas = estadisticas)
+
+@main_routes.route('/dashboard/estadisticas.json')
+def estadisticas_fichas():
+    #Los mismos agregados que el panel, en JSON. ?ciudades= y ?dias= amplían las listas.
+    if "usuario" not in session:
+        flash("Por favor, inicia sesión para acceder al panel.", "warning")
+        return redirect(url_for('main_routes.login'))
+    def _limite(nombre, defecto):
+        try:
+            return min(max(int(request.args.get(nombre, defecto)), 1), 1000)
+        except ValueError:
+            return defecto
+    return jsonify(obtener_almacen().resumen_estadisticas(_limite("ciudades", ESTADISTICAS_CIUDADES), _limite("dias", ESTADISTICAS_DIAS)))
 
 # === LOGOUT ===
 @main_routes.route('/logout')
 def logout():
     user = session.get("usuario", "Desconocido")
-    cerrar_sesion()
+    token = session.get("token")
+    if token:
+        #Solo se cierra la sesión de este usuario, en memoria
+        cerrar_sesion(token)
+        cerrar_token(token)
     session.clear()
     flash("Has cerrado sesión exitosamente.", "info")
     user_logger.info(f"Usuario '{user}' ha cerrado sesión.")
@@ -68,7 +125,12 @@ def area_personal():
                 if user['username'] == username:
                     user['username'] = nuevo_nombre
                     user['fecha_modificacion'] = datetime.now().isoformat()
-                    guardar_usuarios(usuarios)
+                    try:
+                        guardar_usuarios(usuarios)
+                    except Exception as e:
+                        app_logger.error(f"Error al cambiar el nombre de usuario: {e}")
+                        flash("Ocurrió un error al cambiar el nombre. Inténtalo de nuevo.", "danger")
+                        break
                     session['usuario'] = nuevo_nombre # Actualizar sesión
                     flash("Nombre de usuario actualizado correctamente.", "success")
                     user_logger.info(f"Usuario '{username}' cambió su nombre a '{nuevo_nombre}'.")
@@ -102,6 +164,8 @@ def nuevo_usuario():
             flash(f"Usuario {username} creado correctamente.", "success")
             user_logger.info(f"Administrador '{session['usuario']}' creó un nuevo usuario: {username} con rol {role}.")
             return redirect(url_for('main_routes.gestion_usuarios'))
+        except HashingOcupado:
+            return _ocupado('nuevo_usuario.html')
         except Exception as e:
             app_logger.error(f"Error al crear usuario: {e}")
             flash("Ocurrió un error al crear el usuario. Inténtalo de nuevo.", "danger")
@@ -112,14 +176,20 @@ def editar_usuario(id):
     if "usuario" not in session or session.get("rol") != "admin":
         flash("Acceso restringido a administradores.", "warning")
         return redirect(url_for('main_routes.dashboard'))
-    usuarios = cargar_usuarios()
-    usuario = next((u for u in usuarios if u.get("id") == id), None)
+    usuario = obtener_usuario_por_id(id)
     if not usuario:
         flash("Usuario no encontrado.", "danger")
         return redirect(url_for('main_routes.gestion_usuarios'))
     if request.method == 'POST':
         usuario["username"] = request.form['username'].strip()
         usuario["role"] = request.form['role'].strip()
+        #Se guarda antes de cambiar la contraseña para no pisar el hash nuevo con el antiguo
+        try:
+            actualizar_usuario(usuario)
+        except Exception as e:
+            app_logger.error(f"Error al editar usuario: {e}")
+            flash("Ocurrió un error al editar el usuario. Inténtalo de nuevo.", "danger")
+            return render_template('editar_usuario.html', usuario=usuario)
         new_password = request.form.get('new_password', '').strip()
         confirm_password = request.form.get('confirm_password', '').strip()
         if new_password:
@@ -138,14 +208,9 @@ def editar_usuario(id):
                 #usuario['fecha_modificacion'] = datetime.now().isoformat()
                 #user_logger.info(f"Administrador '{session['usuario']}' cambió la contraseña del usuario '{usuario['username']}'.")
                 #flash("Contraseña cambiada correctamente.", "success")
-        try:
-            guardar_usuarios(usuarios)
-            flash(f"Usuario {usuario['username']} actualizado correctamente.", "success")
-            user_logger.info(f"Administrador '{session['usuario']}' editó el usuario: {usuario}.")
-            return redirect(url_for('main_routes.gestion_usuarios'))
-        except Exception as e:
-            app_logger.error(f"Error al editar usuario: {e}")
-            flash("Ocurrió un error al editar el usuario. Inténtalo de nuevo.", "danger")
+        flash(f"Usuario {usuario['username']} actualizado correctamente.", "success")
+        user_logger.info(f"Administrador '{session['usuario']}' editó el usuario: {usuario}.")
+        return redirect(url_for('main_routes.gestion_usuarios'))
     return render_template('editar_usuario.html', usuario=usuario)
 
 @main_routes.route('/usuarios/eliminar/<id>', methods=['GET', 'POST'])
@@ -153,15 +218,13 @@ def eliminar_usuario(id):
     if "usuario" not in session or session.get("rol") != "admin":
         flash("Acceso restringido a administradores.", "warning")
         return redirect(url_for('main_routes.login'))
-    usuarios = cargar_usuarios()
-    usuario = next((u for u in usuarios if u.get("id") == id), None)
+    usuario = obtener_usuario_por_id(id)
     if not usuario:
         flash("Usuario no encontrado.", "danger")
         return redirect(url_for('main_routes.gestion_usuarios'))
     if request.method == 'POST':
-        usuarios.remove(usuario)
         try:
-            guardar_usuarios(usuarios)
+            eliminar_usuario_por_id(id)
             flash(f"Usuario {usuario['username']} eliminado correctamente.", "success")
             user_logger.info(f"Administrador '{session['usuario']}' eliminó el usuario: {usuario}.")
             return redirect(url_for('main_routes.gestion_usuarios'))
@@ -190,6 +253,8 @@ def cambiar_password_usuario_admin(username):
                     return redirect(url_for('main_routes.gestion_usuarios'))
                 else:
                     flash("Usuario objetivo no encontrado.", "danger")
+        except HashingOcupado:
+            return _ocupado('cambiar_password_usuario_admin.html', username=username)
         except Exception as e:
             app_logger.error(f"Error al cambiar contraseña del usuario: {e}")
             flash("Ocurrió un error al cambiar la contraseña. Inténtalo de nuevo.", "danger")
@@ -218,21 +283,186 @@ def cambiar_password():
                 return redirect(url_for('main_routes.dashboard'))
             else:
                 flash("Contraseña actual incorrecta.", "danger")
+        except HashingOcupado:
+            return _ocupado('cambiar_password.html')
         except Exception as e:
             app_logger.error(f"Error al cambiar contraseña: {e}")
             flash("Ocurrió un error al cambiar la contraseña. Inténtalo de nuevo.", "danger")
     return render_template('cambiar_password.html')
 
+# === MÉTRICAS ===
+def _puede_ver_metricas():
+    #Un administrador con sesión, o el recolector con el token de METRICAS_TOKEN (comparado en tiempo constante)
+    if session.get("rol") == "admin":
+        return True
+    esperado = f"Bearer {METRICAS_TOKEN}"
+    return bool(METRICAS_TOKEN) and hmac.compare_digest(request.headers.get("Authorization", ""), esperado)
+
+@main_routes.route('/metrics')
+def metrics():
+    #Formato de texto de Prometheus: histogramas de latencia por endpoint y por operación, y contadores internos.
+    #Dice qué rutas hay y cuánto se usan: no es público (ver METRICAS_TOKEN en config.py)
+    if not _puede_ver_metricas():
+        return Response("No autorizado.\n", status=401, content_type="text/plain; charset=utf-8",
+                        headers={"WWW-Authenticate": 'Bearer realm="metrics"'})
+    return Response(metricas.exportar_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+# === SALUD ===
+@main_routes.route('/salud')
+def salud():
+    #Para el balanceador u orquestador: 503 hasta que webapp.servidor.calentar() ha terminado
+    if current_app.config.get("ERROR_ARRANQUE"):
+        return jsonify({"estado": "error", "error": current_app.config["ERROR_ARRANQUE"]}), 503
+    if not current_app.config.get("LISTO"):
+        return jsonify({"estado": "arrancando"}), 503, {"Retry-After": str(SEGUNDOS_REINTENTO)}
+    return jsonify({"estado": "listo", **current_app.config["ARRANQUE"]})
+
 # === GESTIÓN DE FICHAS ===
+#--- Peticiones condicionales ---
+#La página depende de los datos (versión del almacén), de quién la pide y de la URL completa.
+#Si el navegador ya tiene esa versión se responde 304 sin paginar ni pintar nada.
+def _validadores_fichas():
+    #(versión de los datos, ETag, Last-Modified)
+    version, modificado = obtener_almacen().version()
+    clave = f"{version}|{session.get('usuario')}|{session.get('rol')}|{request.full_path}"
+    return version, hashlib.sha1(clave.encode("utf-8")).hexdigest()[:20], datetime.fromtimestamp(modificado, timezone.utc)
+
+def _cabeceras_cache(respuesta, etag, modificado):
+    respuesta.set_etag(etag, weak=True)
+    respuesta.last_modified = modificado
+    #Privada y siempre revalidada: el navegador la guarda pero pregunta antes de reutilizarla
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+    respuesta.vary.add("Cookie")
+    return respuesta
+
+def _no_modificada(etag, modificado):
+    #Respuesta 304 si el cliente ya tiene esta versión; None si hay que generar la página
+    if session.get("_flashes"):
+        return None #Hay mensajes pendientes que se muestran al pintar la página
+    if is_resource_modified(request.environ, etag=etag, last_modified=modificado):
+        return None
+    return _cabeceras_cache(Response(status=304), etag, modificado)
+
+def _parametros_listado():
+    #Lee ?page=, ?per_page=, ?sort=, ?dir= y los cursores ?after= / ?before= con valores seguros por defecto
+    sort = request.args.get("sort", "fecha_creacion")
+    if sort not in CLAVES_ORDEN:
+        sort = "fecha_creacion"
+    try:
+        per_page = min(max(int(request.args.get("per_page", FICHAS_POR_PAGINA)), 1), FICHAS_POR_PAGINA_MAX)
+    except ValueError:
+        per_page = FICHAS_POR_PAGINA
+    try:
+        page = max(int(request.args.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    return {
+        "sort": sort,
+        "dir": "desc" if request.args.get("dir") == "desc" else "asc",
+        "per_page": per_page,
+        "page": page,
+        "after": request.args.get("after") or None,
+        "before": request.args.get("before") or None,
+    }
+
 @main_routes.route('/fichas')
 def gestion_fichas():
     if "usuario" not in session:
         flash("Por favor, inicia sesión para acceder a la gestión de fichas.", "warning")
         return redirect(url_for('main_routes.login'))
-    fichas = cargar_fichas()
+    version, etag, modificado = _validadores_fichas()
+    no_modificada = _no_modificada(etag, modificado)
+    if no_modificada:
+        return no_modificada
+    listado = _parametros_listado()
+    #La tabla no depende del usuario: se reutiliza ya renderizada mientras no cambien los datos
+    clave = tuple(listado[k] for k in ("sort", "dir", "per_page", "page", "after", "before"))
+    tabla = cache_tabla_fichas.obtener(version, clave)
+    if tabla is None:
+        pagina = obtener_almacen().pagina(listado["sort"], listado["per_page"], listado["page"],
+                                          despues = listado["after"], antes = listado["before"],
+                                          descendente = listado["dir"] == "desc")
+        tabla = render_template('_tabla_fichas.html', fichas=pagina["fichas"], pagina=pagina, listado=listado)
+        cache_tabla_fichas.guardar(version, clave, tabla)
     username = session["usuario"]
     rol = session.get("rol", "editor")
-    return render_template('fichas.html', username=username, role=rol, fichas=fichas)
+    respuesta = make_response(render_template('fichas.html', username=username, role=rol, tabla=Markup(tabla)))
+    return _cabeceras_cache(respuesta, etag, modificado)
+
+@main_routes.route('/fichas/buscar')
+def buscar_fichas():
+    if "usuario" not in session:
+        flash("Por favor, inicia sesión para acceder a la gestión de fichas.", "warning")
+        return redirect(url_for('main_routes.login'))
+    termino = request.args.get("q", "").strip()
+    if not termino:
+        return render_template('buscar_fichas.html', q=termino, fichas=[], pagina=None)
+    #Solo se ordenan las coincidencias hasta la página pedida, no todas
+    pagina = obtener_almacen().buscar_pagina(termino, FICHAS_POR_PAGINA, request.args.get("page", 1, type=int))
+    return render_template('buscar_fichas.html', q=termino, fichas=pagina["fichas"], pagina=pagina)
+
+def _exportar(generador, mimetype, extension):
+    if "usuario" not in session:
+        flash("Por favor, inicia sesión para acceder a la gestión de fichas.", "warning")
+        return redirect(url_for('main_routes.login'))
+    def _entero(nombre):
+        try:
+            return int(request.args[nombre])
+        except (KeyError, ValueError):
+            return None
+    fichas = filtrar_fichas(obtener_almacen().fichas(), request.args.get("ciudad") or None, _entero("edad_min"), _entero("edad_max"))
+    user_logger.info(f"Usuario '{session['usuario']}' exportó las fichas en {extension} ({dict(request.args)}).")
+    #El cuerpo se genera mientras se envía: memoria constante y primer byte inmediato
+    return Response(stream_with_context(generador(fichas)), content_type=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=fichas.{extension}"})
+
+@main_routes.route('/fichas/export.csv')
+def exportar_fichas_csv():
+    return _exportar(exportar_csv, "text/csv; charset=utf-8", "csv")
+
+@main_routes.route('/fichas/export.ndjson')
+def exportar_fichas_ndjson():
+    return _exportar(exportar_ndjson, "application/x-ndjson; charset=utf-8", "ndjson")
+
+#Informes de filas rechazadas en las importaciones web
+INFORMES_DIR = os.path.join(LOG_DIR, "importaciones")
+
+@main_routes.route('/fichas/importar', methods=['GET', 'POST'])
+def importar_fichas_web():
+    if "usuario" not in session:
+        flash("Por favor, inicia sesión.", "warning")
+        return redirect(url_for('main_routes.login'))
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        formato = request.form.get('formato') or formato_por_nombre(archivo.filename if archivo else None)
+        if not archivo or not archivo.filename:
+            flash("Selecciona un archivo para importar.", "danger")
+            return render_template('importar_fichas.html')
+        if formato not in LECTORES_IMPORTACION:
+            flash("Formato no reconocido. Sube un archivo .csv o .ndjson.", "danger")
+            return render_template('importar_fichas.html')
+        os.makedirs(INFORMES_DIR, exist_ok=True)
+        nombre_informe = f"importacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.csv"
+        ruta_informe = os.path.join(INFORMES_DIR, nombre_informe)
+        #La subida se lee fila a fila; el informe se va escribiendo a disco
+        with open(ruta_informe, "w", encoding="utf-8", newline="") as destino:
+            informe = InformeErrores(destino, IMPORTACION_MAX_ERRORES_WEB)
+            resumen = importar_fichas(LECTORES_IMPORTACION[formato](abrir_texto(archivo.stream)), obtener_almacen(), informe)
+        if not resumen["rechazadas"]:
+            os.remove(ruta_informe)
+            nombre_informe = None
+        user_logger.info(f"Usuario '{session['usuario']}' importó {resumen['importadas']} fichas desde '{archivo.filename}' ({resumen['rechazadas']} rechazadas).")
+        flash(f"{resumen['importadas']} fichas importadas, {resumen['rechazadas']} filas rechazadas.", "success" if not resumen["rechazadas"] else "warning")
+        return render_template('importar_fichas.html', resumen=resumen, errores=informe.primeros, informe=nombre_informe)
+    return render_template('importar_fichas.html')
+
+@main_routes.route('/fichas/importar/informe/<nombre>')
+def informe_importacion(nombre):
+    if "usuario" not in session:
+        flash("Por favor, inicia sesión.", "warning")
+        return redirect(url_for('main_routes.login'))
+    return send_from_directory(INFORMES_DIR, nombre, as_attachment=True, mimetype="text/csv")
 
 @main_routes.route('/fichas/nueva', methods=['GET', 'POST'])
 def nueva_ficha():
@@ -255,9 +485,7 @@ def nueva_ficha():
             "fecha_creacion": datetime.now().isoformat(),
             "fecha_modificacion": None
         }
-        fichas = cargar_fichas()
-        fichas.append(nueva)
-        guardar_fichas(fichas)
+        obtener_almacen().crear(nueva) #Solo se añade una línea al journal
         flash(f"Nueva ficha de {nombre} creada correctamente.", "success")
         user_logger.info(f"Usuario '{session['usuario']}' creó una nueva ficha: {nueva}.")
         return redirect(url_for('main_routes.gestion_fichas'))
@@ -268,8 +496,12 @@ def editar_ficha(id):
     if "usuario" not in session:
         flash("Por favor, inicia sesión para acceder.", "warning")
         return redirect(url_for('main_routes.login'))
-    fichas = cargar_fichas()
-    ficha = next((f for f in fichas if f.get("id") == id), None)
+    if request.method == 'GET':
+        _, etag, modificado = _validadores_fichas()
+        no_modificada = _no_modificada(etag, modificado)
+        if no_modificada:
+            return no_modificada
+    ficha = obtener_almacen().obtener(id)
     if not ficha:
         flash("Ficha no encontrada.", "danger")
         return redirect(url_for('main_routes.gestion_fichas'))
@@ -282,25 +514,23 @@ def editar_ficha(id):
             return render_template('editar_ficha.html', ficha=ficha)
         ficha['ciudad'] = request.form['ciudad'].strip()
         ficha["fecha_modificacion"] = datetime.now().isoformat()
-        guardar_fichas(fichas)
+        obtener_almacen().actualizar(ficha)
         flash(f"Ficha de {ficha['nombre']} actualizada correctamente.", "success")
         user_logger.info(f"Usuario '{session['usuario']}' editó la ficha: {ficha}.")
         return redirect(url_for('main_routes.gestion_fichas'))
-    return render_template('editar_ficha.html', ficha=ficha)
+    return _cabeceras_cache(make_response(render_template('editar_ficha.html', ficha=ficha)), etag, modificado)
 
 @main_routes.route('/fichas/eliminar/<id>', methods=['GET', 'POST'])
 def eliminar_ficha(id):
     if "usuario" not in session:
         flash("Por favor, inicia sesión para acceder.", "warning")
         return redirect(url_for('main_routes.login'))
-    fichas = cargar_fichas()
-    ficha = next((f for f in fichas if f.get("id") == id), None)
+    ficha = obtener_almacen().obtener(id)
     if not ficha:
         flash("Ficha no encontrada.", "danger")
         return redirect(url_for('main_routes.gestion_fichas'))
     if request.method == 'POST':
-        fichas.remove(ficha)
-        guardar_fichas(fichas)
+        obtener_almacen().eliminar(id)
         flash(f"Ficha de {ficha['nombre']} eliminada correctamente.", "success")
         user_logger.info(f"Usuario '{session['usuario']}' eliminó la ficha: {ficha}.")
         return redirect(url_for('main_routes.gestion_fichas'))
@@ -0,0 +1,83 @@
+import logging, signal, sys, threading, time
+from gestion_fichas.almacen import obtener_almacen
+from gestion_fichas.usuarios import calentar_usuarios
+from gestion_fichas.hashing import calentar_hashing
+from gestion_fichas.logger_config import app_logger
+from config import SERVIDOR_HOST, SERVIDOR_PUERTO, SERVIDOR_HILOS, SERVIDOR_CONEXIONES_MAX, SERVIDOR_BACKLOG
+
+#=== Servidor de producción ===
+#Antes de abrir el puerto se deja todo caliente (fichas e índices, usuarios, plantillas, pool de
+#hashing), así la primera petición no paga la carga en frío. /salud responde 503 hasta entonces.
+#create_app() lanza ese calentamiento en segundo plano, así /salud acaba en 200 con cualquier
+#servidor WSGI (flask run, gunicorn app:app...); app.py en producción espera a que termine.
+#Se usa waitress si está instalado; si no, el servidor con hilos de werkzeug (sin debug ni recarga).
+
+def calentar(app):
+    """Carga datos, índices y plantillas y marca la app como lista. Devuelve los tiempos de cada paso."""
+    pasos = {}
+    def paso(nombre, funcion):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        pasos[nombre] = round(time.perf_counter() - inicio, 3)
+        return resultado
+    fichas = paso("fichas", lambda: obtener_almacen().calentar())
+    usuarios = paso("usuarios", calentar_usuarios)
+    plantillas = paso("plantillas", lambda: [app.jinja_env.get_template(nombre) for nombre in app.jinja_env.list_templates()])
+    paso("rutas", lambda: app.url_map.bind(SERVIDOR_HOST).match("/"))
+    trabajadores = paso("hashing", calentar_hashing)
+    app.config["ARRANQUE"] = {"fichas": fichas, "usuarios": usuarios, "plantillas": len(plantillas),
+                              "trabajadores_hash": trabajadores, "segundos": pasos}
+    app.config["LISTO"] = True
+    app_logger.info(f"Aplicación lista: {fichas} fichas, {usuarios} usuarios, {len(plantillas)} plantillas "
+                    f"({sum(pasos.values()):.2f} s: {pasos}).")
+    return pasos
+
+def calentar_en_segundo_plano(app):
+    #Lanza calentar(app) en un hilo (una sola vez por app) y lo devuelve. Si falla, /salud sigue en 503 con el error.
+    hilo = app.extensions.get("calentamiento")
+    if hilo is None:
+        def _calentar():
+            try:
+                calentar(app)
+            except Exception as e:
+                app.config["ERROR_ARRANQUE"] = str(e)
+                app_logger.exception(f"Error calentando la aplicación: {e}")
+        hilo = threading.Thread(target=_calentar, name="calentar", daemon=True)
+        app.extensions["calentamiento"] = hilo
+        hilo.start()
+    return hilo
+
+def esperar_lista(app):
+    #Espera al calentamiento lanzado por create_app() (o lo hace ahora si no se lanzó). True si la app quedó lista.
+    calentar_en_segundo_plano(app).join()
+    return bool(app.config.get("LISTO"))
+
+def _salir_con_sigterm():
+    #Salida normal con SIGTERM: se cierran el pool de hashing, las sesiones y la cola de logs (atexit)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+def servir(app, host = SERVIDOR_HOST, puerto = SERVIDOR_PUERTO, hilos = SERVIDOR_HILOS,
+           conexiones_max = SERVIDOR_CONEXIONES_MAX, backlog = SERVIDOR_BACKLOG):
+    _salir_con_sigterm()
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    if serve is not None:
+        app_logger.info(f"waitress en {host}:{puerto} ({hilos} hilos, {conexiones_max} conexiones, backlog {backlog}).")
+        #Sin el "Serving on..." de waitress (ya está la línea de arriba); sus avisos (p.ej. cola llena) se siguen viendo
+        logging.getLogger("waitress").setLevel(logging.WARNING)
+        serve(app, host=host, port=puerto, threads=hilos, connection_limit=conexiones_max, backlog=backlog)
+        return
+    from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+    class _Manejador(WSGIRequestHandler):
+        #Keep-alive y sin una línea por petición en la consola (los logs de la app ya lo registran)
+        protocol_version = "HTTP/1.1"
+        def log_request(self, *args, **kwargs):
+            pass
+    class _Servidor(ThreadedWSGIServer):
+        request_queue_size = backlog
+    app_logger.warning(f"waitress no está instalado: servidor con hilos de werkzeug en {host}:{puerto} "
+                       f"(un hilo por conexión; backlog {backlog}, sin límite de hilos ni de conexiones).")
+    _Servidor(host, puerto, app, handler=_Manejador).serve_forever()